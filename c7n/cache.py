@@ -16,13 +16,36 @@ multiple policies on the same resource type.
 """
 
 import cPickle
-
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
 import os
 import logging
+import sqlite3
+import threading
 import time
 
+from c7n.registry import PluginRegistry
+from c7n.utils import DateTimeEncoder
+
 log = logging.getLogger('custodian.cache')
 
+SQLITE_HEADER = "SQLite format 3\x00"
+
+# Default size of the in process memory tier
+DEFAULT_MEMORY_SIZE = 64 * 1024 * 1024
+
+cache_backends = PluginRegistry('cache')
+
+
+def encode_key(key):
+    """Serialize a cache key, the same for any equal key.
+
+    Pickles of equal dicts differ with their insertion order, keys are
+    serialized as sorted json instead, as query planner keys are.
+    """
+    return json.dumps(key, sort_keys=True, cls=DateTimeEncoder)
+
 
 def factory(config):
     if not config:
@@ -32,9 +55,23 @@ def factory(config):
         log.debug("Disabling cache")
         return NullCache(config)
 
-    return FileCacheManager(config)
+    # Synthetic resources must never be read back by a real run.
+    if getattr(config, 'fake_cloud', None):
+        log.debug("Disabling cache for fake cloud")
+        return NullCache(config)
+
+    backend_type = getattr(config, 'cache_backend', None) or 'sqlite'
+    backend = cache_backends.get(backend_type)
+    if backend is None:
+        raise ValueError("No such cache backend %s" % backend_type)
+
+    memory_size = getattr(config, 'cache_memory_size', DEFAULT_MEMORY_SIZE)
+    if backend is MemoryCache or not memory_size:
+        return backend(config)
+    return TieredCache(config, MemoryCache(config), backend(config))
 
 
+@cache_backends.register('null')
 class NullCache(object):
 
     def __init__(self, config):
@@ -46,10 +83,14 @@ class NullCache(object):
     def get(self, key):
         pass
 
+    def get_entry(self, key):
+        pass
+
     def save(self, key, data):
         pass
 
 
+@cache_backends.register('file')
 class FileCacheManager(object):
 
     def __init__(self, config):
@@ -65,6 +106,14 @@ class FileCacheManager(object):
         k = cPickle.dumps(key)
         return self.data.get(k)
 
+    def get_entry(self, key):
+        """Return a key's value and creation time, or None."""
+        value = self.get(key)
+        if value is None:
+            return None
+        # Entries share the file's age.
+        return value, os.stat(self.cache_path).st_mtime
+
     def load(self):
         if self.data:
             return True
@@ -96,3 +145,257 @@ class FileCacheManager(object):
                 except Exception as e:
                     log.warning("Could not create directory: %s err: %s" % (
                         directory, e))
+
+
+@cache_backends.register('sqlite')
+class SqlKvCache(object):
+    """Sqlite backed cache storing each key as its own entry.
+
+    Entries are loaded lazily per key and expire individually after
+    the cache period, expired ones are removed on load. A connection is
+    opened per operation, and sqlite's own locking lets parallel policy
+    executions (threads or processes) share a cache file.
+    """
+
+    create_table = """
+    create table if not exists c7n_cache (
+        key blob primary key,
+        value blob,
+        create_date real
+    )
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_period = config.cache_period
+        self.cache_path = os.path.abspath(
+            os.path.expanduser(
+                os.path.expandvars(
+                    config.cache)))
+        self._initialized = False
+        self._expired = False
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            directory = os.path.dirname(self.cache_path)
+            if not os.path.exists(directory):
+                log.info('Generating Cache directory: %s.' % directory)
+                os.makedirs(directory)
+            self._check_format()
+        conn = sqlite3.connect(self.cache_path, timeout=30)
+        try:
+            conn.text_factory = str
+            if not self._initialized:
+                conn.execute(self.create_table)
+                conn.commit()
+                self._initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    def _check_format(self):
+        # Prior releases used a single pickle file at the same path, any
+        # other file found there is left alone, and a separate one used.
+        if not os.path.isfile(self.cache_path):
+            return
+        with open(self.cache_path, 'rb') as fh:
+            header = fh.read(len(SQLITE_HEADER))
+        if header and header != SQLITE_HEADER:
+            path = "%s.sqlite" % self.cache_path
+            log.warning(
+                "Cache file %s isn't an sqlite cache, using %s" % (
+                    self.cache_path, path))
+            self.cache_path = path
+
+    def load(self):
+        try:
+            if not self._expired:
+                self.expire()
+                self._expired = True
+        except (sqlite3.Error, OSError, IOError) as e:
+            log.warning("Could not open cache %s err: %s" % (
+                self.cache_path, e))
+            return False
+        return True
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        if entry is not None:
+            return entry[0]
+
+    def get_entry(self, key):
+        """Return a key's value and creation time, or None."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'select value, create_date from c7n_cache where key = ?',
+                    (encode_key(key),)).fetchone()
+        except (sqlite3.Error, OSError, IOError) as e:
+            log.warning("Could not read cache %s err: %s" % (
+                self.cache_path, e))
+            return None
+        if row is None:
+            return None
+        value, create_date = row
+        if time.time() - create_date > self.cache_period * 60:
+            return None
+        return cPickle.loads(str(value)), create_date
+
+    def save(self, key, data):
+        try:
+            with self._connect() as conn:
+                with conn:
+                    conn.execute(
+                        'replace into c7n_cache (key, value, create_date) '
+                        'values (?, ?, ?)',
+                        (encode_key(key),
+                         sqlite3.Binary(cPickle.dumps(data, protocol=2)),
+                         time.time()))
+        except Exception as e:
+            log.warning("Could not save cache %s err: %s" % (
+                self.cache_path, e))
+
+    def expire(self):
+        """Remove all expired entries."""
+        with self._connect() as conn:
+            with conn:
+                conn.execute(
+                    'delete from c7n_cache where create_date < ?',
+                    (time.time() - self.cache_period * 60,))
+
+
+class LRUStore(object):
+    """A bounded store of serialized values, evicting least recently used.
+
+    Size is accounted by serialized bytes.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.data = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, k):
+        with self.lock:
+            entry = self.data.pop(k, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.data[k] = entry
+            return entry
+
+    def set(self, k, value, create_date):
+        size = len(value)
+        if size > self.max_size:
+            return False
+        with self.lock:
+            self._remove(k)
+            while self.data and self.size + size > self.max_size:
+                self._remove(next(iter(self.data)))
+                self.evictions += 1
+            self.data[k] = (value, create_date)
+            self.size += size
+        return True
+
+    def discard(self, k):
+        with self.lock:
+            self._remove(k)
+
+    def _remove(self, k):
+        entry = self.data.pop(k, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def stats(self):
+        return {
+            'entries': len(self.data),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions}
+
+
+# Memory stores live for the life of the process, so they are shared
+# by the resource managers of a run, and across invocations in long
+# lived processes (warm lambda containers, daemonized runners).
+_memory_stores = {}
+_memory_lock = threading.Lock()
+
+
+@cache_backends.register('memory')
+class MemoryCache(object):
+    """In process bounded lru cache."""
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_period = config.cache_period
+        max_size = getattr(
+            config, 'cache_memory_size', None) or DEFAULT_MEMORY_SIZE
+        with _memory_lock:
+            self.store = _memory_stores.setdefault(
+                (config.cache, max_size), LRUStore(max_size))
+
+    def load(self):
+        return True
+
+    def get(self, key):
+        k = encode_key(key)
+        entry = self.store.get(k)
+        if entry is None:
+            return None
+        value, create_date = entry
+        if time.time() - create_date > self.cache_period * 60:
+            self.store.discard(k)
+            return None
+        return cPickle.loads(value)
+
+    def save(self, key, data, create_date=None):
+        try:
+            return self.store.set(
+                encode_key(key),
+                cPickle.dumps(data, protocol=2),
+                create_date or time.time())
+        except Exception as e:
+            log.warning("Could not save memory cache err: %s" % e)
+            return False
+
+    def stats(self):
+        return self.store.stats()
+
+
+class TieredCache(object):
+    """Memory tier in front of a persistent cache backend."""
+
+    def __init__(self, config, memory, persistent):
+        self.config = config
+        self.memory = memory
+        self.persistent = persistent
+
+    def load(self):
+        # The memory tier is always available.
+        self.persistent.load()
+        return True
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        entry = self.persistent.get_entry(key)
+        if entry is None:
+            return None
+        # Promoted entries keep their age, so they expire as persisted.
+        value, create_date = entry
+        self.memory.save(key, value, create_date)
+        return value
+
+    def save(self, key, data):
+        self.memory.save(key, data)
+        self.persistent.save(key, data)
+
+    def stats(self):
+        return self.memory.stats()
@@ -32,6 +32,7 @@ try:
 except ImportError:
     setproctitle = lambda t: None
 
+from c7n.cache import cache_backends
 from c7n.commands import schema_completer
 from c7n.utils import get_account_id_from_sts
 
@@ -93,6 +94,13 @@ def _default_options(p, blacklist=""):
         p.add_argument(
             "--cache-period", default=15, type=int,
             help="Cache validity in minutes (default %(default)i)")
+        p.add_argument(
+            "--cache-backend", default="sqlite",
+            choices=sorted(cache_backends.keys()),
+            help="Persistent cache backend (default %(default)s)")
+        p.add_argument(
+            "--cache-metrics", action="store_true", default=False,
+            help="Persist metrics filter series in the cache")
     else:
         p.add_argument("--cache", default=None, help=argparse.SUPPRESS)
 
@@ -116,6 +124,10 @@ def _default_region(options):
 
 
 def _default_account_id(options):
+    if getattr(options, 'fake_cloud', None):
+        from c7n.fakecloud import get_fake_cloud
+        options.account_id = get_fake_cloud(options.fake_cloud).account_id
+        return
     profile = getattr(options, 'profile', None)
     try:
         import boto3
@@ -301,6 +313,46 @@ def setup_parser():
         "-m", "--metrics-enabled",
         default=False, action="store_true",
         help="Emit metrics to CloudWatch Metrics")
+    run.add_argument(
+        "-w", "--workers", default=1, type=int,
+        help="Number of policies to execute concurrently (default %(default)i)")
+    run.add_argument(
+        "--executor", default="thread", choices=['thread', 'process'],
+        help="Execute concurrent policies on threads or processes "
+             "(default %(default)s)")
+    run.add_argument(
+        "--service-concurrency", default=None, type=int,
+        help="Max concurrent policies against a single service "
+             "(default as many as its api rate limiter allows workers)")
+    run.add_argument(
+        "--config-snapshot", default=None,
+        help="Query resources from an aws config snapshot, a local or S3 "
+             "path of a snapshot file or directory")
+    run.add_argument(
+        "--inventory", default=None,
+        help="Directory to keep resource inventories in, refreshing them "
+             "incrementally from change events")
+    run.add_argument(
+        "--inventory-events", default=None,
+        help="File of change events to update inventories from, instead "
+             "of looking up CloudTrail")
+    run.add_argument(
+        "--inventory-refresh", default=24, type=float,
+        help="Hours after which inventories are fully refreshed "
+             "(default %(default)i)")
+    run.add_argument(
+        "--profile-policies", default=False, action="store_true",
+        help="Record filter, action and api call timings and counts to "
+             "profile.json in each policy's output directory")
+    run.add_argument(
+        "--snapshot", default=None,
+        help="Evaluate policies against resources from a snapshot file, "
+             "or a previous run's output directory or S3 URL, with no "
+             "api calls")
+    run.add_argument(
+        "--fake-cloud", default=None,
+        help="Run against a local fake cloud generated from a fleet spec "
+             "file, for benchmarking")
 
     return parser
 
@@ -324,6 +376,11 @@ def main():
     _default_region(options)
     _default_account_id(options)
 
+    # Snapshot resources aren't live, don't act on them.
+    if getattr(options, 'snapshot', None) and not options.dryrun:
+        log.info("running with a snapshot, actions are not executed")
+        options.dryrun = True
+
     try:
         command = options.command
         if not callable(command):
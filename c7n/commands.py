@@ -26,12 +26,15 @@ import time
 
 import yaml
 
+from c7n.inventory import Inventory
+from c7n.planner import QueryPlanner
 from c7n.policy import Policy, load as policy_load
 from c7n.reports import report as do_report
+from c7n.scheduler import PolicyScheduler
 from c7n.utils import Bag, dumps
 from c7n.manager import resources
 from c7n.resources import load_resources
-from c7n import schema
+from c7n import ratelimit, schema
 
 
 log = logging.getLogger('custodian.commands')
@@ -41,8 +44,6 @@ def policy_command(f):
 
     @wraps(f)
     def _load_policies(options):
-        load_resources()
-
         policies = []
         all_policies = []
         errors = 0
@@ -173,16 +174,43 @@ def validate(options):
 @policy_command
 def run(options, policies):
     exit_code = 0
-    for policy in policies:
-        try:
-            policy()
-        except Exception:
+    planner = QueryPlanner()
+    planner.plan(policies)
+    if getattr(options, 'inventory', None):
+        inventory = Inventory(
+            options.inventory, options.inventory_events,
+            options.inventory_refresh * 60 * 60)
+        for p in policies:
+            p.ctx.inventory = inventory
+    workers = getattr(options, 'workers', 1) or 1
+    if workers > 1 and len(policies) > 1:
+        scheduler = PolicyScheduler(
+            workers, getattr(options, 'executor', 'thread'),
+            getattr(options, 'service_concurrency', None),
+            options.debug)
+        if scheduler.run(policies):
             exit_code = 2
-            if options.debug:
-                raise
-            log.exception(
-                "Error while executing policy %s, continuing" % (
-                    policy.name))
+    else:
+        for policy in policies:
+            try:
+                policy()
+            except Exception:
+                exit_code = 2
+                if options.debug:
+                    raise
+                log.exception(
+                    "Error while executing policy %s, continuing" % (
+                        policy.name))
+    log.debug(
+        "Query planner fetched %d resource sets, shared %d",
+        planner.fetches, planner.hits)
+    if getattr(options, 'inventory', None):
+        log.debug(
+            "Inventory refreshed %d resource sets, updated %d",
+            inventory.refreshes, inventory.updates)
+    for key, state in sorted(ratelimit.limiters.get_state().items()):
+        log.debug("Api rate limit %s %s", ":".join(map(str, key)), state)
+    planner.clear()
     if exit_code != 0:
         sys.exit(exit_code)
 
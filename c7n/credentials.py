@@ -24,10 +24,12 @@ from c7n.utils import get_retry
 
 class SessionFactory(object):
 
-    def __init__(self, region, profile=None, assume_role=None):
+    def __init__(self, region, profile=None, assume_role=None,
+                 account_id=None):
         self.region = region
         self.profile = profile
         self.assume_role = assume_role
+        self.account_id = account_id
 
     def __call__(self, assume=True, region=None):
         if self.assume_role and assume:
@@ -11,9 +11,11 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
 import time
 
 from c7n.output import FSOutput, MetricsOutput, CloudWatchLogOutput
+from c7n.profiler import PolicyProfile
 
 
 class ExecutionContext(object):
@@ -25,6 +27,14 @@ class ExecutionContext(object):
         self.session_factory = session_factory
         self.cloudwatch_logs = None
         self.start_time = None
+        # Run level query planner, see c7n.planner
+        self.planner = None
+        # Incremental resource inventory, see c7n.inventory
+        self.inventory = None
+
+        self.profile = None
+        if getattr(options, 'profile_policies', False):
+            self.profile = PolicyProfile(policy)
 
         metrics_enabled = getattr(options, 'metrics_enabled', None)
         factory = MetricsOutput.select(metrics_enabled)
@@ -51,10 +61,17 @@ class ExecutionContext(object):
             self.output.__enter__()
         if self.cloudwatch_logs:
             self.cloudwatch_logs.__enter__()
+        if self.profile:
+            self.profile.__enter__()
         self.start_time = time.time()
         return self
 
     def __exit__(self, exc_type=None, exc_value=None, exc_traceback=None):
+        if self.profile:
+            self.profile.__exit__(exc_type, exc_value, exc_traceback)
+            self.profile.put_metrics(self.metrics)
+            if self.log_dir:
+                self.profile.write(os.path.join(self.log_dir, 'profile.json'))
         self.metrics.flush()
         if self.cloudwatch_logs:
             self.cloudwatch_logs.__exit__(exc_type, exc_value, exc_traceback)
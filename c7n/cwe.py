@@ -11,8 +11,21 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from fnmatch import fnmatch
+
 import jmespath
 
+# Id patterns of the ec2 resource types sharing the ec2 tagging api.
+EC2_RESOURCE_IDS = {
+    'ec2': 'i-*',
+    'ebs': 'vol-*',
+    'ebs-snapshot': 'snap-*',
+    'ami': 'ami-*',
+    'security-group': 'sg-*',
+    'subnet': 'subnet-*',
+    'vpc': 'vpc-*',
+    'eni': 'eni-*'}
+
 
 class CloudWatchEvents(object):
     """A mapping of events to resource types."""
@@ -26,52 +39,265 @@ class CloudWatchEvents(object):
     # values in their config, but keep the common case simple.
 
     trail_events = {
-        # event source, resource type as keys, mapping to api call and
-        # jmespath expression
+        # event name as keys, mapping to a jmespath expression for the
+        # resource ids, the event source and the custodian resource type
         'CreateAutoScalingGroup': {
             'ids': 'requestParameters.autoScalingGroupName',
-            'source': 'autoscaling.amazonaws.com'},
+            'source': 'autoscaling.amazonaws.com',
+            'resource': 'asg'},
 
         'UpdateAutoScalingGroup': {
             'ids': 'requestParameters.autoScalingGroupName',
-            'source': 'autoscaling.amazonaws.com'},
+            'source': 'autoscaling.amazonaws.com',
+            'resource': 'asg'},
 
         'CreateBucket': {
             'ids': 'requestParameters.bucketName',
-            'source': 's3.amazonaws.com'},
+            'source': 's3.amazonaws.com',
+            'resource': 's3'},
 
         'CreateCluster': {
             'ids': 'requestParameters.clusterIdentifier',
-            'source': 'redshift.amazonaws.com'},
+            'source': 'redshift.amazonaws.com',
+            'resource': 'redshift'},
 
         'CreateLoadBalancer': {
             'ids': 'requestParameters.loadBalancerName',
-            'source': 'elasticloadbalancing.amazonaws.com'},
+            'source': 'elasticloadbalancing.amazonaws.com',
+            'resource': 'elb'},
 
         'CreateLoadBalancerPolicy': {
             'ids': 'requestParameters.loadBalancerName',
-            'source': 'elasticloadbalancing.amazonaws.com'},
+            'source': 'elasticloadbalancing.amazonaws.com',
+            'resource': 'elb'},
 
         'CreateDBInstance': {
             'ids': 'requestParameters.dBInstanceIdentifier',
-            'source': 'rds.amazonaws.com'},
+            'source': 'rds.amazonaws.com',
+            'resource': 'rds'},
 
         'CreateVolume': {
             'ids': 'responseElements.volumeId',
-            'source': 'ec2.amazonaws.com'},
+            'source': 'ec2.amazonaws.com',
+            'resource': 'ebs'},
 
         'SetLoadBalancerPoliciesOfListener': {
             'ids': 'requestParameters.loadBalancerName',
-            'source': 'elasticloadbalancing.amazonaws.com'},
+            'source': 'elasticloadbalancing.amazonaws.com',
+            'resource': 'elb'},
 
         'RunInstances': {
             'ids': 'responseElements.instancesSet.items[].instanceId',
-            'source': 'ec2.amazonaws.com'}}
+            'source': 'ec2.amazonaws.com',
+            'resource': 'ec2'}}
+
+    # Events modifying, tagging or deleting resources, used to keep
+    # resource inventories current, see c7n.inventory. Unlike the
+    # shortcuts above, these are matched on event source as well as
+    # name, may apply to several resource types by resource id pattern,
+    # and ids of deleted resources are marked as such. Arn ids are
+    # matched as arns, and mapped to the name following the last colon.
+    change_events = [
+        {'event': 'CreateTags',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.resourcesSet.items[].resourceId',
+         'resources': EC2_RESOURCE_IDS},
+        {'event': 'DeleteTags',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.resourcesSet.items[].resourceId',
+         'resources': EC2_RESOURCE_IDS},
+        {'event': 'StartInstances',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.instancesSet.items[].instanceId',
+         'resource': 'ec2'},
+        {'event': 'StopInstances',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.instancesSet.items[].instanceId',
+         'resource': 'ec2'},
+        # Terminated instances are still described for a while.
+        {'event': 'TerminateInstances',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.instancesSet.items[].instanceId',
+         'resource': 'ec2'},
+        {'event': 'ModifyInstanceAttribute',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.instanceId',
+         'resource': 'ec2'},
+        {'event': 'AttachVolume',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.volumeId',
+         'resource': 'ebs'},
+        {'event': 'DetachVolume',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.volumeId',
+         'resource': 'ebs'},
+        {'event': 'DeleteVolume',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.volumeId',
+         'resource': 'ebs',
+         'delete': True},
+        {'event': 'CreateSnapshot',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'responseElements.snapshotId',
+         'resource': 'ebs-snapshot'},
+        {'event': 'DeleteSnapshot',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.snapshotId',
+         'resource': 'ebs-snapshot',
+         'delete': True},
+        {'event': 'DeregisterImage',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.imageId',
+         'resource': 'ami',
+         'delete': True},
+        {'event': 'AuthorizeSecurityGroupIngress',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.groupId',
+         'resource': 'security-group'},
+        {'event': 'RevokeSecurityGroupIngress',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.groupId',
+         'resource': 'security-group'},
+        {'event': 'DeleteSecurityGroup',
+         'source': 'ec2.amazonaws.com',
+         'ids': 'requestParameters.groupId',
+         'resource': 'security-group',
+         'delete': True},
+        {'event': 'CreateOrUpdateTags',
+         'source': 'autoscaling.amazonaws.com',
+         'ids': 'requestParameters.tags[].resourceId',
+         'resource': 'asg'},
+        {'event': 'DeleteTags',
+         'source': 'autoscaling.amazonaws.com',
+         'ids': 'requestParameters.tags[].resourceId',
+         'resource': 'asg'},
+        {'event': 'SuspendProcesses',
+         'source': 'autoscaling.amazonaws.com',
+         'ids': 'requestParameters.autoScalingGroupName',
+         'resource': 'asg'},
+        {'event': 'ResumeProcesses',
+         'source': 'autoscaling.amazonaws.com',
+         'ids': 'requestParameters.autoScalingGroupName',
+         'resource': 'asg'},
+        {'event': 'DeleteAutoScalingGroup',
+         'source': 'autoscaling.amazonaws.com',
+         'ids': 'requestParameters.autoScalingGroupName',
+         'resource': 'asg',
+         'delete': True},
+        {'event': 'DeleteLaunchConfiguration',
+         'source': 'autoscaling.amazonaws.com',
+         'ids': 'requestParameters.launchConfigurationName',
+         'resource': 'launch-config',
+         'delete': True},
+        {'event': 'PutBucketTagging',
+         'source': 's3.amazonaws.com',
+         'ids': 'requestParameters.bucketName',
+         'resource': 's3'},
+        {'event': 'DeleteBucketTagging',
+         'source': 's3.amazonaws.com',
+         'ids': 'requestParameters.bucketName',
+         'resource': 's3'},
+        {'event': 'PutBucketPolicy',
+         'source': 's3.amazonaws.com',
+         'ids': 'requestParameters.bucketName',
+         'resource': 's3'},
+        {'event': 'DeleteBucketPolicy',
+         'source': 's3.amazonaws.com',
+         'ids': 'requestParameters.bucketName',
+         'resource': 's3'},
+        {'event': 'DeleteBucket',
+         'source': 's3.amazonaws.com',
+         'ids': 'requestParameters.bucketName',
+         'resource': 's3',
+         'delete': True},
+        {'event': 'ModifyDBInstance',
+         'source': 'rds.amazonaws.com',
+         'ids': 'requestParameters.dBInstanceIdentifier',
+         'resource': 'rds'},
+        {'event': 'AddTagsToResource',
+         'source': 'rds.amazonaws.com',
+         'ids': 'requestParameters.resourceName',
+         'resources': {'rds': 'arn:aws:rds:*:db:*'},
+         'arn': True},
+        {'event': 'RemoveTagsFromResource',
+         'source': 'rds.amazonaws.com',
+         'ids': 'requestParameters.resourceName',
+         'resources': {'rds': 'arn:aws:rds:*:db:*'},
+         'arn': True},
+        {'event': 'DeleteDBInstance',
+         'source': 'rds.amazonaws.com',
+         'ids': 'requestParameters.dBInstanceIdentifier',
+         'resource': 'rds',
+         'delete': True},
+        {'event': 'AddTags',
+         'source': 'elasticloadbalancing.amazonaws.com',
+         'ids': 'requestParameters.loadBalancerNames[]',
+         'resource': 'elb'},
+        {'event': 'RemoveTags',
+         'source': 'elasticloadbalancing.amazonaws.com',
+         'ids': 'requestParameters.loadBalancerNames[]',
+         'resource': 'elb'},
+        {'event': 'DeleteLoadBalancer',
+         'source': 'elasticloadbalancing.amazonaws.com',
+         'ids': 'requestParameters.loadBalancerName',
+         'resource': 'elb',
+         'delete': True},
+        {'event': 'DeleteCluster',
+         'source': 'redshift.amazonaws.com',
+         'ids': 'requestParameters.clusterIdentifier',
+         'resource': 'redshift',
+         'delete': True}]
 
     @classmethod
     def get(cls, event_name):
         return cls.trail_events.get(event_name)
 
+    @classmethod
+    def get_resource_events(cls, resource_type):
+        """Names of the events mapped to the given resource type."""
+        return sorted([k for k, v in cls.trail_events.items()
+                       if v.get('resource') == resource_type])
+
+    @classmethod
+    def get_change_events(cls, resource_type):
+        """Names of the events creating, changing or deleting resources
+        of the given type.
+        """
+        names = set(cls.get_resource_events(resource_type))
+        for e in cls.change_events:
+            if resource_type == e.get('resource') or (
+                    resource_type in e.get('resources', ())):
+                names.add(e['event'])
+        return sorted(names)
+
+    @classmethod
+    def get_changes(cls, event, resource_type):
+        """Ids of the resources of the given type an event changes.
+
+        Returns the ids and whether they were deleted, or None if the
+        event doesn't apply to the resource type.
+        """
+        detail = event.get('detail', {})
+        info = cls.match(event)
+        if info and info.get('resource') == resource_type:
+            return _get_ids(info['ids'].search(event)), False
+        for e in cls.change_events:
+            if (e['event'] != detail.get('eventName') or
+                    e['source'] != detail.get('eventSource')):
+                continue
+            ids = _get_ids(jmespath.search(e['ids'], detail))
+            if 'resources' in e:
+                pattern = e['resources'].get(resource_type)
+                if pattern is None:
+                    continue
+                ids = [i for i in ids if fnmatch(i, pattern)]
+            elif e['resource'] != resource_type:
+                continue
+            if e.get('arn'):
+                ids = [i.rsplit(':', 1)[-1] for i in ids]
+            return ids, e.get('delete', False)
+        return None
+
     @classmethod
     def match(cls, event):
         """Match a given cwe event as cloudtrail with an api call
@@ -139,3 +365,9 @@ class CloudWatchEvents(object):
             resource_ids = [resource_ids]
 
         return filter(None, resource_ids)
+
+
+def _get_ids(ids):
+    if not isinstance(ids, list):
+        ids = [ids]
+    return [i for i in ids if i]
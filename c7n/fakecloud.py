@@ -0,0 +1,963 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A local fake cloud, for benchmarking policy execution.
+
+Serves a generated fleet of ec2 instances, volumes, snapshots, images,
+security groups, subnets and vpcs, autoscaling groups and launch
+configurations, and s3 buckets and objects, of any size, along with
+cloudwatch metric statistics. Tags can be added and removed, and
+instances stopped, started and terminated. Other operations answer
+with an empty response.
+
+Calls go through botocore as usual, parameter validation, retries and
+event handlers included, only the http request is answered locally.
+Each call can be delayed, throttled at random, or throttled by a per
+service token bucket, and listings are paginated at a configurable
+page size, so worker counts, retries and rate limiting can be tuned
+without an aws account::
+
+  custodian run -s out --fake-cloud fleet.yml policy.yml
+
+A fleet spec, all keys optional, operation settings override the
+global ones::
+
+  seed: 0
+  latency: 0.05         # seconds per call
+  jitter: 0.02          # up to this many seconds more, at random
+  throttle: 0.01        # fraction of calls throttled
+  page_size: 1000
+  rate_limits:
+    ec2: {rate: 20, burst: 100}
+  operations:
+    DescribeSnapshots: {latency: 0.5, page_size: 200}
+  fleet:
+    instances: 10000
+    snapshots: 50000
+"""
+import copy
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from fnmatch import fnmatch
+import logging
+import random
+import threading
+import time
+import uuid
+
+from boto3 import Session
+from botocore import xform_name
+from dateutil.parser import parse as parse_date
+from dateutil.tz import tzutc
+import jmespath
+import yaml
+
+from c7n.credentials import SessionFactory
+from c7n.version import version
+
+log = logging.getLogger('custodian.fakecloud')
+
+DEFAULT_SPEC = {
+    'account_id': '123456789012',
+    'seed': 0,
+    'latency': 0.0,
+    'jitter': 0.0,
+    'throttle': 0.0,
+    'page_size': 1000,
+    'rate_limits': {},
+    'operations': {
+        # As the services' own default page sizes.
+        'DescribeAutoScalingGroups': {'page_size': 50},
+        'DescribeLaunchConfigurations': {'page_size': 50}},
+    'fleet': {
+        'instances': 1000,
+        'volumes': 1000,
+        'snapshots': 1000,
+        'images': 50,
+        'security_groups': 50,
+        'subnets': 12,
+        'vpcs': 3,
+        'auto_scaling_groups': 100,
+        'launch_configurations': 100,
+        'buckets': 20,
+        'objects': 1000}}
+
+CALL_SETTINGS = ('latency', 'jitter', 'throttle', 'page_size')
+
+# Error code and http status of each service's throttling.
+THROTTLE_ERRORS = {
+    'ec2': ('RequestLimitExceeded', 503),
+    's3': ('SlowDown', 503)}
+DEFAULT_THROTTLE_ERROR = ('Throttling', 400)
+
+# Describe filters, as the paths of the resource values they match.
+FILTER_PATHS = {
+    'attachment.instance-id': 'Attachments[].InstanceId',
+    'availability-zone': 'AvailabilityZone || Placement.AvailabilityZone',
+    'group-id': 'GroupId',
+    'image-id': 'ImageId',
+    'instance-id': 'InstanceId',
+    'instance-state-name': 'State.Name',
+    'instance-type': 'InstanceType',
+    'owner-id': 'OwnerId',
+    'snapshot-id': 'SnapshotId',
+    'state': 'State',
+    'status': 'State',
+    'subnet-id': 'SubnetId',
+    'volume-id': 'VolumeId',
+    'vpc-id': 'VpcId'}
+
+INSTANCE_TYPES = (
+    't2.micro', 't2.small', 't2.medium', 'm4.large', 'm4.xlarge',
+    'c4.large', 'r4.large')
+
+INSTANCE_STATES = {
+    'pending': 0, 'running': 16, 'shutting-down': 32, 'terminated': 48,
+    'stopping': 64, 'stopped': 80}
+
+ENVIRONMENTS = ('dev', 'test', 'staging', 'prod')
+
+# Id of each kind of generated resource.
+RESOURCE_IDS = {
+    'instances': 'InstanceId',
+    'volumes': 'VolumeId',
+    'snapshots': 'SnapshotId',
+    'images': 'ImageId',
+    'security_groups': 'GroupId',
+    'subnets': 'SubnetId',
+    'vpcs': 'VpcId',
+    'auto_scaling_groups': 'AutoScalingGroupName',
+    'launch_configurations': 'LaunchConfigurationName',
+    'buckets': 'Name'}
+
+EC2_KINDS = (
+    'instances', 'volumes', 'snapshots', 'images', 'security_groups',
+    'subnets', 'vpcs')
+
+
+def load_spec(path):
+    with open(path) as fh:
+        return yaml.safe_load(fh) or {}
+
+
+class FakeError(Exception):
+
+    def __init__(self, code, message, status=400):
+        super(FakeError, self).__init__(code, message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class FakeHttpResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        # Read by botocore's s3 GetBucketLocation handler on errors.
+        self.content = b'<Error/>'
+        self.raw = None
+
+
+class TokenBucket(object):
+    """Calls per second a service allows before throttling."""
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.clock = clock
+        self.tokens = self.burst
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class FakeClient(object):
+    """Client mixin, answering http requests from the fake cloud."""
+
+    _fake_cloud = None
+
+    def __init__(self, *args, **kw):
+        super(FakeClient, self).__init__(*args, **kw)
+        self._fake_call = threading.local()
+        self._endpoint._get_response = self._get_fake_response
+
+    def _make_api_call(self, operation_name, api_params):
+        # Retried requests are answered from the same parameters.
+        self._fake_call.params = api_params
+        return super(FakeClient, self)._make_api_call(
+            operation_name, api_params)
+
+    def _get_fake_response(self, request, operation_model, attempts):
+        status, parsed = self._fake_cloud.call(
+            self.meta.region_name, operation_model, self._fake_call.params)
+        return (FakeHttpResponse(status), parsed), None
+
+
+class FakeCloud(object):
+    """Generated resources and the api calls answering from them.
+
+    Resources of each kind are generated per region on first use, the
+    same for a given seed and fleet size. Operations are answered by
+    the method named for the service and operation, ie.
+    ``ec2_describe_instances``.
+    """
+
+    def __init__(self, spec=None, clock=time.time):
+        self.spec = dict(DEFAULT_SPEC)
+        spec = spec or {}
+        self.spec.update(spec)
+        self.spec['fleet'] = dict(
+            DEFAULT_SPEC['fleet'], **spec.get('fleet', {}))
+        self.spec['operations'] = dict(DEFAULT_SPEC['operations'])
+        for name, settings in spec.get('operations', {}).items():
+            self.spec['operations'][name] = dict(
+                self.spec['operations'].get(name, {}), **settings)
+        self.account_id = self.spec['account_id']
+        self.fleet = self.spec['fleet']
+        self.now = datetime.fromtimestamp(int(clock()), tz=tzutc())
+        self.random = random.Random(self.spec['seed'])
+        self.rate_limits = {}
+        self.regions = {}
+        self.calls = Counter()
+        self.throttles = Counter()
+        self.unsupported_filters = set()
+        self.lock = threading.RLock()
+
+    def attach(self, session):
+        """Answer the calls of clients from the session."""
+        session.events.register(
+            'creating-client-class', self.add_client_class,
+            unique_id='c7n-fake-cloud')
+        return session
+
+    def add_client_class(self, class_attributes, base_classes, **kw):
+        class_attributes['_fake_cloud'] = self
+        base_classes.insert(0, FakeClient)
+
+    def get_settings(self, operation_name):
+        settings = {k: self.spec[k] for k in CALL_SETTINGS}
+        settings.update(self.spec['operations'].get(operation_name, {}))
+        return settings
+
+    def call(self, region, operation_model, params):
+        """Answer an api call with its http status and parsed response."""
+        service = operation_model.service_model.service_name
+        name = operation_model.name
+        settings = self.get_settings(name)
+
+        with self.lock:
+            delay = settings['latency'] + (
+                settings['jitter'] and
+                self.random.uniform(0, settings['jitter']) or 0)
+            throttled = bool(settings['throttle']) and (
+                self.random.random() < settings['throttle'])
+        if delay:
+            time.sleep(delay)
+        if not throttled:
+            throttled = not self.get_rate_limit(region, service).take()
+
+        with self.lock:
+            self.calls[(service, name)] += 1
+            if throttled:
+                self.throttles[(service, name)] += 1
+        if throttled:
+            code, status = THROTTLE_ERRORS.get(
+                service, DEFAULT_THROTTLE_ERROR)
+            return self.get_error_response(
+                FakeError(code, "Rate exceeded", status))
+
+        handler = getattr(self, '%s_%s' % (
+            service.replace('-', '_'), xform_name(name)), None)
+        try:
+            if handler is None:
+                parsed = get_empty_response(operation_model.output_shape)
+            else:
+                parsed = handler(region, params, settings)
+        except FakeError as e:
+            return self.get_error_response(e)
+        parsed['ResponseMetadata'] = {
+            'RequestId': str(uuid.uuid4()),
+            'HTTPStatusCode': 200,
+            'HTTPHeaders': {}}
+        return 200, parsed
+
+    def get_error_response(self, error):
+        return error.status, {
+            'Error': {'Code': error.code, 'Message': error.message},
+            'ResponseMetadata': {
+                'RequestId': str(uuid.uuid4()),
+                'HTTPStatusCode': error.status,
+                'HTTPHeaders': {}}}
+
+    def get_rate_limit(self, region, service):
+        with self.lock:
+            bucket = self.rate_limits.get((region, service))
+            if bucket is None:
+                limit = self.spec['rate_limits'].get(service)
+                bucket = limit and TokenBucket(**limit) or Unlimited
+                self.rate_limits[(region, service)] = bucket
+            return bucket
+
+    def get_resources(self, region, kind):
+        """The resources of a kind by id, generating them on first use."""
+        with self.lock:
+            resources = self.regions.setdefault(region, {}).get(kind)
+            if resources is not None:
+                return resources
+            generate = getattr(self, 'generate_%s' % kind)
+            resources = OrderedDict()
+            for i in range(self.fleet[kind]):
+                rng = random.Random('%s:%s:%s:%d' % (
+                    self.spec['seed'], region, kind, i))
+                r = generate(region, i, rng)
+                resources[r[RESOURCE_IDS[kind]]] = r
+            self.regions[region][kind] = resources
+            return resources
+
+    def find_resource(self, region, resource_id, kinds):
+        for kind in kinds:
+            r = self.get_resources(region, kind).get(resource_id)
+            if r is not None:
+                return r
+
+    def paginate(self, resources, token, limit, settings):
+        start = int(token or 0)
+        size = settings['page_size']
+        if limit:
+            size = min(size, limit)
+        end = start + size
+        return resources[start:end], end < len(resources) and str(end) or None
+
+    def describe(self, region, params, settings, kind, ids_key, result_key,
+                 paginated=True):
+        with self.lock:
+            resources = self.get_resources(region, kind)
+            if params.get(ids_key):
+                resources = [resources[i] for i in params[ids_key]
+                             if i in resources]
+            else:
+                resources = resources.values()
+            resources = [r for r in resources
+                         if self.match_filters(r, params.get('Filters'))]
+            token = None
+            if paginated:
+                resources, token = self.paginate(
+                    resources, params.get('NextToken'),
+                    params.get('MaxResults'), settings)
+            result = {result_key: copy.deepcopy(resources)}
+        if token:
+            result['NextToken'] = token
+        return result
+
+    def match_filters(self, resource, filters):
+        for f in filters or ():
+            name = f['Name']
+            tags = resource.get('Tags', ())
+            if name.startswith('tag:'):
+                found = [t['Value'] for t in tags if t['Key'] == name[4:]]
+            elif name == 'tag-key':
+                found = [t['Key'] for t in tags]
+            elif name in FILTER_PATHS:
+                found = jmespath.search(FILTER_PATHS[name], resource)
+            else:
+                if name not in self.unsupported_filters:
+                    self.unsupported_filters.add(name)
+                    log.warning("Fake cloud ignoring filter %s", name)
+                continue
+            if not isinstance(found, list):
+                found = [found]
+            found = [filter_value(v) for v in found if v is not None]
+            if not any(fnmatch(v, p) for v in found for p in f['Values']):
+                return False
+        return True
+
+    def owned(self, owners):
+        return not owners or bool(set(owners) & set(('self', self.account_id)))
+
+    # Resource generation
+
+    def created(self, rng, days=720):
+        return self.now - timedelta(
+            days=rng.randint(0, days), seconds=rng.randint(0, 86400))
+
+    def get_tags(self, rng, name):
+        tags = [{'Key': 'Name', 'Value': name},
+                {'Key': 'Environment', 'Value': rng.choice(ENVIRONMENTS)}]
+        if rng.random() < 0.7:
+            tags.append({'Key': 'Owner', 'Value': 'team-%d' % rng.randint(
+                0, 20)})
+        return tags
+
+    def get_network(self, region, i):
+        subnet = i % max(self.fleet['subnets'], 1)
+        vpc = subnet % max(self.fleet['vpcs'], 1)
+        group = vpc + self.fleet['vpcs'] * (i % max(
+            self.fleet['security_groups'] // max(self.fleet['vpcs'], 1), 1))
+        return {
+            'SubnetId': 'subnet-%08x' % subnet,
+            'VpcId': 'vpc-%08x' % vpc,
+            'GroupId': 'sg-%08x' % (group % max(
+                self.fleet['security_groups'], 1)),
+            'AvailabilityZone': '%s%s' % (region, 'abc'[subnet % 3])}
+
+    def generate_instances(self, region, i, rng):
+        network = self.get_network(region, i)
+        state = rng.choice(('running', 'running', 'running', 'stopped'))
+        instance_id = 'i-%017x' % i
+        return {
+            'InstanceId': instance_id,
+            'ImageId': 'ami-%08x' % (i % max(self.fleet['images'], 1)),
+            'InstanceType': rng.choice(INSTANCE_TYPES),
+            'State': {'Code': INSTANCE_STATES[state], 'Name': state},
+            'LaunchTime': self.created(rng),
+            'Placement': {
+                'AvailabilityZone': network['AvailabilityZone'],
+                'Tenancy': 'default'},
+            'SubnetId': network['SubnetId'],
+            'VpcId': network['VpcId'],
+            'PrivateIpAddress': '10.%d.%d.%d' % (
+                i >> 16 & 255, i >> 8 & 255, i & 255),
+            'SecurityGroups': [{
+                'GroupId': network['GroupId'],
+                'GroupName': 'group-%s' % network['GroupId']}],
+            'BlockDeviceMappings': [{
+                'DeviceName': '/dev/xvda',
+                'Ebs': {'VolumeId': 'vol-%017x' % i, 'Status': 'attached',
+                        'DeleteOnTermination': True}}],
+            'Monitoring': {'State': 'disabled'},
+            'KeyName': 'key-%d' % (i % 5),
+            'Tags': self.get_tags(rng, 'instance-%d' % i)}
+
+    def generate_volumes(self, region, i, rng):
+        attachments = []
+        if i < self.fleet['instances'] and rng.random() < 0.8:
+            attachments.append({
+                'InstanceId': 'i-%017x' % i, 'VolumeId': 'vol-%017x' % i,
+                'Device': '/dev/xvda', 'State': 'attached',
+                'DeleteOnTermination': True})
+        return {
+            'VolumeId': 'vol-%017x' % i,
+            'Size': rng.choice((8, 20, 100, 500)),
+            'VolumeType': rng.choice(('gp2', 'gp2', 'io1', 'standard')),
+            'State': attachments and 'in-use' or 'available',
+            'Encrypted': rng.random() < 0.5,
+            'CreateTime': self.created(rng),
+            'AvailabilityZone': self.get_network(
+                region, i)['AvailabilityZone'],
+            'Attachments': attachments,
+            'Tags': self.get_tags(rng, 'volume-%d' % i)}
+
+    def generate_snapshots(self, region, i, rng):
+        return {
+            'SnapshotId': 'snap-%017x' % i,
+            'VolumeId': 'vol-%017x' % (i % max(self.fleet['volumes'], 1)),
+            'VolumeSize': rng.choice((8, 20, 100, 500)),
+            'State': 'completed',
+            'Progress': '100%',
+            'StartTime': self.created(rng),
+            'OwnerId': self.account_id,
+            'Encrypted': rng.random() < 0.5,
+            'Description': 'snapshot %d' % i,
+            'Tags': self.get_tags(rng, 'snapshot-%d' % i)}
+
+    def generate_images(self, region, i, rng):
+        return {
+            'ImageId': 'ami-%08x' % i,
+            'Name': 'image-%d' % i,
+            'State': 'available',
+            'OwnerId': self.account_id,
+            'Public': False,
+            'CreationDate': self.created(rng).strftime(
+                '%Y-%m-%dT%H:%M:%S.000Z'),
+            'Architecture': 'x86_64',
+            'RootDeviceType': 'ebs',
+            'RootDeviceName': '/dev/xvda',
+            'VirtualizationType': 'hvm',
+            'BlockDeviceMappings': [{
+                'DeviceName': '/dev/xvda',
+                'Ebs': {'SnapshotId': 'snap-%017x' % i, 'VolumeSize': 8}}],
+            'Tags': self.get_tags(rng, 'image-%d' % i)}
+
+    def generate_security_groups(self, region, i, rng):
+        permissions = []
+        if rng.random() < 0.2:
+            permissions.append({
+                'IpProtocol': 'tcp', 'FromPort': 22, 'ToPort': 22,
+                'IpRanges': [{'CidrIp': '0.0.0.0/0'}],
+                'UserIdGroupPairs': [], 'PrefixListIds': []})
+        return {
+            'GroupId': 'sg-%08x' % i,
+            'GroupName': 'group-sg-%08x' % i,
+            'Description': 'security group %d' % i,
+            'VpcId': 'vpc-%08x' % (i % max(self.fleet['vpcs'], 1)),
+            'OwnerId': self.account_id,
+            'IpPermissions': permissions,
+            'IpPermissionsEgress': [{
+                'IpProtocol': '-1', 'IpRanges': [{'CidrIp': '0.0.0.0/0'}],
+                'UserIdGroupPairs': [], 'PrefixListIds': []}],
+            'Tags': self.get_tags(rng, 'group-%d' % i)}
+
+    def generate_subnets(self, region, i, rng):
+        return {
+            'SubnetId': 'subnet-%08x' % i,
+            'VpcId': 'vpc-%08x' % (i % max(self.fleet['vpcs'], 1)),
+            'CidrBlock': '10.%d.%d.0/24' % (i // 256 % 256, i % 256),
+            'AvailabilityZone': '%s%s' % (region, 'abc'[i % 3]),
+            'AvailableIpAddressCount': rng.randint(0, 251),
+            'MapPublicIpOnLaunch': False,
+            'State': 'available',
+            'Tags': self.get_tags(rng, 'subnet-%d' % i)}
+
+    def generate_vpcs(self, region, i, rng):
+        return {
+            'VpcId': 'vpc-%08x' % i,
+            'CidrBlock': '10.%d.0.0/16' % (i % 256),
+            'IsDefault': i == 0,
+            'State': 'available',
+            'InstanceTenancy': 'default',
+            'DhcpOptionsId': 'dopt-%08x' % i,
+            'Tags': self.get_tags(rng, 'vpc-%d' % i)}
+
+    def generate_auto_scaling_groups(self, region, i, rng):
+        name = 'asg-%05d' % i
+        network = self.get_network(region, i)
+        size = rng.randint(0, 4)
+        tags = [dict(t, ResourceId=name, ResourceType='auto-scaling-group',
+                     PropagateAtLaunch=True)
+                for t in self.get_tags(rng, name)]
+        return {
+            'AutoScalingGroupName': name,
+            'AutoScalingGroupARN': (
+                'arn:aws:autoscaling:%s:%s:autoScalingGroup:%s:'
+                'autoScalingGroupName/%s' % (
+                    region, self.account_id, uuid.UUID(int=i), name)),
+            'LaunchConfigurationName': 'lc-%05d' % (
+                i % max(self.fleet['launch_configurations'], 1)),
+            'MinSize': 0,
+            'MaxSize': max(size, 1),
+            'DesiredCapacity': size,
+            'DefaultCooldown': 300,
+            'AvailabilityZones': [network['AvailabilityZone']],
+            'LoadBalancerNames': [],
+            'TargetGroupARNs': [],
+            'HealthCheckType': 'EC2',
+            'HealthCheckGracePeriod': 300,
+            'Instances': [],
+            'CreatedTime': self.created(rng),
+            'SuspendedProcesses': [],
+            'VPCZoneIdentifier': network['SubnetId'],
+            'EnabledMetrics': [],
+            'TerminationPolicies': ['Default'],
+            'NewInstancesProtectedFromScaleIn': False,
+            'Tags': tags}
+
+    def generate_launch_configurations(self, region, i, rng):
+        name = 'lc-%05d' % i
+        return {
+            'LaunchConfigurationName': name,
+            'LaunchConfigurationARN': (
+                'arn:aws:autoscaling:%s:%s:launchConfiguration:%s:'
+                'launchConfigurationName/%s' % (
+                    region, self.account_id, uuid.UUID(int=i), name)),
+            'ImageId': 'ami-%08x' % (i % max(self.fleet['images'], 1)),
+            'InstanceType': rng.choice(INSTANCE_TYPES),
+            'KeyName': 'key-%d' % (i % 5),
+            'SecurityGroups': [self.get_network(region, i)['GroupId']],
+            'UserData': '',
+            'BlockDeviceMappings': [],
+            'InstanceMonitoring': {'Enabled': False},
+            'EbsOptimized': False,
+            'CreatedTime': self.created(rng)}
+
+    def generate_buckets(self, region, i, rng):
+        tags = self.get_tags(rng, 'bucket-%d' % i)
+        return {
+            'Name': 'fake-bucket-%05d' % i,
+            'CreationDate': self.created(rng),
+            'TagSet': rng.random() < 0.8 and tags or None}
+
+    # ec2
+
+    def ec2_describe_instances(self, region, params, settings):
+        result = self.describe(
+            region, params, settings, 'instances', 'InstanceIds', 'Instances')
+        result['Reservations'] = [{
+            'ReservationId': 'r-%s' % i['InstanceId'][2:],
+            'OwnerId': self.account_id,
+            'Groups': [],
+            'Instances': [i]} for i in result.pop('Instances')]
+        return result
+
+    def ec2_describe_volumes(self, region, params, settings):
+        return self.describe(
+            region, params, settings, 'volumes', 'VolumeIds', 'Volumes')
+
+    def ec2_describe_snapshots(self, region, params, settings):
+        if not self.owned(params.get('OwnerIds')):
+            return {'Snapshots': []}
+        return self.describe(
+            region, params, settings, 'snapshots', 'SnapshotIds',
+            'Snapshots')
+
+    def ec2_describe_images(self, region, params, settings):
+        if not self.owned(params.get('Owners')):
+            return {'Images': []}
+        return self.describe(
+            region, params, settings, 'images', 'ImageIds', 'Images',
+            paginated=False)
+
+    def ec2_describe_security_groups(self, region, params, settings):
+        return self.describe(
+            region, params, settings, 'security_groups', 'GroupIds',
+            'SecurityGroups', paginated=False)
+
+    def ec2_describe_subnets(self, region, params, settings):
+        return self.describe(
+            region, params, settings, 'subnets', 'SubnetIds', 'Subnets',
+            paginated=False)
+
+    def ec2_describe_vpcs(self, region, params, settings):
+        return self.describe(
+            region, params, settings, 'vpcs', 'VpcIds', 'Vpcs',
+            paginated=False)
+
+    def ec2_create_tags(self, region, params, settings):
+        with self.lock:
+            for rid in params['Resources']:
+                r = self.find_resource(region, rid, EC2_KINDS)
+                if r is None:
+                    continue
+                tags = params['Tags']
+                keys = set([t['Key'] for t in tags])
+                r['Tags'] = [t for t in r.get('Tags', ())
+                             if t['Key'] not in keys] + copy.deepcopy(tags)
+        return {}
+
+    def ec2_delete_tags(self, region, params, settings):
+        with self.lock:
+            for rid in params['Resources']:
+                r = self.find_resource(region, rid, EC2_KINDS)
+                if r is None:
+                    continue
+                r['Tags'] = [
+                    t for t in r.get('Tags', ())
+                    if not remove_tag(t, params.get('Tags'))]
+        return {}
+
+    def set_instance_states(self, region, params, state, result_key):
+        changes = []
+        with self.lock:
+            instances = self.get_resources(region, 'instances')
+            for iid in params['InstanceIds']:
+                i = instances.get(iid)
+                if i is None:
+                    raise FakeError(
+                        'InvalidInstanceID.NotFound',
+                        "The instance ID '%s' does not exist" % iid)
+                changes.append({
+                    'InstanceId': iid,
+                    'PreviousState': dict(i['State']),
+                    'CurrentState': {
+                        'Code': INSTANCE_STATES[state], 'Name': state}})
+                i['State'] = dict(changes[-1]['CurrentState'])
+        return {result_key: changes}
+
+    def ec2_start_instances(self, region, params, settings):
+        return self.set_instance_states(
+            region, params, 'running', 'StartingInstances')
+
+    def ec2_stop_instances(self, region, params, settings):
+        return self.set_instance_states(
+            region, params, 'stopped', 'StoppingInstances')
+
+    def ec2_terminate_instances(self, region, params, settings):
+        return self.set_instance_states(
+            region, params, 'terminated', 'TerminatingInstances')
+
+    def delete_resource(self, region, kind, resource_id, code):
+        with self.lock:
+            if self.get_resources(region, kind).pop(resource_id, None) is None:
+                raise FakeError(
+                    code, "The resource '%s' does not exist" % resource_id)
+        return {}
+
+    def ec2_delete_volume(self, region, params, settings):
+        return self.delete_resource(
+            region, 'volumes', params['VolumeId'], 'InvalidVolume.NotFound')
+
+    def ec2_delete_snapshot(self, region, params, settings):
+        return self.delete_resource(
+            region, 'snapshots', params['SnapshotId'],
+            'InvalidSnapshot.NotFound')
+
+    def ec2_deregister_image(self, region, params, settings):
+        return self.delete_resource(
+            region, 'images', params['ImageId'], 'InvalidAMIID.NotFound')
+
+    # autoscaling
+
+    def autoscaling_describe_auto_scaling_groups(
+            self, region, params, settings):
+        return self.describe_named(
+            region, params, settings, 'auto_scaling_groups',
+            'AutoScalingGroupNames', 'AutoScalingGroups')
+
+    def autoscaling_describe_launch_configurations(
+            self, region, params, settings):
+        return self.describe_named(
+            region, params, settings, 'launch_configurations',
+            'LaunchConfigurationNames', 'LaunchConfigurations')
+
+    def describe_named(self, region, params, settings, kind, names_key,
+                       result_key):
+        params = dict(params, MaxResults=params.get('MaxRecords'))
+        return self.describe(
+            region, params, settings, kind, names_key, result_key)
+
+    def autoscaling_create_or_update_tags(self, region, params, settings):
+        with self.lock:
+            groups = self.get_resources(region, 'auto_scaling_groups')
+            for t in params['Tags']:
+                g = groups.get(t['ResourceId'])
+                if g is None:
+                    continue
+                g['Tags'] = [x for x in g['Tags'] if x['Key'] != t['Key']]
+                g['Tags'].append(dict(
+                    {'Value': '', 'PropagateAtLaunch': False}, **t))
+        return {}
+
+    def autoscaling_delete_tags(self, region, params, settings):
+        with self.lock:
+            groups = self.get_resources(region, 'auto_scaling_groups')
+            for t in params['Tags']:
+                g = groups.get(t['ResourceId'])
+                if g is not None:
+                    g['Tags'] = [
+                        x for x in g['Tags'] if not remove_tag(x, [t])]
+        return {}
+
+    def autoscaling_delete_auto_scaling_group(self, region, params, settings):
+        return self.delete_resource(
+            region, 'auto_scaling_groups', params['AutoScalingGroupName'],
+            'ValidationError')
+
+    def autoscaling_delete_launch_configuration(
+            self, region, params, settings):
+        return self.delete_resource(
+            region, 'launch_configurations',
+            params['LaunchConfigurationName'], 'ValidationError')
+
+    # s3, buckets are global and all in the us-east-1 region
+
+    def get_bucket(self, name):
+        bucket = self.get_resources('us-east-1', 'buckets').get(name)
+        if bucket is None:
+            raise FakeError(
+                'NoSuchBucket', 'The specified bucket does not exist', 404)
+        return bucket
+
+    def s3_list_buckets(self, region, params, settings):
+        with self.lock:
+            buckets = [{'Name': b['Name'], 'CreationDate': b['CreationDate']}
+                       for b in self.get_resources(
+                           'us-east-1', 'buckets').values()]
+        return {'Buckets': buckets, 'Owner': {
+            'ID': self.account_id, 'DisplayName': 'fake'}}
+
+    def s3_get_bucket_location(self, region, params, settings):
+        self.get_bucket(params['Bucket'])
+        return {'LocationConstraint': None}
+
+    def s3_get_bucket_tagging(self, region, params, settings):
+        with self.lock:
+            tags = self.get_bucket(params['Bucket'])['TagSet']
+            if tags is None:
+                raise FakeError(
+                    'NoSuchTagSet', 'The TagSet does not exist', 404)
+            return {'TagSet': copy.deepcopy(tags)}
+
+    def s3_put_bucket_tagging(self, region, params, settings):
+        with self.lock:
+            self.get_bucket(params['Bucket'])['TagSet'] = copy.deepcopy(
+                params['Tagging']['TagSet'])
+        return {}
+
+    def s3_delete_bucket_tagging(self, region, params, settings):
+        with self.lock:
+            self.get_bucket(params['Bucket'])['TagSet'] = None
+        return {}
+
+    def s3_get_bucket_policy(self, region, params, settings):
+        self.get_bucket(params['Bucket'])
+        raise FakeError(
+            'NoSuchBucketPolicy', 'The bucket policy does not exist', 404)
+
+    def list_objects(self, params, settings, start_after):
+        bucket = params['Bucket']
+        with self.lock:
+            self.get_bucket(bucket)
+        keys = ['data/%08d.json' % i for i in range(self.fleet['objects'])]
+        prefix = params.get('Prefix') or ''
+        keys = [k for k in keys if k.startswith(prefix) and k > start_after]
+        keys, token = self.paginate(keys, None, params.get('MaxKeys'), settings)
+        contents = []
+        for k in keys:
+            rng = random.Random('%s:%s:%s' % (self.spec['seed'], bucket, k))
+            contents.append({
+                'Key': k,
+                'LastModified': self.created(rng),
+                'ETag': '"%032x"' % rng.getrandbits(128),
+                'Size': rng.randint(0, 1 << 24),
+                'StorageClass': 'STANDARD'})
+        return {
+            'Name': bucket,
+            'Prefix': prefix,
+            'MaxKeys': params.get('MaxKeys', 1000),
+            'IsTruncated': token is not None,
+            'Contents': contents}
+
+    def s3_list_objects(self, region, params, settings):
+        result = self.list_objects(params, settings, params.get('Marker', ''))
+        if result['IsTruncated']:
+            result['NextMarker'] = result['Contents'][-1]['Key']
+        return result
+
+    def s3_list_objects_v2(self, region, params, settings):
+        result = self.list_objects(
+            params, settings,
+            params.get('ContinuationToken') or params.get('StartAfter', ''))
+        result['KeyCount'] = len(result['Contents'])
+        if result['IsTruncated']:
+            result['NextContinuationToken'] = result['Contents'][-1]['Key']
+        return result
+
+    # cloudwatch, sts
+
+    def cloudwatch_get_metric_statistics(self, region, params, settings):
+        rng = random.Random('%s:%s:%s' % (
+            self.spec['seed'], params['MetricName'],
+            sorted((d['Name'], d['Value'])
+                   for d in params.get('Dimensions', ()))))
+        period = params['Period']
+        start = to_datetime(params['StartTime'])
+        end = to_datetime(params['EndTime'])
+        count = min(
+            int((end - start).total_seconds() // max(period, 1)), 1440)
+        datapoints = []
+        for n in range(count):
+            value = rng.uniform(0, 100)
+            point = {'Timestamp': start + timedelta(seconds=period * n),
+                     'Unit': params.get('Unit', 'None')}
+            for s in params.get('Statistics', ()):
+                point[s] = s == 'SampleCount' and 60.0 or value
+            datapoints.append(point)
+        return {'Label': params['MetricName'], 'Datapoints': datapoints}
+
+    def sts_get_caller_identity(self, region, params, settings):
+        return {
+            'Account': self.account_id,
+            'Arn': 'arn:aws:iam::%s:user/fake' % self.account_id,
+            'UserId': 'AIDAFAKE'}
+
+
+class Unlimited(object):
+
+    @staticmethod
+    def take():
+        return True
+
+
+class FakeSessionFactory(SessionFactory):
+    """Sessions whose clients call the fake cloud.
+
+    Role assumption and profiles are ignored.
+    """
+
+    def __init__(self, cloud, region=None, profile=None, assume_role=None,
+                 account_id=None):
+        super(FakeSessionFactory, self).__init__(
+            region or 'us-east-1', profile, assume_role,
+            account_id or cloud.account_id)
+        self.cloud = cloud
+
+    def __call__(self, assume=True, region=None):
+        session = Session(
+            region_name=region or self.region,
+            aws_access_key_id='fake', aws_secret_access_key='fake')
+        session._session.user_agent_name = "CloudCustodian"
+        session._session.user_agent_version = version
+        return self.cloud.attach(session)
+
+
+# Clouds by spec path, shared by all policies in the process.
+clouds = {}
+clouds_lock = threading.Lock()
+
+
+def get_fake_cloud(path):
+    with clouds_lock:
+        cloud = clouds.get(path)
+        if cloud is None:
+            cloud = clouds[path] = FakeCloud(load_spec(path))
+    return cloud
+
+
+def get_empty_response(shape):
+    """A response with empty lists and maps, for unanswered operations."""
+    result = {}
+    if shape is None:
+        return result
+    for name, member in shape.members.items():
+        if member.type_name == 'list':
+            result[name] = []
+        elif member.type_name == 'map':
+            result[name] = {}
+    return result
+
+
+def to_datetime(value):
+    if isinstance(value, (int, long, float)):
+        return datetime.fromtimestamp(value, tz=tzutc())
+    if not isinstance(value, datetime):
+        value = parse_date(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tzutc())
+    return value
+
+
+def filter_value(value):
+    if isinstance(value, bool):
+        return value and 'true' or 'false'
+    return unicode(value)
+
+
+def remove_tag(tag, removals):
+    # Without any tags given, all are removed.
+    if not removals:
+        return True
+    for r in removals:
+        if r['Key'] == tag['Key'] and (
+                r.get('Value') is None or r['Value'] == tag['Value']):
+            return True
+    return False
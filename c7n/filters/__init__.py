@@ -21,7 +21,10 @@ from .core import (
     And,
     ValueFilter,
     AgeFilter,
-    EventFilter)
+    EventFilter,
+    LOCAL_COST,
+    REMOTE_COST,
+    plan_filters)
 from .iamaccess import CrossAccountAccessFilter
 from .metrics import MetricsFilter
 from .vpc import DefaultVpcBase
@@ -0,0 +1,292 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Columnar evaluation of value filters.
+
+Enabled per policy with ``columnar: true``. Consecutive value filters
+are then evaluated together over large resource sets. Each filter only
+evaluates the resources kept by the ones before it. The values of its
+key are extracted once per resource into a numpy object array, and
+compared to the filter's value as a single vector operation.
+
+Elements of an object array are compared with python's own comparison,
+so results match per resource evaluation. Values of types whose
+comparison could raise (ie. naive datetimes) are matched by the filter
+itself.
+
+Only equality, ordering, membership, age and expiration comparisons
+are vectorized, other operators and value types (ie. size) gain
+nothing over per resource evaluation.
+
+Requires numpy, without it filters are always evaluated per resource.
+"""
+from datetime import datetime
+import operator
+import re
+import types
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from c7n.filters.core import ANNOTATION_KEY, ValueFilter
+from c7n.utils import set_annotation
+
+VECTOR_OPS = {
+    'eq': operator.eq,
+    'equal': operator.eq,
+    'ne': operator.ne,
+    'not-equal': operator.ne,
+    'gt': operator.gt,
+    'greater-than': operator.gt,
+    'ge': operator.ge,
+    'gte': operator.ge,
+    'le': operator.le,
+    'lte': operator.le,
+    'lt': operator.lt,
+    'less-than': operator.lt}
+
+# Age comparisons put the sentinel on the left, numpy wants the array
+# there, see ValueFilter.process_value_type
+REFLECTED_OPS = {
+    operator.eq: operator.eq,
+    operator.ne: operator.ne,
+    operator.gt: operator.lt,
+    operator.ge: operator.le,
+    operator.lt: operator.gt,
+    operator.le: operator.ge}
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+SET_OPS = ('in', 'ni', 'not-in')
+
+VALUE_TYPES = (None, 'age', 'expiration')
+
+SPECIAL_VALUES = ('absent', 'present', 'not-null', 'empty')
+
+# Types a filter value is compared as, and the value types that never
+# raise when compared to them.
+SCALAR_TYPES = (str, unicode, int, long, float, bool)
+COMPARABLE_TYPES = frozenset(SCALAR_TYPES + (
+    types.NoneType, list, tuple, dict))
+HASHABLE_TYPES = frozenset(SCALAR_TYPES)
+
+# Value filter methods columnar evaluation reimplements, filters
+# overriding any of them are evaluated per resource.
+VALUE_FILTER_METHODS = (
+    '__call__', 'process', 'match', 'get_resource_value',
+    'process_value_type')
+
+
+def vectorizable(f):
+    """Whether a filter can be evaluated columnar."""
+    if not isinstance(f, ValueFilter):
+        return False
+    for m in VALUE_FILTER_METHODS:
+        if getattr(type(f), m).__func__ is not getattr(
+                ValueFilter, m).__func__:
+            return False
+    data = f.data
+    if len(data) == 1:
+        value, op, vtype = data.values()[0], None, None
+    else:
+        value, op, vtype = (
+            data.get('value'), data.get('op'), data.get('value_type'))
+    if vtype not in VALUE_TYPES:
+        return False
+    if op is not None and op not in VECTOR_OPS and op not in SET_OPS:
+        return False
+    if vtype is not None and op not in VECTOR_OPS:
+        return False
+    return not (isinstance(value, basestring) and value in SPECIAL_VALUES)
+
+
+def plan(filters):
+    """Group consecutive vectorizable filters for columnar evaluation."""
+    results = []
+    for f in filters:
+        if not vectorizable(f):
+            results.append(f)
+        elif results and isinstance(results[-1], ColumnarFilters):
+            results[-1].filters.append(f)
+        else:
+            results.append(ColumnarFilters([f]))
+    return results
+
+
+class ColumnarFilters(object):
+    """A sequence of value filters, evaluated columnar as an and."""
+
+    streamable = True
+    min_resources = 1000
+
+    def __init__(self, filters):
+        self.filters = filters
+
+    def __repr__(self):
+        return "<ColumnarFilters %s>" % (self.filters,)
+
+    def process(self, resources, event=None):
+        if numpy is None or len(resources) < self.min_resources:
+            for f in self.filters:
+                if not resources:
+                    break
+                resources = f.process(resources, event)
+            return resources
+
+        columns = Columns(resources)
+        # Positions of the resources matched so far, and the number of
+        # annotating filters each resource matched.
+        selected = numpy.arange(len(resources))
+        matches = numpy.zeros(len(resources), dtype=int)
+        keys = []
+        for f in self.filters:
+            if not len(selected):
+                break
+            # Resolves values and sentinels, once per filter.
+            f.get_matcher()
+            selected = selected[columns.match(f, selected)]
+            if f.annotate:
+                keys.append(f.k)
+                matches[selected] += 1
+
+        # Resources are annotated as they would be per filter, with
+        # the keys of the filters they matched before being dropped.
+        annotated = numpy.flatnonzero(matches)
+        for r, count in zip(
+                columns.resources[annotated], matches[annotated]):
+            set_annotation(r, ANNOTATION_KEY, keys[:count])
+        return columns.resources[selected].tolist()
+
+
+class Columns(object):
+    """Columns of resource values, extracted on demand per key."""
+
+    def __init__(self, resources):
+        self.resources = object_array(resources)
+        self.values = {}
+
+    def get_values(self, f, selected):
+        """Values of the filter's key for the selected resources.
+
+        Values are extracted once per resource, for the resources
+        selected when the key is first used and later ones as needed.
+        """
+        if f.k not in self.values:
+            self.values[f.k] = (
+                numpy.empty(len(self.resources), dtype=object),
+                numpy.zeros(len(self.resources), dtype=bool))
+        column, extracted = self.values[f.k]
+        missing = selected[~extracted[selected]]
+        if len(missing):
+            column[missing] = object_array(
+                map(value_getter(f), self.resources[missing]))
+            extracted[missing] = True
+        return column[selected]
+
+    def match(self, f, selected):
+        """Evaluate the filter for the selected resources."""
+        values = self.get_values(f, selected)
+        if f.vtype in ('age', 'expiration'):
+            vectorized, matched = compare_dates(f, values)
+        elif f.op in SET_OPS:
+            vectorized, matched = compare_set(f, values)
+        else:
+            vectorized, matched = compare(f, values)
+
+        # Values that couldn't be vectorized are matched per resource.
+        if vectorized is not True:
+            for idx in numpy.flatnonzero(~vectorized):
+                matched[idx] = f.match(self.resources[selected[idx]])
+        return matched
+
+
+def value_getter(f):
+    # Identifiers are looked up directly, jmespath would find the same.
+    if IDENTIFIER.match(f.k):
+        return operator.methodcaller('get', f.k)
+    return f._compile_value_getter(f.k)
+
+
+def compare(f, values):
+    if type(f.v) not in SCALAR_TYPES:
+        return unvectorized(values)
+    op = f.op and VECTOR_OPS[f.op] or operator.eq
+    vectorized = of_types(values, COMPARABLE_TYPES)
+    if vectorized is True:
+        return vectorized, op(values, f.v)
+    matched = numpy.zeros(len(values), dtype=bool)
+    matched[vectorized] = op(values[vectorized], f.v)
+    return vectorized, matched
+
+
+def compare_set(f, values):
+    try:
+        members = frozenset(f.v)
+        # Missing values are matched as empty, see ValueFilter.compile
+        missing = (() if f.op in ('in', 'not-in') else None) in f.v
+    except TypeError:
+        return unvectorized(values)
+    vectorized = of_types(values, HASHABLE_TYPES)
+    if vectorized is True:
+        matched = numpy.array(map(members.__contains__, values), dtype=bool)
+    else:
+        matched = numpy.zeros(len(values), dtype=bool)
+        matched[vectorized] = map(members.__contains__, values[vectorized])
+        nulls = numpy.equal(values, None)
+        matched[nulls] = missing
+        vectorized = vectorized | nulls
+    if f.op != 'in':
+        matched = ~matched
+    return vectorized, matched
+
+
+def compare_dates(f, values):
+    sentinel = f.sentinel
+    if not isinstance(sentinel, datetime):
+        return unvectorized(values)
+    op = VECTOR_OPS[f.op]
+    if f.vtype == 'age':
+        op = REFLECTED_OPS[op]
+    vectorized = of_types(values, (datetime,))
+    if vectorized is True:
+        vectorized = numpy.ones(len(values), dtype=bool)
+    # Naive datetimes raise when compared to the sentinel.
+    dates = values[vectorized]
+    vectorized[vectorized] = ~numpy.equal(
+        object_array(map(operator.attrgetter('tzinfo'), dates)), None)
+    matched = numpy.zeros(len(values), dtype=bool)
+    matched[vectorized] = op(values[vectorized], sentinel)
+    return vectorized, matched
+
+
+def of_types(values, allowed):
+    """Mask of the values of allowed types, True when all are."""
+    value_types = map(type, values)
+    if set(value_types).issubset(allowed):
+        return True
+    return numpy.array(
+        map(frozenset(allowed).__contains__, value_types), dtype=bool)
+
+
+def object_array(values):
+    # Assigned rather than converted, so sequences stay elements.
+    result = numpy.empty(len(values), dtype=object)
+    result[:] = values
+    return result
+
+
+def unvectorized(values):
+    return (numpy.zeros(len(values), dtype=bool),
+            numpy.zeros(len(values), dtype=bool))
@@ -17,6 +17,7 @@ Resource Filtering Logic
 
 from datetime import datetime, timedelta
 import fnmatch
+import functools
 import logging
 import operator
 import re
@@ -24,12 +25,13 @@ import re
 from dateutil.tz import tzutc
 from dateutil.parser import parse
 import jmespath
+from jmespath.exceptions import ParseError
 import ipaddress
 
 from c7n.executor import ThreadPoolExecutor
 from c7n.registry import PluginRegistry
 from c7n.resolver import ValuesFrom
-from c7n.utils import set_annotation, type_schema, parse_cidr
+from c7n.utils import set_annotation, type_schema, parse_cidr, get_tag_map
 
 
 class FilterValidationError(Exception): pass
@@ -38,6 +40,10 @@ class FilterValidationError(Exception): pass
 # Matching filters annotate their key onto objects
 ANNOTATION_KEY = "MatchedFilters"
 
+# Relative filter evaluation costs, see Filter.cost
+LOCAL_COST = 1
+REMOTE_COST = 100
+
 
 def glob_match(value, pattern):
     if not isinstance(value, basestring):
@@ -53,6 +59,17 @@ def regex_match(value, regex):
     return bool(re.match(regex, value, flags=re.IGNORECASE))
 
 
+def compile_regex_match(regex):
+    """Return a regex match operator with the pattern precompiled."""
+    pattern = re.compile(regex, flags=re.IGNORECASE)
+
+    def _regex_match(value, regex=None):
+        if not isinstance(value, basestring):
+            return False
+        return bool(pattern.match(value))
+    return _regex_match
+
+
 def operator_in(x, y):
     return x in y
 
@@ -131,6 +148,25 @@ class FilterRegistry(PluginRegistry):
                     self.plugin_type, data))
 
 
+def plan_filters(filters):
+    """Order filters for evaluation, cheapest first.
+
+    Filters are sorted by cost within each run of order independent
+    filters, order dependent filters stay in place, delimiting the runs.
+    The sort is stable, filters of equal cost keep their policy order.
+    """
+    plan, run = [], []
+    for f in filters:
+        if f.order_dependent:
+            plan.extend(sorted(run, key=lambda f: f.get_cost()))
+            plan.append(f)
+            run = []
+        else:
+            run.append(f)
+    plan.extend(sorted(run, key=lambda f: f.get_cost()))
+    return plan
+
+
 # Really should be an abstract base class (abc) or
 # zope.interface
 
@@ -144,6 +180,26 @@ class Filter(object):
     permissions = ()
     schema = {'type': 'object'}
 
+    # Filters that evaluate each resource independently of the rest of
+    # the set can be applied a page at a time when streaming resources,
+    # see ResourceManager.filter_stream.
+    streamable = False
+
+    # Relative cost of evaluating the filter, used to evaluate cheap
+    # filters first so expensive ones see fewer resources. Filters
+    # making api calls, directly or via another resource manager,
+    # declare REMOTE_COST.
+    cost = LOCAL_COST
+
+    # Whether evaluating the filter may annotate the resources it sees,
+    # or blocks only skip already matched resources for branches that
+    # don't, so no annotations are lost.
+    annotates = True
+
+    # Filters whose result for a resource depends on the rest of the set,
+    # or on annotations from preceding filters, are never reordered.
+    order_dependent = False
+
     def __init__(self, data, manager=None):
         self.data = data
         self.manager = manager
@@ -151,6 +207,9 @@ class Filter(object):
     def get_permissions(self):
         return self.permissions
 
+    def get_cost(self):
+        return self.cost
+
     def validate(self):
         """validate filter config, return validation error or self"""
         return self
@@ -180,13 +239,38 @@ class Or(Filter):
                 return True
         return False
 
+    @property
+    def order_dependent(self):
+        return any(f.order_dependent for f in self.filters)
+
+    @property
+    def annotates(self):
+        return any(f.annotates for f in self.filters)
+
+    def get_cost(self):
+        return sum(f.get_cost() for f in self.filters)
+
     def process_set(self, resources, event):
         resource_type = self.manager.get_model()
         resource_map = {r[resource_type.id]: r for r in resources}
         results = set()
-        for f in self.filters:
-            results = results.union([
-                r[resource_type.id] for r in f.process(resources, event)])
+        if self.order_dependent:
+            for f in self.filters:
+                results = results.union([
+                    r[resource_type.id] for r in f.process(resources, event)])
+            return [resource_map[r_id] for r_id in results]
+
+        # Branches that don't annotate only need to consider resources
+        # not yet matched, annotating branches see them all.
+        remaining = resources
+        for f in plan_filters(self.filters):
+            candidates = f.annotates and resources or remaining
+            if not candidates:
+                continue
+            results.update([
+                r[resource_type.id] for r in f.process(candidates, event)])
+            remaining = [
+                r for r in remaining if r[resource_type.id] not in results]
         return [resource_map[r_id] for r_id in results]
 
 
@@ -197,8 +281,25 @@ class And(Filter):
         self.registry = registry
         self.filters = registry.parse(self.data.values()[0], manager)
 
+    @property
+    def streamable(self):
+        return all(f.streamable for f in self.filters)
+
+    @property
+    def order_dependent(self):
+        return any(f.order_dependent for f in self.filters)
+
+    @property
+    def annotates(self):
+        return any(f.annotates for f in self.filters)
+
+    def get_cost(self):
+        return sum(f.get_cost() for f in self.filters)
+
     def process(self, resources, events=None):
-        for f in self.filters:
+        for f in plan_filters(self.filters):
+            if not resources:
+                break
             resources = f.process(resources, events)
         return resources
 
@@ -226,11 +327,24 @@ class Not(Filter):
                 return True
         return False
 
+    @property
+    def order_dependent(self):
+        return any(f.order_dependent for f in self.filters)
+
+    @property
+    def annotates(self):
+        return any(f.annotates for f in self.filters)
+
+    def get_cost(self):
+        return sum(f.get_cost() for f in self.filters)
+
     def process_set(self, resources, event):
         resource_type = self.manager.get_model()
         resource_map = {r[resource_type.id]: r for r in resources}
 
-        for f in self.filters:
+        for f in plan_filters(self.filters):
+            if not resources:
+                break
             resources = f.process(resources, event)
 
         before = set(resource_map.keys())
@@ -244,6 +358,9 @@ class ValueFilter(Filter):
     """
     expr = None
     op = v = vtype = None
+    # Value compared against, with age and expiration resolved to dates
+    sentinel = None
+    _matcher = None
 
     schema = {
         'type': 'object',
@@ -268,6 +385,28 @@ class ValueFilter(Filter):
 
     annotate = True
 
+    @property
+    def annotates(self):
+        return self.annotate
+
+    @property
+    def order_dependent(self):
+        # resource_count operates on the whole set, and annotations are
+        # made by preceding filters.
+        if self.data.get('value_type') == 'resource_count':
+            return True
+        key = self.data.get('key')
+        if key is None and len(self.data) == 1:
+            key = self.data.keys()[0]
+        return isinstance(key, basestring) and 'c7n' in key
+
+    @property
+    def streamable(self):
+        # resource_count operates on the whole set, and subclasses that
+        # override process typically prefetch related data for it.
+        return (self.data.get('value_type') != 'resource_count' and
+                type(self).process == ValueFilter.process)
+
     def _validate_resource_count(self):
         """ Specific validation for `resource_count` type
         
@@ -339,16 +478,13 @@ class ValueFilter(Filter):
                 return resources
             return []
 
+        self.get_matcher()
         return super(ValueFilter, self).process(resources, event)
 
     def get_resource_value(self, k, i):
         if k.startswith('tag:'):
             tk = k.split(':', 1)[1]
-            r = None
-            for t in i.get("Tags", []):
-                if t.get('Key') == tk:
-                    r = t.get('Value')
-                    break
+            r = get_tag_map(i).get(tk)
         elif k in i:
             r = i.get(k)
         elif self.expr:
@@ -359,6 +495,21 @@ class ValueFilter(Filter):
         return r
 
     def match(self, i):
+        if self._matcher is None:
+            self.compile()
+        return self._matcher(i)
+
+    def get_matcher(self):
+        """Return the compiled matcher, compiling it on first use.
+
+        Filters are built per policy execution, so age and expiration
+        sentinels are relative to the start of the execution.
+        """
+        if self._matcher is None:
+            self.compile()
+        return self._matcher
+
+    def _resolve_values(self):
         if self.v is None and len(self.data) == 1:
             [(self.k, self.v)] = self.data.items()
         elif self.v is None:
@@ -371,40 +522,95 @@ class ValueFilter(Filter):
                 self.v = self.data.get('value')
             self.vtype = self.data.get('value_type')
 
-        if i is None:
+    def compile(self):
+        """Compile the filter into a specialized matcher function.
+
+        Key lookup, operator, regex pattern and age/expiration sentinel
+        are resolved once here instead of per resource evaluated.
+        """
+        self._resolve_values()
+        get_value = self._compile_value_getter(self.k)
+        exact = self.v
+        vtype = self.vtype
+        empty_default = self.op in ('in', 'not-in')
+
+        op = None
+        if self.op == 'regex' and isinstance(self.v, basestring):
+            op = compile_regex_match(self.v)
+        elif self.op:
+            op = OPERATORS[self.op]
+
+        sentinel = self.v
+        if vtype in ('age', 'expiration') and isinstance(
+                sentinel, (int, long, float)):
+            delta = timedelta(sentinel)
+            if vtype == 'age':
+                sentinel = datetime.now(tz=tzutc()) - delta
+            else:
+                sentinel = datetime.now(tz=tzutc()) + delta
+        self.sentinel = sentinel
+        process_value_type = self.process_value_type
+
+        def matcher(i):
+            if i is None:
+                return False
+
+            # value extract
+            r = get_value(i)
+            if empty_default and r is None:
+                r = ()
+
+            # value type conversion
+            if vtype is not None:
+                v, r = process_value_type(sentinel, r)
+            else:
+                v = sentinel
+
+            # Value match
+            if r is None and v == 'absent':
+                return True
+            elif r is not None and v == 'present':
+                return True
+            elif v == 'not-null' and r:
+                return True
+            elif v == 'empty' and not r:
+                return True
+            elif op:
+                try:
+                    return op(r, v)
+                except TypeError:
+                    return False
+            elif r == exact:
+                return True
             return False
 
-        # value extract
-        r = self.get_resource_value(self.k, i)
+        self._matcher = matcher
+        return matcher
 
-        if self.op in ('in', 'not-in') and r is None:
-            r = ()
+    def _compile_value_getter(self, k):
+        if type(self).get_resource_value != ValueFilter.get_resource_value:
+            return functools.partial(self.get_resource_value, k)
 
-        # value type conversion
-        if self.vtype is not None:
-            v, r = self.process_value_type(self.v, r)
-        else:
-            v = self.v
+        if k.startswith('tag:'):
+            tk = k.split(':', 1)[1]
 
-        # Value match
-        if r is None and v == 'absent':
-            return True
-        elif r is not None and v == 'present':
-            return True
-        elif v == 'not-null' and r:
-            return True
-        elif v == 'empty' and not r:
-            return True
-        elif self.op:
-            op = OPERATORS[self.op]
-            try:
-                return op(r, v)
-            except TypeError:
-                return False
-        elif r == self.v:
-            return True
+            def get_tag_value(i):
+                return get_tag_map(i).get(tk)
+            return get_tag_value
 
-        return False
+        try:
+            expr = jmespath.compile(k)
+        except ParseError:
+            # Only usable as a literal key, defer the error till needed
+            expr = None
+
+        def get_value(i):
+            if k in i:
+                return i.get(k)
+            elif expr is None:
+                return jmespath.compile(k).search(i)
+            return expr.search(i)
+        return get_value
 
     def process_value_type(self, sentinel, value):
         if self.vtype == 'normalize' and isinstance(value, basestring):
@@ -475,6 +681,10 @@ class AgeFilter(Filter):
 
     schema = None
 
+    @property
+    def streamable(self):
+        return type(self).process == AgeFilter.process
+
     def validate(self):
         if not self.date_attribute:
             raise NotImplementedError(
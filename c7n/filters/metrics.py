@@ -16,8 +16,11 @@ CloudWatch Metrics suppport for resources
 """
 from concurrent.futures import as_completed
 from datetime import datetime, timedelta
+import threading
+import time
 
-from c7n.filters import Filter, OPERATORS
+from c7n import ratelimit
+from c7n.filters import Filter, OPERATORS, REMOTE_COST
 from c7n.utils import local_session, type_schema, chunks
 
 
@@ -66,10 +69,13 @@ class MetricsFilter(Filter):
            'percent-attr': {'type': 'string'},
            'required': ('value', 'name')})
 
-    permissions = ("cloudwatch:GetMetricStatistics",)
+    permissions = ("cloudwatch:GetMetricStatistics",
+                   "cloudwatch:GetMetricData")
 
     MAX_QUERY_POINTS = 50850
     MAX_RESULT_POINTS = 1440
+    # Metric data queries per GetMetricData request
+    MAX_QUERIES = 100
 
     # Default per service, for overloaded services like ec2
     # we do type specific default namespace annotation
@@ -99,12 +105,14 @@ class MetricsFilter(Filter):
         'sns': 'AWS/SNS',
         'sqs': 'AWS/SQS',
     }
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         days = self.data.get('days', 14)
         duration = timedelta(days)
 
         self.metric = self.data['name']
+        self.days = days
         self.end = datetime.utcnow()
         self.start = self.end - duration
         self.period = int(self.data.get('period', duration.total_seconds()))
@@ -120,13 +128,33 @@ class MetricsFilter(Filter):
                 ns = self.DEFAULT_NAMESPACE[self.model.service]
         self.namespace = ns
 
+        # GetMetricData packs many series into a single request, older
+        # sdks only support the per resource GetMetricStatistics.
+        client = local_session(
+            self.manager.session_factory).client('cloudwatch')
+        if getattr(client, 'get_metric_data', None) is not None:
+            process_set, chunk_size = (
+                self.process_resource_batch, self.MAX_QUERIES)
+        else:
+            process_set, chunk_size = self.process_resource_set, 50
+
+        # Persisted series are read and written once per invocation,
+        # rather than per resource, where enabled by cache_metrics.
+        store = None
+        if getattr(self.manager.config, 'cache_metrics', False):
+            store = self.manager._cache
+        group = self.get_metrics_group()
+        if store is not None:
+            metrics_cache.load(group, store)
+        self.fetched = {}
+
         self.log.debug("Querying metrics for %d", len(resources))
         matched = []
-        with self.executor_factory(max_workers=3) as w:
+        with self.executor_factory(max_workers=ratelimit.get_workers(
+                self.manager.session_factory, 'monitoring')) as w:
             futures = []
-            for resource_set in chunks(resources, 50):
-                futures.append(
-                    w.submit(self.process_resource_set, resource_set))
+            for resource_set in chunks(resources, chunk_size):
+                futures.append(w.submit(process_set, resource_set))
 
             for f in as_completed(futures):
                 if f.exception():
@@ -134,12 +162,42 @@ class MetricsFilter(Filter):
                         "CW Retrieval error: %s" % f.exception())
                     continue
                 matched.extend(f.result())
+
+        if store is not None:
+            metrics_cache.persist(group, self.fetched, store)
         return matched
 
     def get_dimensions(self, resource):
         return [{'Name': self.model.dimension,
                  'Value': resource[self.model.dimension]}]
 
+    def get_metrics_group(self):
+        """Key for the series of this filter's query, of any dimensions."""
+        return (
+            getattr(self.manager.config, 'account_id', None),
+            self.manager.config.region,
+            self.namespace, self.metric, self.statistics,
+            self.period, self.days)
+
+    def get_metrics_key(self, dimensions):
+        """Fully qualified key for the series a query would return."""
+        return self.get_metrics_group() + (
+            tuple((d['Name'], d['Value']) for d in dimensions),)
+
+    def get_cached_metrics(self, key):
+        return metrics_cache.get(key, metrics_cache.get_ttl(self.period))
+
+    def save_cached_metrics(self, key, datapoints):
+        self.fetched[key] = metrics_cache.save(key, datapoints)
+
+    def annotate(self, resource, datapoints):
+        # The annotation records the series the filter evaluated, lookups
+        # always go through the metrics cache, which is keyed on the full
+        # query, so filters on the same metric over different periods or
+        # dimensions don't see each other's datapoints.
+        key = "%s.%s.%s" % (self.namespace, self.metric, self.statistics)
+        resource.setdefault('c7n.metrics', {})[key] = datapoints
+
     def process_resource_set(self, resource_set):
         client = local_session(
             self.manager.session_factory).client('cloudwatch')
@@ -149,14 +207,10 @@ class MetricsFilter(Filter):
             # if we overload dimensions with multiple resources we get
             # the statistics/average over those resources.
             dimensions = self.get_dimensions(r)
-            collected_metrics = r.setdefault('c7n.metrics', {})
-            # Note this annotation cache is policy scoped, not across
-            # policies, still the lack of full qualification on the key
-            # means multiple filters within a policy using the same metric
-            # across different periods or dimensions would be problematic.
-            key = "%s.%s.%s" % (self.namespace, self.metric, self.statistics)
-            if key not in collected_metrics:
-                collected_metrics[key] = client.get_metric_statistics(
+            key = self.get_metrics_key(dimensions)
+            datapoints = self.get_cached_metrics(key)
+            if datapoints is None:
+                datapoints = client.get_metric_statistics(
                     Namespace=self.namespace,
                     MetricName=self.metric,
                     Statistics=[self.statistics],
@@ -164,16 +218,160 @@ class MetricsFilter(Filter):
                     EndTime=self.end,
                     Period=self.period,
                     Dimensions=dimensions)['Datapoints']
-            if len(collected_metrics[key]) == 0:
-                continue
-            if self.data.get('percent-attr'):
-                rvalue = r[self.data.get('percent-attr')]
-                if self.data.get('attr-multiplier'):
-                    rvalue = rvalue * self.data['attr-multiplier']
-                percent = (collected_metrics[key][0][self.statistics] /
-                           rvalue * 100)
-                if self.op(percent, self.value):
-                    matched.append(r)
-            elif self.op(collected_metrics[key][0][self.statistics], self.value):
+                self.save_cached_metrics(key, datapoints)
+            self.annotate(r, datapoints)
+            if self.match_datapoints(r, datapoints):
                 matched.append(r)
         return matched
+
+    def process_resource_batch(self, resource_set):
+        """Retrieve the series for a set of resources with GetMetricData.
+
+        Only series not found in the metrics cache are queried, one
+        query per distinct set of dimensions.
+        """
+        pending, keys = {}, []
+        for r in resource_set:
+            dimensions = self.get_dimensions(r)
+            key = self.get_metrics_key(dimensions)
+            datapoints = self.get_cached_metrics(key)
+            if datapoints is not None:
+                self.annotate(r, datapoints)
+                continue
+            if key not in pending:
+                keys.append(key)
+                pending[key] = (dimensions, [])
+            pending[key][1].append(r)
+
+        if pending:
+            client = local_session(
+                self.manager.session_factory).client('cloudwatch')
+            series = self.get_metric_data(
+                client, [pending[k][0] for k in keys])
+            for key, datapoints in zip(keys, series):
+                self.save_cached_metrics(key, datapoints)
+                for r in pending[key][1]:
+                    self.annotate(r, datapoints)
+
+        key = "%s.%s.%s" % (self.namespace, self.metric, self.statistics)
+        return [r for r in resource_set
+                if self.match_datapoints(r, r['c7n.metrics'][key])]
+
+    def get_metric_data(self, client, dimension_sets):
+        """Query a series per dimension set, returning their datapoints.
+
+        Results are normalized to the GetMetricStatistics datapoint
+        shape, most recent first.
+        """
+        queries = [{
+            'Id': 'm%d' % idx,
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': self.namespace,
+                    'MetricName': self.metric,
+                    'Dimensions': dimensions},
+                'Period': self.period,
+                'Stat': self.statistics},
+            'ReturnData': True} for idx, dimensions in enumerate(
+                dimension_sets)]
+
+        results = {}
+        params = dict(
+            MetricDataQueries=queries,
+            StartTime=self.start,
+            EndTime=self.end,
+            ScanBy='TimestampDescending')
+        while True:
+            response = client.get_metric_data(**params)
+            for result in response['MetricDataResults']:
+                results.setdefault(result['Id'], []).extend([
+                    {'Timestamp': t, self.statistics: v} for t, v in zip(
+                        result['Timestamps'], result['Values'])])
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+        return [results.get(q['Id'], []) for q in queries]
+
+    def match_datapoints(self, resource, datapoints):
+        if len(datapoints) == 0:
+            return False
+        if self.data.get('percent-attr'):
+            rvalue = resource[self.data.get('percent-attr')]
+            if self.data.get('attr-multiplier'):
+                rvalue = rvalue * self.data['attr-multiplier']
+            percent = (datapoints[0][self.statistics] / rvalue * 100)
+            return self.op(percent, self.value)
+        return self.op(datapoints[0][self.statistics], self.value)
+
+
+class MetricsCache(object):
+    """Process wide cache of metric series keyed by the full query.
+
+    Series are shared across the filters and policies of a run. With
+    the cache_metrics option, and the resource cache enabled, they're
+    also persisted through the resource cache, so runs within the cache
+    period reuse them as well. Persisted series are stored together per
+    query, less the dimensions, see :py:meth:`load` and :py:meth:`persist`.
+
+    A series is considered fresh for one metric period, bounded to
+    [min_ttl, max_ttl] seconds, as its trailing datapoint only changes
+    once a period while the query window slides forward.
+    """
+
+    min_ttl = 60
+    max_ttl = 3600
+
+    def __init__(self):
+        self.data = {}
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_ttl(cls, period):
+        return max(cls.min_ttl, min(period, cls.max_ttl))
+
+    def get(self, key, ttl):
+        with self.lock:
+            value = self.data.get(key)
+        if value is None or time.time() - value[0] > ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value[1]
+
+    def save(self, key, datapoints):
+        value = (time.time(), datapoints)
+        with self.lock:
+            self.data[key] = value
+        return value
+
+    def load(self, group, store):
+        """Read a query's persisted series into the cache."""
+        if not store.load():
+            return
+        series = store.get({'metrics': group}) or {}
+        with self.lock:
+            for k, v in series.items():
+                current = self.data.get(k)
+                if current is None or current[0] < v[0]:
+                    self.data[k] = v
+
+    def persist(self, group, series, store):
+        """Add series to a query's persisted series, in a single write."""
+        if not series or not store.load():
+            return
+        # Merged with series persisted meanwhile, ie. by another run.
+        persisted = store.get({'metrics': group}) or {}
+        persisted.update(series)
+        now = time.time()
+        store.save({'metrics': group}, dict([
+            (k, v) for k, v in persisted.items()
+            if now - v[0] <= self.max_ttl]))
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = 0
+
+
+metrics_cache = MetricsCache()
@@ -149,7 +149,7 @@ from os.path import join
 from dateutil import zoneinfo
 
 from c7n.filters import Filter, FilterValidationError
-from c7n.utils import type_schema, dumps
+from c7n.utils import type_schema, dumps, get_tag_map
 
 log = logging.getLogger('custodian.offhours')
 
@@ -169,6 +169,7 @@ class Time(Filter):
         }
 
     time_type = None
+    annotates = False
 
     # Defaults and constants
     DEFAULT_TAG = "maid_offhours"
@@ -314,11 +315,7 @@ class Time(Filter):
     def get_tag_value(self, i):
         """Get the resource's tag value specifying its schedule."""
         # Look for the tag, Normalize tag key and tag value
-        found = False
-        for t in i.get('Tags', ()):
-            if t['Key'].lower() == self.tag_key:
-                found = t['Value']
-                break
+        found = get_tag_map(i, lower=True).get(self.tag_key, False)
         if found is False:
             return False
         # utf8, or do translate tables via unicode ord mapping
@@ -15,7 +15,7 @@ import importlib
 
 import jmespath
 
-from .core import ValueFilter
+from .core import ValueFilter, REMOTE_COST
 
 
 class RelatedResourceFilter(ValueFilter):
@@ -24,6 +24,7 @@ class RelatedResourceFilter(ValueFilter):
     RelatedIdsExpression = None
     AnnotationKey = None
     FetchThreshold = 10
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.get_resource_manager().get_permissions()
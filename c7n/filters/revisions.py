@@ -18,7 +18,7 @@ of a resource.
 from botocore.exceptions import ClientError
 from dateutil.parser import parse as parse_date
 
-from c7n.filters import Filter, FilterValidationError
+from c7n.filters import Filter, FilterValidationError, REMOTE_COST
 from c7n.utils import local_session, type_schema
 
 
@@ -46,6 +46,7 @@ class Diff(Filter):
     permissions = ('config:GetResourceConfigHistory',)
 
     selector_value = mode = parser = resource_shape = None
+    cost = REMOTE_COST
 
     def validate(self):
         if 'selector' in self.data and self.data['selector'] == 'date':
@@ -14,7 +14,7 @@
 
 from c7n.utils import local_session, type_schema
 
-from .core import Filter, ValueFilter
+from .core import Filter, ValueFilter, REMOTE_COST
 from .related import RelatedResourceFilter
 
 
@@ -45,6 +45,7 @@ class DefaultVpcBase(Filter):
     vpcs = None
     default_vpc = None
     permissions = ('ec2:DescribeVpcs',)
+    cost = REMOTE_COST
 
     def match(self, vpc_id):
         if self.default_vpc is None:
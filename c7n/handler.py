@@ -22,6 +22,7 @@ import logging
 import os
 import uuid
 
+from c7n.output import metrics_publisher
 from c7n.policy import load
 from c7n.utils import format_event, get_account_id_from_sts
 
@@ -84,4 +85,7 @@ def dispatch_event(event, context):
     if policies:
         for p in policies:
             p.push(event, context)
+        # Publish metrics before the invocation returns, and the
+        # container is frozen.
+        metrics_publisher.flush(wait=True)
     return True
@@ -0,0 +1,238 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Incrementally refreshed resource inventories.
+
+Rather than describing every resource on every run, the resources
+last seen for each (account, region, resource type) are persisted, and
+on subsequent runs only the resources named in change events since are
+described again and merged in.
+
+Change events are cloudtrail events, either looked up from cloudtrail
+or read from a local file of cloudwatch events, and are mapped to
+resource ids via :py:attr:`c7n.cwe.CloudWatchEvents.trail_events` and
+:py:attr:`c7n.cwe.CloudWatchEvents.change_events`. Created, modified
+and tagged resources are described again, deleted ones are dropped.
+Resource types without any mapped events are always fully fetched.
+
+As not every change is visible as a mapped event, inventories are
+fully refreshed on a schedule as well.
+"""
+import calendar
+import cPickle
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from dateutil.parser import parse as parse_date
+
+from c7n.cwe import CloudWatchEvents
+from c7n.utils import local_session
+
+log = logging.getLogger('custodian.inventory')
+
+DEFAULT_REFRESH_PERIOD = 24 * 60 * 60
+
+# Cloudtrail events can take up to 15 minutes to be delivered, changes
+# are looked for from this far before an inventory's last update.
+EVENT_DELAY = 15 * 60
+
+
+class Inventory(object):
+    """Persisted resource inventories, updated from change events.
+
+    :param path: directory inventories are stored in.
+    :param events_path: a file of cloudwatch events, a json list or one
+           event per line, to use instead of looking up cloudtrail.
+    :param refresh_period: seconds after which an inventory is fully
+           fetched again.
+    """
+
+    def __init__(self, path, events_path=None,
+                 refresh_period=DEFAULT_REFRESH_PERIOD, clock=time.time):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.events = events_path and load_events(events_path) or None
+        self.refresh_period = refresh_period
+        self.clock = clock
+        self.refreshes = self.updates = 0
+        self._lock = threading.Lock()
+        self._path_locks = {}
+
+    def get_path(self, manager):
+        return os.path.join(
+            self.path,
+            getattr(manager.config, 'account_id', None) or 'default',
+            manager.config.region or 'default',
+            '%s.pickle.gz' % manager.type)
+
+    def resources(self, manager, query, fetch):
+        """Return the manager's resources, refreshing its inventory.
+
+        Only unqualified queries against the describe source are
+        inventoried, others are passed through to fetch.
+        """
+        if (query and any(query.values())) or (
+                manager.source_type != 'describe'):
+            return fetch(query)
+        if not CloudWatchEvents.get_change_events(manager.type):
+            return fetch(query)
+
+        path = self.get_path(manager)
+        with self._lock:
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+
+        with path_lock:
+            now = self.clock()
+            record = self.load(path)
+            if record is None or (
+                    now - record['refreshed'] > self.refresh_period):
+                resources = fetch(query)
+                record = {'refreshed': now, 'resources': resources}
+                self.refreshes += 1
+            else:
+                resources = self.update(
+                    manager, record['resources'],
+                    record['updated'] - EVENT_DELAY, now)
+                if resources is None:
+                    resources = fetch(query)
+                    record['refreshed'] = now
+                    self.refreshes += 1
+                else:
+                    self.updates += 1
+                record['resources'] = resources
+            record['updated'] = now
+            self.save(path, record)
+        return resources
+
+    def update(self, manager, resources, since, until):
+        """Merge in the resources changed between since and until.
+
+        Returns None if the changed resources couldn't be described.
+        """
+        ids, deleted = self.get_changes(manager, since, until)
+        if not ids and not deleted:
+            manager.log.debug("Inventory %s unchanged", manager.type)
+            return resources
+
+        manager.log.debug(
+            "Inventory %s updating %d changed, %d deleted resources",
+            manager.type, len(ids), len(deleted))
+        changed = []
+        if ids:
+            try:
+                changed = manager.augment_resources(
+                    manager.source.get_resources(sorted(ids)))
+            except ClientError as e:
+                manager.log.warning(
+                    "Inventory %s update failed, refreshing: %s",
+                    manager.type, e)
+                return None
+
+        m = manager.get_model()
+        return [r for r in resources if r[m.id] not in ids and
+                r[m.id] not in deleted] + changed
+
+    def get_changes(self, manager, since, until):
+        """Ids of the resources changed and deleted between since and until.
+
+        Events are applied in order, an id's last event decides whether
+        it's changed or deleted.
+        """
+        ids, deleted = set(), set()
+        events = sorted(
+            self.get_events(manager, since, until), key=_event_time)
+        for event in events:
+            changes = CloudWatchEvents.get_changes(event, manager.type)
+            if changes is None:
+                continue
+            event_ids, delete = changes
+            if delete:
+                ids.difference_update(event_ids)
+                deleted.update(event_ids)
+            else:
+                deleted.difference_update(event_ids)
+                ids.update(event_ids)
+        return ids, deleted
+
+    def get_events(self, manager, since, until):
+        if self.events is None:
+            return lookup_events(manager, since, until)
+        account_id = getattr(manager.config, 'account_id', None)
+        region = manager.config.region
+        return [e for e in self.events
+                if since <= e['c7n:time'] <= until and
+                e.get('region', region) == region and
+                e.get('account', account_id) == account_id]
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rb') as fh:
+                return cPickle.load(fh)
+        except Exception as e:
+            log.warning("Could not load inventory %s: %s", path, e)
+            return None
+
+    def save(self, path, record):
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # Write and rename, so a failed write doesn't leave a partial
+        # inventory in place.
+        with gzip.open(path + '.tmp', 'wb') as fh:
+            cPickle.dump(record, fh, protocol=2)
+        os.rename(path + '.tmp', path)
+
+
+def load_events(path):
+    """Load cloudwatch events from a json list or line delimited file."""
+    with open(os.path.expanduser(path)) as fh:
+        contents = fh.read().strip()
+    if contents.startswith('['):
+        events = json.loads(contents)
+    else:
+        events = [json.loads(l) for l in contents.splitlines() if l.strip()]
+    for e in events:
+        e['c7n:time'] = _timestamp(
+            e.get('time') or e.get('detail', {}).get('eventTime'))
+    return events
+
+
+def lookup_events(manager, since, until):
+    """Look up the manager's resource type's events in cloudtrail."""
+    client = local_session(manager.session_factory).client('cloudtrail')
+    paginator = client.get_paginator('lookup_events')
+    for event_name in CloudWatchEvents.get_change_events(manager.type):
+        pages = paginator.paginate(
+            LookupAttributes=[{
+                'AttributeKey': 'EventName', 'AttributeValue': event_name}],
+            StartTime=since, EndTime=until)
+        for page in pages:
+            for e in page.get('Events', ()):
+                yield {'detail': json.loads(e['CloudTrailEvent'])}
+
+
+def _event_time(event):
+    if 'c7n:time' in event:
+        return event['c7n:time']
+    return _timestamp(event.get('detail', {}).get('eventTime'))
+
+
+def _timestamp(value):
+    if not value:
+        return 0
+    return calendar.timegm(parse_date(value).utctimetuple())
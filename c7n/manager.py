@@ -11,15 +11,33 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import itertools
 import logging
+import time
 
 from c7n import cache
 from c7n.executor import ThreadPoolExecutor
+from c7n.filters import plan_filters
 from c7n.registry import PluginRegistry
 from c7n.utils import dumps
 
 
-resources = PluginRegistry('resources')
+class ResourceRegistry(PluginRegistry):
+    """Resource type registry, importing resource modules on demand."""
+
+    def __init__(self, plugin_type):
+        super(ResourceRegistry, self).__init__(plugin_type)
+        self._loaded = set()
+
+    def get(self, name):
+        if name not in self._loaded:
+            from c7n.resources import load_resources
+            load_resources((name,))
+            self._loaded.add(name)
+        return super(ResourceRegistry, self).get(name)
+
+
+resources = ResourceRegistry('resources')
 
 
 class ResourceManager(object):
@@ -71,19 +89,25 @@ class ResourceManager(object):
         # if we're already querying via config carry it forward
         if not data and self.source_type == 'config' and getattr(
                 klass.get_model(), 'config_type', None):
-            return klass(self.ctx, {'source': self.config_type})
+            return klass(self.ctx, {'source': 'config'})
         return klass(self.ctx, data or {})
 
     def filter_resources(self, resources, event=None):
+        """Apply the policy's filters, cheapest first, see plan_filters."""
         original = len(resources)
         if event and event.get('debug', False):
             self.log.info(
                 "Filtering resources with %s", self.filters)
-        for f in self.filters:
+        filters = plan_filters(self.filters)
+        if self.data.get('columnar'):
+            # Imported on demand, numpy is slow to import.
+            from c7n.filters import columnar
+            filters = columnar.plan(filters)
+        for f in filters:
             if not resources:
                 break
             rcount = len(resources)
-            resources = f.process(resources, event)
+            resources = self.apply_filter(f, resources, event)
             if event and event.get('debug', False):
                 self.log.debug(
                     "applied filter %s %d->%d", f, rcount, len(resources))
@@ -91,6 +115,48 @@ class ResourceManager(object):
             original, len(resources), self.__class__.__name__.lower()))
         return resources
 
+    def apply_filter(self, f, resources, event=None):
+        profile = getattr(self.ctx, 'profile', None)
+        if profile is None:
+            return f.process(resources, event)
+        s = time.time()
+        results = f.process(resources, event)
+        profile.record_filter(
+            self, f, len(resources), len(results), time.time() - s)
+        return results
+
+    def filter_stream(self, pages, event=None):
+        """Filter resources arriving a page at a time.
+
+        The leading run of streamable filters is applied to each page
+        as it arrives, so only their matches are retained. The first
+        filter that needs the whole set (ie. or, not, resource_count)
+        forces materialization, and it and the remaining filters are
+        applied as per filter_resources.
+        """
+        filters = plan_filters(self.filters)
+        stream_filters = list(
+            itertools.takewhile(lambda f: f.streamable, filters))
+        set_filters = filters[len(stream_filters):]
+
+        original = 0
+        resources = []
+        for page in pages:
+            original += len(page)
+            for f in stream_filters:
+                if not page:
+                    break
+                page = self.apply_filter(f, page, event)
+            resources.extend(page)
+
+        for f in set_filters:
+            if not resources:
+                break
+            resources = self.apply_filter(f, resources, event)
+        self.log.debug("Stream filtered from %d to %d %s" % (
+            original, len(resources), self.__class__.__name__.lower()))
+        return resources
+
     def get_model(self):
         """Returns the resource meta-model.
         """
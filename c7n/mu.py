@@ -19,15 +19,22 @@ docs/lambda.rst
 
 import abc
 import base64
+import calendar
 import imp
 import hashlib
 import json
 import logging
+import marshal
 import os
+import re
+import shutil
 import StringIO
+import struct
+import subprocess
 import sys
 import time
 import tempfile
+import types
 import zipfile
 
 from boto3.s3.transfer import S3Transfer, TransferConfig
@@ -137,6 +144,22 @@ class PythonPackageArchive(object):
         src = src[:-1] if src.endswith('.pyc') else src
         self.add_file(src, dest)
 
+    def add_bytecode(self, src, dest):
+        """Add the compiled bytecode for the ``py`` file at ``src``.
+
+        Its added next to ``dest``, the archive path of the source. The
+        bytecode is only usable by a lambda runtime matching the local
+        interpreter. Its embedded source mtime is the timestamp zip
+        entries are extracted with, so the runtime uses it rather than
+        recompiling.
+        """
+        with open(src, 'rU') as fh:
+            code = compile(fh.read() + '\n', dest, 'exec')
+        self.add_contents(
+            dest + 'c',
+            imp.get_magic() + struct.pack('<I', ZIP_EPOCH) +
+            marshal.dumps(code))
+
     def add_contents(self, dest, contents):
         """Add file contents to the archive under ``dest``.
 
@@ -203,6 +226,170 @@ def custodian_archive():
     return PythonPackageArchive('c7n', 'pkg_resources', 'ipaddress')
 
 
+# Modification time zip entries are extracted with, zinfo leaves the
+# zipfile default date_time in place.
+ZIP_EPOCH = calendar.timegm(zipfile.ZipInfo('').date_time)
+
+MODULE_NAME = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$')
+
+
+def get_module_path(name):
+    """Return the source path of a c7n module, or None if there's none."""
+    if not MODULE_NAME.match(name) or name.endswith('.__init__'):
+        return None
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.path.join(base, *name.split('.'))
+    for candidate in (path + '.py', os.path.join(path, '__init__.py')):
+        if os.path.isfile(candidate):
+            return candidate
+
+
+def get_module_references(name, path, string_resources=True):
+    """Return the candidate module names and the strings a module uses.
+
+    Its compiled code is scanned, which catches both module level and
+    function level imports. Strings catch references to resource types,
+    as passed to ``get_resource_manager``, and to modules, as in
+    related resource filters. Resource modules only referenced by
+    strings are left out unless string_resources is set.
+    """
+    with open(path, 'rU') as fh:
+        code = compile(fh.read() + '\n', path, 'exec')
+    names, strings = set(), set()
+    codes = [code]
+    while codes:
+        co = codes.pop()
+        names.update(co.co_names)
+        for c in co.co_consts:
+            if isinstance(c, types.CodeType):
+                codes.append(c)
+            elif isinstance(c, basestring):
+                strings.add(c)
+
+    # The resources package is excluded, its submodules are imported
+    # by their full name.
+    packages = [n for n in names if n.startswith('c7n') and
+                n != 'c7n.resources']
+    # relative imports, implicit ones being python 2 only
+    if path.endswith('__init__.py'):
+        packages.append(name)
+    else:
+        packages.append(name.rsplit('.', 1)[0])
+    modules = set()
+    for n in names.union(strings):
+        if not string_resources and n not in names and n.startswith(
+                'c7n.resources.'):
+            continue
+        parts = n.split('.')
+        # dotted references may be to a module member
+        modules.update(['.'.join(parts[:i]) for i in range(
+            2, len(parts) + 1)])
+    for n in names:
+        modules.update(['%s.%s' % (p, n) for p in packages])
+    return set([m for m in modules if m.startswith('c7n.')]), strings
+
+
+def get_policy_modules(policy):
+    """Resolve the c7n modules needed to run a policy in lambda.
+
+    The closure starts from the lambda handler, the modules providing
+    the policy's resource type, and those of its filters and actions.
+    Resource modules are only included where referenced, as the lazy
+    resource registry never needs the full set.
+
+    Returns None if the policy's resource type isn't in the resource
+    map, ie. its provided by a plugin.
+    """
+    from c7n.resources.resource_map import ResourceMap
+    if policy.resource_type not in ResourceMap:
+        return None
+
+    resource_modules = set()
+    for type_modules in ResourceMap.values():
+        resource_modules.update(type_modules)
+
+    manager = policy.resource_manager
+    pending = ['c7n.handler'] + list(ResourceMap[policy.resource_type])
+    # Shared filter modules name related resource modules for use by
+    # their subclasses, these are followed only for the classes used.
+    instances = manager.filters + manager.actions
+    while instances:
+        o = instances.pop()
+        # boolean filters
+        instances.extend(getattr(o, 'filters', ()))
+        for klass in o.__class__.__mro__:
+            pending.append(klass.__module__)
+            pending.extend([
+                v.rsplit('.', 1)[0] for v in vars(klass).values()
+                if isinstance(v, basestring) and v.startswith('c7n.')])
+    modules = set()
+    while pending:
+        name = pending.pop()
+        if name in modules or not name.startswith('c7n'):
+            continue
+        path = get_module_path(name)
+        if path is None:
+            continue
+        modules.add(name)
+        parts = name.split('.')
+        pending.extend(['.'.join(parts[:i]) for i in range(1, len(parts))])
+        # Only the lazy loading path of the resources package is used,
+        # which imports just what's referenced via the resource map.
+        if name in ('c7n.resources', 'c7n.resources.resource_map'):
+            continue
+        refs, strings = get_module_references(
+            name, path, string_resources=name in resource_modules)
+        pending.extend(refs)
+        if name in resource_modules:
+            for type_name in strings.intersection(ResourceMap):
+                pending.extend(ResourceMap[type_name])
+    return modules
+
+
+def policy_archive(policy, bytecode=False):
+    """Create a lambda code archive with just the modules a policy uses.
+
+    Falls back to the full custodian archive for resource types from
+    plugins.
+
+    :param bytecode: whether to include compiled bytecode, only valid
+           when the lambda runtime matches the local interpreter.
+    """
+    modules = get_policy_modules(policy)
+    if modules is None:
+        return custodian_archive()
+    archive = PythonPackageArchive('ipaddress')
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for name in sorted(modules):
+        path = get_module_path(name)
+        dest = os.path.relpath(path, base)
+        archive.add_file(path, dest)
+        if bytecode:
+            archive.add_bytecode(path, dest)
+    log.debug("Policy %s archive modules:%d", policy.name, len(modules))
+    return archive
+
+
+def archive_report(archive, handler='custodian_policy'):
+    """Report a closed archive's size and the cold import time of its
+    handler module, measured in a fresh interpreter.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        with archive.get_reader() as reader:
+            reader.extractall(work_dir)
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, time; sys.path.insert(0, %r); t = time.time(); '
+            'import %s; print(time.time() - t)' % (work_dir, handler)])
+    finally:
+        shutil.rmtree(work_dir)
+    return {
+        'size': archive.size,
+        'files': len(archive.get_filenames()),
+        'import_time': float(output.strip())}
+
+
 class LambdaManager(object):
     """ Provides CRUD operations around lambda functions
     """
@@ -556,7 +743,8 @@ class PolicyLambda(AbstractLambdaFunction):
 
     def __init__(self, policy):
         self.policy = policy
-        self.archive = custodian_archive()
+        self.archive = policy_archive(
+            policy, bytecode=self.runtime == RUNTIME)
 
     @property
     def name(self):
@@ -19,16 +19,21 @@ See docs/usage/outputs.rst
 
 """
 
+import atexit
 import datetime
 import gzip
 import logging
 import shutil
 import tempfile
+import threading
+import time
+import zlib
 
 import os
 
 from boto3.s3.transfer import S3Transfer
-from c7n.utils import local_session, parse_s3
+from c7n.executor import ThreadPoolExecutor
+from c7n.utils import get_retry, parse_s3
 from c7n.log import CloudWatchLogHandler
 
 DEFAULT_NAMESPACE = "CloudMaid"
@@ -38,6 +43,10 @@ log = logging.getLogger('custodian.output')
 
 class MetricsOutput(object):
     """Send metrics data to cloudwatch
+
+    Datapoints are aggregated and published in the background, see
+    :py:class:`MetricsPublisher`, so putting a metric never waits on
+    an api call.
     """
 
     permissions = ("cloudWatch:PutMetricData",)
@@ -54,11 +63,9 @@ class MetricsOutput(object):
         self.buf = []
 
     def flush(self):
-        if self.buf:
-            self._put_metrics(self.namespace, self.buf)
-            self.buf = []
+        metrics_publisher.flush()
 
-    def put_metric(self, key, value, unit, buffer=False, **dimensions):
+    def get_metric(self, key, value, unit, **dimensions):
         d = {
             "MetricName": key,
             "Timestamp": datetime.datetime.now(),
@@ -69,18 +76,171 @@ class MetricsOutput(object):
             {"Name": "ResType", "Value": self.ctx.policy.resource_type}]
         for k, v in dimensions.items():
             d['Dimensions'].append({"Name": k, "Value": v})
+        return d
 
-        if buffer:
-            self.buf.append(d)
-            # Max metrics in a single request
-            if len(self.buf) == 20:
-                self.flush()
+    def put_metric(self, key, value, unit, buffer=False, **dimensions):
+        # All datapoints are buffered, buffer is kept for compatibility.
+        metrics_publisher.put(
+            self.ctx.session_factory, self.namespace,
+            self.get_metric(key, value, unit, **dimensions))
+
+
+class MetricsPublisher(object):
+    """Aggregates metrics and publishes them from a background thread.
+
+    Datapoints are aggregated into statistic sets per namespace,
+    metric, dimensions and minute, and published on a timer, or when
+    flushed, packed into as few put_metric_data calls as the service
+    limits allow. Publishing errors are logged, not raised.
+    """
+
+    flush_interval = 30
+
+    # Service limits, datapoints and payload bytes per request.
+    max_batch = 20
+    max_bytes = 40 * 1024
+
+    retry = staticmethod(get_retry(('Throttling',)))
+
+    # Clients are recreated so they don't outlive assumed role
+    # credentials, as with :py:func:`c7n.utils.local_session`.
+    client_ttl = 45 * 60
+
+    def __init__(self):
+        self.stats = {}
+        self.factories = {}
+        self.clients = {}
+        self.thread = None
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.publish_lock = threading.Lock()
+        self.flushing = threading.Event()
+
+    def put(self, session_factory, namespace, datum):
+        value = datum['Value']
+        destination = self.get_destination(session_factory)
+        key = (destination, namespace, datum['MetricName'],
+               datum['Unit'], tuple(sorted(
+                   [(d['Name'], d['Value']) for d in datum['Dimensions']])),
+               datum['Timestamp'].replace(second=0, microsecond=0))
+        with self.lock:
+            self.factories[destination] = session_factory
+            stats = self.stats.get(key)
+            if stats is None:
+                self.stats[key] = {
+                    'SampleCount': 1, 'Sum': value,
+                    'Minimum': value, 'Maximum': value}
+            else:
+                stats['SampleCount'] += 1
+                stats['Sum'] += value
+                stats['Minimum'] = min(stats['Minimum'], value)
+                stats['Maximum'] = max(stats['Maximum'], value)
+            self.start()
+
+    def start(self):
+        if self.stopped:
+            return
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(
+                target=self.run, name='c7n-metrics')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped:
+            self.flushing.wait(self.flush_interval)
+            self.flushing.clear()
+            self.publish()
+
+    def stop(self):
+        """Stop the background thread, publishing any remaining metrics."""
+        with self.lock:
+            self.stopped = True
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.flushing.set()
+            thread.join()
+        self.publish()
+
+    def flush(self, wait=False):
+        """Publish the aggregated metrics.
+
+        By default in the background, with wait on the calling thread,
+        returning once they're published.
+        """
+        if wait:
+            self.publish()
         else:
-            self._put_metrics(self.namespace, [d])
+            self.flushing.set()
+
+    def publish(self):
+        with self.publish_lock:
+            with self.lock:
+                stats, self.stats = self.stats, {}
+            requests = {}
+            for key in sorted(stats, key=lambda k: k[2:]):
+                (destination, namespace, name, unit,
+                 dimensions, timestamp) = key
+                requests.setdefault((destination, namespace), []).append({
+                    'MetricName': name,
+                    'Unit': unit,
+                    'Timestamp': timestamp,
+                    'Dimensions': [
+                        {'Name': n, 'Value': v} for n, v in dimensions],
+                    'StatisticValues': stats[key]})
+            for (destination, namespace), data in requests.items():
+                for batch in self.pack(data):
+                    try:
+                        self.retry(
+                            self.get_client(destination).put_metric_data,
+                            Namespace=namespace, MetricData=batch)
+                    except Exception:
+                        log.exception(
+                            "Error publishing %d metrics to %s",
+                            len(batch), namespace)
+
+    def pack(self, data):
+        batch, size = [], 0
+        for d in data:
+            # Query encoded, each field is prefixed by its member path.
+            dsize = 400 + len(d['MetricName']) + sum(
+                [150 + len(x['Name']) + len(unicode(x['Value']))
+                 for x in d['Dimensions']])
+            if batch and (len(batch) == self.max_batch or
+                          size + dsize > self.max_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(d)
+            size += dsize
+        if batch:
+            yield batch
 
-    def _put_metrics(self, ns, metrics):
-        watch = local_session(self.ctx.session_factory).client('cloudwatch')
-        return watch.put_metric_data(Namespace=ns, MetricData=metrics)
+    @staticmethod
+    def get_destination(session_factory):
+        """Metrics are published per account and region.
+
+        Policies each have their own session factory, so factories
+        for the same account and region share a destination.
+        """
+        account_id = getattr(session_factory, 'account_id', None)
+        region = getattr(session_factory, 'region', None)
+        if account_id is None and region is None:
+            return session_factory
+        return (account_id, region)
+
+    def get_client(self, destination):
+        now = time.time()
+        client, created = self.clients.get(destination, (None, 0))
+        if client is None or now - created > self.client_ttl:
+            with self.lock:
+                session_factory = self.factories[destination]
+            client = session_factory().client('cloudwatch')
+            self.clients[destination] = (client, now)
+        return client
+
+
+metrics_publisher = MetricsPublisher()
+atexit.register(metrics_publisher.stop)
 
 
 class NullMetricsOutput(MetricsOutput):
@@ -91,6 +251,21 @@ class NullMetricsOutput(MetricsOutput):
         super(NullMetricsOutput, self).__init__(ctx, namespace)
         self.data = []
 
+    def flush(self):
+        if self.buf:
+            self._put_metrics(self.namespace, self.buf)
+            self.buf = []
+
+    def put_metric(self, key, value, unit, buffer=False, **dimensions):
+        d = self.get_metric(key, value, unit, **dimensions)
+        if buffer:
+            self.buf.append(d)
+            # Max metrics in a single request
+            if len(self.buf) == 20:
+                self.flush()
+        else:
+            self._put_metrics(self.namespace, [d])
+
     def _put_metrics(self, ns, metrics):
         self.data.append({'Namespace': ns, 'MetricData': metrics})
         for m in metrics:
@@ -104,12 +279,39 @@ class NullMetricsOutput(MetricsOutput):
         return l
 
 
+class PolicyLogFilter(logging.Filter):
+    """Isolate policy log output when policies execute concurrently.
+
+    Records emitted on the thread that joined the log are always kept,
+    records from another executing policy's thread are dropped. Records
+    from pool worker threads can't be attributed and are kept.
+    """
+
+    policy_threads = set()
+
+    def __init__(self):
+        super(PolicyLogFilter, self).__init__()
+        self.thread_id = threading.current_thread().ident
+
+    def join(self):
+        self.policy_threads.add(self.thread_id)
+
+    def leave(self):
+        self.policy_threads.discard(self.thread_id)
+
+    def filter(self, record):
+        if record.thread == self.thread_id:
+            return True
+        return record.thread not in self.policy_threads
+
+
 class LogOutput(object):
 
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
     def __init__(self, ctx):
         self.ctx = ctx
+        self.log_filter = None
 
     def get_handler(self):
         raise NotImplementedError()
@@ -128,12 +330,16 @@ class LogOutput(object):
         self.handler = self.get_handler()
         self.handler.setLevel(logging.DEBUG)
         self.handler.setFormatter(logging.Formatter(self.log_format))
+        self.log_filter = PolicyLogFilter()
+        self.log_filter.join()
+        self.handler.addFilter(self.log_filter)
         mlog = logging.getLogger('custodian')
         mlog.addHandler(self.handler)
 
     def leave_log(self):
         mlog = logging.getLogger('custodian')
         mlog.removeHandler(self.handler)
+        self.log_filter.leave()
         self.handler.flush()
         self.handler.close()
 
@@ -158,6 +364,9 @@ class CloudWatchLogOutput(LogOutput):
 
 class FSOutput(LogOutput):
 
+    # Whether files are compressed, before upload.
+    compressed = False
+
     @staticmethod
     def select(path):
         if path.startswith('s3://'):
@@ -177,11 +386,24 @@ class FSOutput(LogOutput):
         return logging.FileHandler(
             os.path.join(self.root_dir, 'custodian-run.log'))
 
+    def open(self, rel_path):
+        """Open a file in the output directory for writing.
+
+        For compressed outputs, the file is gzipped as its written,
+        with a .gz suffix, rather than by a later compress pass.
+        """
+        path = os.path.join(self.root_dir, rel_path)
+        if self.compressed:
+            return gzip.open(path + '.gz', 'wb', compresslevel=7)
+        return open(path, 'wb')
+
     def compress(self):
         # Compress files individually so thats easy to walk them, without
         # downloading tar and extracting.
         for root, dirs, files in os.walk(self.root_dir):
             for f in files:
+                if f.endswith('.gz'):
+                    continue
                 fp = os.path.join(root, f)
                 with gzip.open(fp + ".gz", "wb", compresslevel=7) as zfh:
                     with open(fp) as sfh:
@@ -221,6 +443,7 @@ class S3Output(FSOutput):
     """
 
     permissions = ('S3:PutObject',)
+    compressed = True
 
     def __init__(self, ctx):
         super(S3Output, self).__init__(ctx)
@@ -229,6 +452,9 @@ class S3Output(FSOutput):
             self.ctx.output_path)
         self.root_dir = tempfile.mkdtemp()
         self.transfer = None
+        self.uploader = S3Uploader(
+            lambda: self.ctx.session_factory(assume=False).client('s3'),
+            self.bucket, extra_args={'ServerSideEncryption': 'AES256'})
 
     def __repr__(self):
         return "<%s to bucket:%s prefix:%s>" % (
@@ -244,31 +470,247 @@ class S3Output(FSOutput):
         if exc_type is not None:
             log.exception("Error while executing policy")
         log.debug("Uploading policy logs")
-        self.leave_log()
-        self.compress()
-        self.transfer = S3Transfer(
-            self.ctx.session_factory(assume=False).client('s3'))
-        self.upload()
-        shutil.rmtree(self.root_dir)
+        try:
+            self.leave_log()
+            self.compress()
+            self.transfer = S3Transfer(
+                self.ctx.session_factory(assume=False).client('s3'))
+            self.upload()
+        finally:
+            shutil.rmtree(self.root_dir)
         log.debug("Policy Logs uploaded")
 
+    def get_key(self, rel_path):
+        key = "%s/%s/%s" % (self.key_prefix, self.date_path, rel_path)
+        return key.strip('/')
+
+    def open(self, rel_path):
+        """Open a file for writing, uploaded as its written.
+
+        The file is gzipped and streamed to the bucket in the
+        background, while the policy executes, rather than written to
+        the output directory and uploaded at exit.
+        """
+        return self.uploader.open(self.get_key(rel_path + '.gz'))
+
     def upload(self):
+        # Files left in the output directory, ie. the run log, are
+        # uploaded concurrently, along with any still being streamed.
         for root, dirs, files in os.walk(self.root_dir):
             for f in files:
-                key = "%s/%s%s" % (
-                    self.key_prefix,
-                    self.date_path,
-                    "%s/%s" % (
-                        root[len(self.root_dir):], f))
-                key = key.strip('/')
-                self.transfer.upload_file(
+                key = self.get_key(
+                    os.path.join(root[len(self.root_dir):], f).strip('/'))
+                self.uploader.submit(
+                    key, self.transfer.upload_file,
                     os.path.join(root, f), self.bucket, key,
                     extra_args={
                         'ServerSideEncryption': 'AES256'})
+        self.uploader.wait()
 
     def use_s3(self):
         return True
 
 
+class S3Uploader(object):
+    """Concurrent background uploads to a bucket.
+
+    Files opened with :py:meth:`open` are uploaded as they're written,
+    large ones as multipart uploads, a part at a time. Parts in flight
+    are bounded, writes block on them, so memory use is bounded by the
+    part size and workers, regardless of the file size.
+
+    Uploads are retried on transient errors. Errors are raised on
+    :py:meth:`wait`, once all uploads have finished.
+    """
+
+    executor_factory = ThreadPoolExecutor
+
+    # Parts other than the last must be at least 5mb.
+    part_size = 8 * 1024 * 1024
+
+    retry = staticmethod(get_retry(
+        ('SlowDown', 'RequestTimeout', 'InternalError',
+         'ServiceUnavailable'), max_attempts=4))
+
+    def __init__(self, client_factory, bucket, max_workers=4,
+                 extra_args=None):
+        self.client_factory = client_factory
+        self.bucket = bucket
+        self.extra_args = extra_args or {}
+        self.client = None
+        self.executor = self.executor_factory(max_workers=max_workers)
+        self.parts = threading.BoundedSemaphore(max_workers * 2)
+        self.futures = []
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def get_client(self):
+        with self.lock:
+            if self.client is None:
+                self.client = self.client_factory()
+            return self.client
+
+    def open(self, key):
+        return S3StreamWriter(self, key)
+
+    def submit(self, key, func, *args, **kw):
+        f = self.executor.submit(func, *args, **kw)
+        with self.lock:
+            self.futures.append((key, f))
+        return f
+
+    def submit_part(self, func, *args):
+        # Blocks the writer while the max parts are in flight.
+        self.parts.acquire()
+        try:
+            f = self.executor.submit(func, *args)
+        except Exception:
+            self.parts.release()
+            raise
+        f.add_done_callback(lambda f: self.parts.release())
+        return f
+
+    def record_error(self, key, error):
+        log.error("Error uploading s3://%s/%s: %s", self.bucket, key, error)
+        with self.lock:
+            self.errors.append(error)
+
+    def wait(self):
+        """Wait for uploads to finish, raising the first error."""
+        self.executor.__exit__(None, None, None)
+        for key, f in self.futures:
+            if f.exception() is not None:
+                self.record_error(key, f.exception())
+        if self.errors:
+            raise self.errors[0]
+
+
+class S3StreamWriter(object):
+    """A write only, gzipped file uploaded in the background.
+
+    Small files are put whole on close. Once the compressed data
+    reaches the part size, a multipart upload is started, and parts
+    are uploaded as they're filled. The upload is completed when the
+    file is closed and all parts are uploaded, or aborted on error.
+    """
+
+    def __init__(self, uploader, key):
+        self.uploader = uploader
+        self.key = key
+        # Gzip format, readable by gzip and load_records.
+        self.compressor = zlib.compressobj(
+            7, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        self.buf = []
+        self.size = 0
+        self.upload_id = None
+        self.part_count = 0
+        self.parts = {}
+        self.pending = 0
+        self.closed = False
+        self.failed = False
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_traceback=None):
+        if exc_type is not None:
+            self.failed = True
+        self.close()
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+        self.add(self.compressor.compress(data))
+
+    def add(self, data):
+        if data:
+            self.buf.append(data)
+            self.size += len(data)
+        if self.size >= self.uploader.part_size and not self.failed:
+            self.upload_part()
+
+    def upload_part(self):
+        client = self.uploader.get_client()
+        if self.upload_id is None:
+            self.upload_id = self.uploader.retry(
+                client.create_multipart_upload,
+                Bucket=self.uploader.bucket, Key=self.key,
+                **self.uploader.extra_args)['UploadId']
+        data = "".join(self.buf)
+        self.buf = []
+        self.size = 0
+        self.part_count += 1
+        with self.lock:
+            self.pending += 1
+        f = self.uploader.submit_part(
+            self.put_part, client, self.part_count, data)
+        f.add_done_callback(self.part_done)
+
+    def put_part(self, client, number, data):
+        response = self.uploader.retry(
+            client.upload_part, Bucket=self.uploader.bucket, Key=self.key,
+            UploadId=self.upload_id, PartNumber=number, Body=data)
+        with self.lock:
+            self.parts[number] = response['ETag']
+
+    def part_done(self, f):
+        if f.exception() is not None:
+            self.uploader.record_error(self.key, f.exception())
+            self.failed = True
+        with self.lock:
+            self.pending -= 1
+            done = self.closed and not self.pending and not self.finished
+            self.finished = self.finished or done
+        # Completed on the thread of the last part to finish.
+        if done:
+            self.finish()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.failed:
+            self.buf = []
+        else:
+            self.add(self.compressor.flush())
+        if self.upload_id is None:
+            self.closed = self.finished = True
+            if not self.failed:
+                self.uploader.submit(
+                    self.key, self.uploader.retry,
+                    self.uploader.get_client().put_object,
+                    Bucket=self.uploader.bucket, Key=self.key,
+                    Body="".join(self.buf), **self.uploader.extra_args)
+            self.buf = []
+            return
+        if self.buf:
+            self.upload_part()
+        with self.lock:
+            self.closed = True
+            done = not self.pending and not self.finished
+            self.finished = self.finished or done
+        if done:
+            self.finish()
+
+    def finish(self):
+        client = self.uploader.get_client()
+        params = dict(
+            Bucket=self.uploader.bucket, Key=self.key,
+            UploadId=self.upload_id)
+        try:
+            if self.failed:
+                client.abort_multipart_upload(**params)
+                return
+            self.uploader.retry(
+                client.complete_multipart_upload,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': n, 'ETag': self.parts[n]}
+                    for n in sorted(self.parts)]},
+                **params)
+        except Exception as e:
+            self.uploader.record_error(self.key, e)
+
+
 s3_join = S3Output.join
 
@@ -0,0 +1,112 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run level planning of resource queries.
+
+A policy file commonly has many policies against the same resource
+type (ie. thirty ec2 policies), each of which would otherwise
+enumerate and augment the same resources. The query planner groups
+the policies of a run and fetches each distinct (resource type,
+region, source, query) exactly once, handing every policy its own
+copy of the shared snapshot to filter and act upon.
+"""
+import copy
+import json
+import logging
+import threading
+
+from c7n.utils import DateTimeEncoder
+
+log = logging.getLogger('custodian.planner')
+
+
+class QueryPlanner(object):
+    """Shares resource snapshots across the policies of a run.
+
+    Snapshots are never handed out directly, filters and actions
+    annotate the resources they see, so each consumer receives a
+    deep copy and the snapshot itself stays pristine.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.snapshots = {}
+        self.fetches = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def get_policy_key(policy):
+        """Static grouping key for a policy, used for run planning."""
+        return (
+            policy.resource_type,
+            policy.region or policy.options.region,
+            policy.data.get('source', 'describe'),
+            _serialize(policy.data.get('query')))
+
+    @staticmethod
+    def get_key(manager, query):
+        """Runtime key for a resource manager query."""
+        return (
+            manager.__class__.__name__,
+            manager.config.region,
+            manager.source_type,
+            _serialize(query))
+
+    def plan(self, policies):
+        """Group the policies by the resources they query.
+
+        Attaches the planner to each policy's execution context, so
+        related resource lookups (security groups, subnets, etc)
+        made on behalf of the policies are shared as well.
+        """
+        for p in policies:
+            p.ctx.planner = self
+            self.groups.setdefault(
+                self.get_policy_key(p), []).append(p.name)
+        log.debug(
+            "Planned %d policies over %d resource queries",
+            len(policies), len(self.groups))
+        return self.groups
+
+    def resources(self, manager, query, fetch):
+        """Return a copy of the snapshot for the query.
+
+        The fetch function is invoked at most once per distinct key,
+        concurrent requests for the same key wait on the first.
+        """
+        key = self.get_key(manager, query)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key in self.snapshots:
+                self.hits += 1
+                log.debug(
+                    "Using planned snapshot %s: %d",
+                    manager.__class__.__name__.lower(),
+                    len(self.snapshots[key]))
+            else:
+                self.fetches += 1
+                self.snapshots[key] = fetch(query)
+            resources = self.snapshots[key]
+        return copy.deepcopy(resources)
+
+    def clear(self):
+        self.snapshots.clear()
+        self._key_locks.clear()
+
+
+def _serialize(query):
+    return json.dumps(query, sort_keys=True, cls=DateTimeEncoder)
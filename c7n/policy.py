@@ -44,7 +44,6 @@ def load(options, path, format='yaml', validate=True):
     if not os.path.exists(path):
         raise IOError("Invalid path for config %r" % path)
 
-    load_resources()
     with open(path) as fh:
         if format == 'yaml':
             data = utils.yaml_load(fh.read())
@@ -55,6 +54,14 @@ def load(options, path, format='yaml', validate=True):
     # Test for empty policy file
     if not data or data.get('policies') is None:
         return None
+
+    # Only import the resource types the policies use
+    if isinstance(data['policies'], list):
+        load_resources(set(
+            isinstance(p, dict) and p.get('resource') or None
+            for p in data['policies']))
+    else:
+        load_resources()
             
     if validate:
         from c7n.schema import validate
@@ -210,6 +217,8 @@ class PullMode(PolicyExecutionMode):
             s = time.time()
             resources = self.policy.resource_manager.resources()
             rt = time.time() - s
+            if self.policy.ctx.profile:
+                self.policy.ctx.profile.record_resources(len(resources), rt)
             self.policy.log.info(
                 "policy: %s resource:%s has count:%d time:%0.2f" % (
                     self.policy.name,
@@ -219,8 +228,8 @@ class PullMode(PolicyExecutionMode):
                 "ResourceCount", len(resources), "Count", Scope="Policy")
             self.policy.ctx.metrics.put_metric(
                 "ResourceTime", rt, "Seconds", Scope="Policy")
-            self.policy._write_file(
-                'resources.json', utils.dumps(resources, indent=2))
+            with self.policy.ctx.output.open('resources.json') as fh:
+                utils.dump_records(resources, fh)
 
             if not resources:
                 return []
@@ -239,14 +248,17 @@ class PullMode(PolicyExecutionMode):
             for a in self.policy.resource_manager.actions:
                 s = time.time()
                 results = a.process(resources)
+                if self.policy.ctx.profile:
+                    self.policy.ctx.profile.record_action(
+                        a, len(resources), time.time() - s)
                 self.policy.log.info(
                     "policy: %s action: %s"
                     " resources: %d"
                     " execution_time: %0.2f" % (
                         self.policy.name, a.name,
                         len(resources), time.time()-s))
-                self.policy._write_file(
-                    "action-%s" % a.name, utils.dumps(results))
+                with self.policy.ctx.output.open("action-%s" % a.name) as fh:
+                    utils.dumps(results, fh)
             self.policy.ctx.metrics.put_metric(
                 "ActionTime", time.time() - at, "Seconds", Scope="Policy")
             return resources
@@ -480,11 +492,18 @@ class Policy(object):
         self.data = data
         self.options = options
         assert "name" in self.data
-        if session_factory is None:
+        if session_factory is None and getattr(options, 'fake_cloud', None):
+            from c7n.fakecloud import FakeSessionFactory, get_fake_cloud
+            session_factory = FakeSessionFactory(
+                get_fake_cloud(options.fake_cloud),
+                options.region,
+                account_id=getattr(options, 'account_id', None))
+        elif session_factory is None:
             session_factory = SessionFactory(
                 options.region,
                 options.profile,
-                options.assume_role)
+                options.assume_role,
+                getattr(options, 'account_id', None))
         self.session_factory = session_factory
         self.ctx = ExecutionContext(self.session_factory, self, self.options)
         self.resource_manager = self.get_resource_manager()
@@ -0,0 +1,208 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per policy profiling and api call accounting.
+
+A profiled policy execution records the wall time and resources in
+and out of each of its filters and actions, along with the count,
+latency, errors, throttles and retries of the api calls it makes, per
+service and operation. The profile is written as ``profile.json`` to
+the policy's output directory, and api call counts are put as metrics.
+
+Api calls are recorded by botocore event handlers registered on the
+sessions from :py:func:`c7n.utils.local_session`. They're attributed
+to the profile active on the calling thread, or if only one policy is
+executing, to that one. While policies execute concurrently, calls
+from pool worker threads can't be attributed and are left out.
+"""
+import json
+import threading
+import time
+
+from c7n.ratelimit import THROTTLE_CODES
+
+# Request context key, api call handlers pass the profile and start time.
+CONTEXT_KEY = 'c7n:profile'
+
+
+class PolicyProfile(object):
+    """Instrumentation of a policy's execution."""
+
+    active = set()
+    current_profile = threading.local()
+    lock = threading.Lock()
+
+    def __init__(self, policy):
+        self.policy_name = policy.name
+        self.resource_type = policy.resource_type
+        self.start = self.end = None
+        self.resources = None
+        self.filters = []
+        self.filter_records = {}
+        self.actions = []
+        self.api_calls = {}
+        self.stats_lock = threading.Lock()
+
+    @classmethod
+    def get_current(cls):
+        profile = getattr(cls.current_profile, 'profile', None)
+        if profile is not None or not cls.active:
+            return profile
+        with cls.lock:
+            if len(cls.active) == 1:
+                return list(cls.active)[0]
+
+    def __enter__(self):
+        self.start = time.time()
+        self.current_profile.profile = self
+        with self.lock:
+            self.active.add(self)
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_traceback=None):
+        self.end = time.time()
+        self.current_profile.profile = None
+        with self.lock:
+            self.active.discard(self)
+
+    def record_resources(self, count, elapsed):
+        self.resources = {'count': count, 'time': elapsed}
+
+    def record_filter(self, manager, f, rcount, count, elapsed):
+        # Stream filtering applies each filter once per page.
+        record = self.filter_records.get(id(f))
+        if record is None:
+            record = self.filter_records[id(f)] = {
+                'resource': manager.type,
+                'filter': getattr(f, 'type', None) or f.__class__.__name__,
+                'time': 0.0, 'resources_in': 0, 'resources_out': 0}
+            self.filters.append(record)
+        record['time'] += elapsed
+        record['resources_in'] += rcount
+        record['resources_out'] += count
+
+    def record_action(self, action, rcount, elapsed):
+        self.actions.append({
+            'action': getattr(action, 'type', None) or action.name,
+            'time': elapsed, 'resources': rcount})
+
+    def get_api_stats(self, service, operation):
+        key = (service, operation)
+        if key not in self.api_calls:
+            self.api_calls[key] = {
+                'calls': 0, 'errors': 0, 'throttles': 0, 'retries': 0,
+                'time': 0.0}
+        return self.api_calls[key]
+
+    def record_call(self, service, operation, elapsed, retries, error):
+        with self.stats_lock:
+            stats = self.get_api_stats(service, operation)
+            stats['calls'] += 1
+            stats['time'] += elapsed
+            stats['retries'] += retries
+            if error:
+                stats['errors'] += 1
+
+    def record_throttle(self, service, operation):
+        with self.stats_lock:
+            self.get_api_stats(service, operation)['throttles'] += 1
+
+    def get_service_stats(self):
+        services = {}
+        for (service, operation), stats in self.api_calls.items():
+            totals = services.setdefault(service, dict.fromkeys(stats, 0))
+            for k, v in stats.items():
+                totals[k] += v
+        return services
+
+    def get_report(self):
+        api_calls = []
+        for (service, operation), stats in sorted(self.api_calls.items()):
+            record = {'service': service, 'operation': operation}
+            record.update(stats)
+            api_calls.append(record)
+        return {
+            'policy': self.policy_name,
+            'resource': self.resource_type,
+            'start': self.start,
+            'end': self.end,
+            'duration': (self.end or time.time()) - self.start,
+            'resources': self.resources,
+            'filters': self.filters,
+            'actions': self.actions,
+            'api_calls': api_calls,
+            'api_services': self.get_service_stats()}
+
+    def write(self, path):
+        with open(path, 'w') as fh:
+            json.dump(self.get_report(), fh, indent=2, sort_keys=True)
+
+    def put_metrics(self, metrics):
+        for service, stats in sorted(self.get_service_stats().items()):
+            for key, name in (('calls', 'ApiCalls'),
+                              ('throttles', 'ApiThrottles'),
+                              ('retries', 'ApiRetries')):
+                metrics.put_metric(
+                    name, stats[key], "Count", buffer=True,
+                    Scope="Policy", Service=service)
+
+
+class SessionProfiler(object):
+    """Botocore event handlers recording api calls to profiles."""
+
+    def before_parameter_build(self, model, context, **kw):
+        # Emitted to every handler, unlike before-call which stops at
+        # the first handler returning a response, ie. placebo.
+        profile = PolicyProfile.get_current()
+        if profile is not None:
+            context[CONTEXT_KEY] = (profile, time.time())
+
+    def after_call(self, http_response, parsed, model, context, **kw):
+        profile, start = context.pop(CONTEXT_KEY, (None, None))
+        if profile is None:
+            return
+        profile.record_call(
+            model.service_model.endpoint_prefix, model.name,
+            time.time() - start,
+            parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+            http_response.status_code >= 300)
+
+    def needs_retry(self, response, operation, request_dict, **kw):
+        if response is None:
+            return
+        code = response[1].get('Error', {}).get('Code')
+        if code not in THROTTLE_CODES:
+            return
+        profile, start = request_dict['context'].get(
+            CONTEXT_KEY, (None, None))
+        if profile is not None:
+            profile.record_throttle(
+                operation.service_model.endpoint_prefix, operation.name)
+
+
+def profile_session(session):
+    """Register the api call profiling handlers on a boto3 session."""
+    events = getattr(session, 'events', None)
+    if events is None:
+        return session
+    handler = SessionProfiler()
+    events.register(
+        'before-parameter-build.*.*', handler.before_parameter_build,
+        unique_id='c7n-profile-before-parameter-build')
+    events.register(
+        'after-call.*.*', handler.after_call,
+        unique_id='c7n-profile-after-call')
+    events.register(
+        'needs-retry.*.*', handler.needs_retry,
+        unique_id='c7n-profile-needs-retry')
+    return session
@@ -16,22 +16,30 @@ Query capability built on skew metamodel
 
 tags_spec -> s3, elb, rds
 """
+import copy
 import functools
 import itertools
 import jmespath
 import json
+import logging
+import os
+import threading
+import zlib
 
 from botocore.client import ClientError
+from botocore.paginate import PageIterator
 from concurrent.futures import as_completed
 
 from c7n.actions import ActionRegistry
 from c7n.filters import FilterRegistry, MetricsFilter
 from c7n.tags import register_tags
 from c7n.utils import (
-    local_session, get_retry, chunks, camelResource)
+    local_session, get_retry, chunks, camelResource, parse_s3, load_records)
 from c7n.registry import PluginRegistry
 from c7n.manager import ResourceManager
 
+log = logging.getLogger('custodian.query')
+
 
 class ResourceQuery(object):
 
@@ -69,6 +77,40 @@ class ResourceQuery(object):
             data = []
         return data
 
+    def filter_pages(self, resource_type, retry=None, **params):
+        """Query a set of resources, yielding them a page at a time.
+
+        With retry, each page fetch is retried on its own, so an error
+        on a later page doesn't restart the listing.
+        """
+        m = self.resolve(resource_type)
+        client = local_session(self.session_factory).client(
+            m.service)
+        enum_op, path, extra_args = m.enum_spec
+        if extra_args:
+            params.update(extra_args)
+        if path:
+            path = jmespath.compile(path)
+
+        if client.can_paginate(enum_op):
+            paginator = client.get_paginator(enum_op)
+            paginator.PAGE_ITERATOR_CLS = RetryPageIterator
+            pages = paginator.paginate(**params)
+            pages.retry = retry
+        elif retry:
+            pages = [retry(getattr(client, enum_op), **params)]
+        else:
+            pages = [getattr(client, enum_op)(**params)]
+
+        for data in pages:
+            if path:
+                data = path.search(data)
+            if data is None:
+                continue
+            if not isinstance(data, list):
+                data = [data]
+            yield data
+
     def get(self, resource_type, identities):
         """Get resources by identities
         """
@@ -127,11 +169,37 @@ def _napi(op_name):
 sources = PluginRegistry('sources')
 
 
+class RetryPageIterator(PageIterator):
+    """Page iterator making each page request via a retry function."""
+
+    retry = None
+
+    def _make_request(self, current_kwargs):
+        if self.retry is None:
+            return super(RetryPageIterator, self)._make_request(current_kwargs)
+        return self.retry(self._method, **current_kwargs)
+
+
 class Source(object):
 
+    # Whether the resource manager augments the source's resources,
+    # sources with no api access to augment from opt out.
+    manager_augment = True
+
+    # Whether resources are saved to and read from the cache, sources
+    # reading from local or point in time data opt out.
+    cacheable = True
+
     def __init__(self, manager):
         self.manager = manager
 
+    def resource_pages(self, query):
+        """Yield resources a page at a time.
+
+        Sources without a notion of paging yield a single page.
+        """
+        yield self.resources(query)
+
 
 @sources.register('describe')
 class DescribeSource(Source):
@@ -151,6 +219,10 @@ class DescribeSource(Source):
             resources = self.query.filter(self.manager.resource_type, **query)
         return resources
 
+    def resource_pages(self, query):
+        return self.query.filter_pages(
+            self.manager.resource_type, self.manager.retry, **query)
+
     def get_permissions(self):
         m = self.manager.get_model()
         perms = ['%s:%s' % (m.service, _napi(m.enum_spec[0]))]
@@ -179,51 +251,377 @@ class DescribeSource(Source):
 
 @sources.register('config')
 class ConfigSource(Source):
+    """Resources from the aws config recorder's inventory.
+
+    Resource ids are listed a page at a time, and fetched in chunks
+    concurrently as pages arrive. Where the api supports it chunks are
+    fetched with batch_get_resource_config, 100 ids per call, otherwise
+    with one config history call per id.
+    """
+
+    batch_size = 100
+    history_batch_size = 20
+    max_workers = 5
 
     def get_permissions(self):
-        return ["config:GetResourceConfigHistory",
+        return ["config:BatchGetResourceConfig",
+                "config:GetResourceConfigHistory",
                 "config:ListDiscoveredResources"]
 
+    @staticmethod
+    def supports_batch(client):
+        return 'BatchGetResourceConfig' in (
+            client.meta.service_model.operation_names)
+
+    def load_resource(self, item):
+        return camelResource(json.loads(item['configuration']))
+
     def get_resources(self, ids, cache=True):
         client = local_session(self.manager.session_factory).client('config')
+        if self.supports_batch(client):
+            items = self.get_batch_items(client, ids)
+        else:
+            items = self.get_history_items(client, ids)
+        return [self.load_resource(i) for i in items if i.get('configuration')]
+
+    def get_batch_items(self, client, ids):
+        config_type = self.manager.get_model().config_type
+        results = []
+        for resource_set in chunks(ids, self.batch_size):
+            keys = [{'resourceType': config_type, 'resourceId': i}
+                    for i in resource_set]
+            while keys:
+                response = client.batch_get_resource_config(resourceKeys=keys)
+                items = response.get('baseConfigurationItems', [])
+                results.extend(items)
+                keys = response.get('unprocessedResourceKeys', [])
+                if keys and not items:
+                    self.manager.log.warning(
+                        "config returned no items, skipping %d unprocessed %s",
+                        len(keys), config_type)
+                    break
+        return results
+
+    def get_history_items(self, client, ids):
+        config_type = self.manager.get_model().config_type
         results = []
-        m = self.manager.get_model()
         for i in ids:
-            results.append(
-                camelResource(
-                    json.loads(
-                        client.get_resource_config_history(
-                            resourceId=i,
-                            resourceType=m.config_type,
-                            limit=1)[
-                                'configurationItems'][0]['configuration'])))
+            results.extend(client.get_resource_config_history(
+                resourceId=i, resourceType=config_type,
+                limit=1)['configurationItems'][:1])
         return results
 
     def resources(self, query=None):
+        return list(itertools.chain(*self.resource_pages(query)))
+
+    def resource_pages(self, query=None):
         client = local_session(self.manager.session_factory).client('config')
         paginator = client.get_paginator('list_discovered_resources')
         pages = paginator.paginate(
             resourceType=self.manager.get_model().config_type)
-        results = []
-        with self.manager.executor_factory(max_workers=5) as w:
-            resource_ids = [
-                r['resourceId'] for r in
-                pages.build_full_result()['resourceIdentifiers']]
+        resource_ids = (
+            r['resourceId'] for page in pages
+            for r in page['resourceIdentifiers'])
+        batch_size = (
+            self.supports_batch(client) and self.batch_size or
+            self.history_batch_size)
+
+        # Chunks are submitted as listing pages arrive, so listing
+        # overlaps with fetching.
+        with self.manager.executor_factory(
+                max_workers=self.max_workers) as w:
+            futures = [
+                w.submit(self.get_resources, resource_set)
+                for resource_set in chunks(resource_ids, batch_size)]
             self.manager.log.debug(
-                "querying %d %s resources",
-                len(resource_ids),
-                self.manager.__class__.__name__.lower())
-
-            for resource_set in chunks(resource_ids, 50):
-                futures = []
-                futures.append(w.submit(self.get_resources, resource_set))
-                for f in as_completed(futures):
-                    if f.exception():
-                        self.log.error(
-                            "Exception creating snapshot set \n %s" % (
-                                f.exception()))
-                    results.extend(f.result())
-        return results
+                "querying %d %s resource sets",
+                len(futures), self.manager.__class__.__name__.lower())
+            # A failed chunk fails the query, raised with its traceback.
+            for f in as_completed(futures):
+                yield f.result()
+
+    def augment(self, resources):
+        return resources
+
+
+def _load_json(contents):
+    """Load json, gzip compressed or not."""
+    if contents[:2] == '\x1f\x8b':
+        contents = zlib.decompress(contents, 16 + zlib.MAX_WBITS)
+    return json.loads(contents)
+
+
+class ConfigSnapshot(object):
+    """Configuration items from aws config snapshots or inventory exports.
+
+    The location is a local file or directory, or an s3 url of an object
+    or key prefix. Files hold json, optionally gzipped, either a config
+    snapshot with its configurationItems, or a list of items.
+
+    Files are read once, on first use, and their items indexed by
+    resource type.
+    """
+
+    file_suffixes = ('.json', '.json.gz')
+    deleted_status = ('ResourceDeleted', 'ResourceDeletedNotRecorded')
+
+    def __init__(self, session_factory, location):
+        self.session_factory = session_factory
+        self.location = location
+        self.index = None
+        self.lock = threading.Lock()
+
+    def get_items(self, config_type):
+        with self.lock:
+            if self.index is None:
+                self.index = self.load()
+        return self.index.get(config_type, [])
+
+    def load(self):
+        index = {}
+        count = 0
+        for name, contents in self.read():
+            items = _load_json(contents)
+            if isinstance(items, dict):
+                items = items.get('configurationItems', ())
+            for i in items:
+                if i.get('configurationItemStatus') in self.deleted_status:
+                    continue
+                index.setdefault(i['resourceType'], []).append(i)
+                count += 1
+            log.debug("loaded config snapshot %s", name)
+        log.info(
+            "loaded %d config items of %d types from %s",
+            count, len(index), self.location)
+        return index
+
+    def read(self):
+        if self.location.startswith('s3://'):
+            return self.read_s3()
+        return self.read_local()
+
+    def read_local(self):
+        path = os.path.expanduser(self.location)
+        if os.path.isdir(path):
+            paths = [os.path.join(path, n) for n in sorted(os.listdir(path))
+                     if n.endswith(self.file_suffixes)]
+        else:
+            paths = [path]
+        for p in paths:
+            with open(p, 'rb') as fh:
+                yield p, fh.read()
+
+    def read_s3(self):
+        _, bucket, key_prefix = parse_s3(self.location)
+        client = local_session(self.session_factory).client('s3')
+        paginator = client.get_paginator('list_objects')
+        for page in paginator.paginate(
+                Bucket=bucket, Prefix=key_prefix.lstrip('/')):
+            for o in page.get('Contents', ()):
+                if not o['Key'].endswith(self.file_suffixes):
+                    continue
+                yield o['Key'], client.get_object(
+                    Bucket=bucket, Key=o['Key'])['Body'].read()
+
+
+# Snapshots by location, shared by all policies in the process.
+config_snapshots = {}
+config_snapshots_lock = threading.Lock()
+
+
+def get_config_snapshot(session_factory, location):
+    with config_snapshots_lock:
+        snapshot = config_snapshots.get(location)
+        if snapshot is None:
+            snapshot = config_snapshots[location] = ConfigSnapshot(
+                session_factory, location)
+    return snapshot
+
+
+@sources.register('config-snapshot')
+class ConfigSnapshotSource(ConfigSource):
+    """Resources from a config snapshot, without any api calls.
+
+    The snapshot location is given by the config_snapshot option, ie.
+    `custodian run --config-snapshot`, which also makes this the default
+    source for resource types recorded by config. Items are limited to
+    the account and region being run against, if known.
+
+    Resources are as recorded by config, the resource manager's
+    augmentation, ie. tag retrieval, is skipped.
+    """
+
+    manager_augment = False
+    cacheable = False
+
+    def get_permissions(self):
+        return []
+
+    def get_snapshot(self):
+        location = getattr(self.manager.config, 'config_snapshot', None)
+        if not location:
+            raise ValueError(
+                "config-snapshot source requires a config_snapshot location")
+        return get_config_snapshot(self.manager.session_factory, location)
+
+    def get_items(self):
+        region = getattr(self.manager.config, 'region', None)
+        account_id = getattr(self.manager.config, 'account_id', None)
+        for i in self.get_snapshot().get_items(
+                self.manager.get_model().config_type):
+            if region and i.get('awsRegion', region) not in (
+                    region, 'global'):
+                continue
+            if account_id and i.get('awsAccountId', account_id) != account_id:
+                continue
+            yield i
+
+    def load_resource(self, item):
+        config = item['configuration']
+        if isinstance(config, basestring):
+            config = json.loads(config)
+        r = camelResource(config)
+        if 'Tags' not in r and item.get('tags'):
+            r['Tags'] = [{'Key': k, 'Value': v}
+                         for k, v in sorted(item['tags'].items())]
+        return r
+
+    def get_resources(self, ids, cache=True):
+        ids = set(ids)
+        return [self.load_resource(i) for i in self.get_items()
+                if i['resourceId'] in ids and i.get('configuration')]
+
+    def resource_pages(self, query=None):
+        yield [self.load_resource(i) for i in self.get_items()
+               if i.get('configuration')]
+
+
+class ResourceSnapshot(object):
+    """Resources recorded by previous policy runs, or in a snapshot file.
+
+    The location is either a snapshot file, or a policy output directory
+    or s3 url, as given to a previous run's --output-dir.
+
+    Snapshot files are json, optionally gzipped, holding a list of
+    resources, or a mapping of resource type to a list of resources, or
+    newline delimited json resources, ie. a policy's resources.json.
+
+    For output directories, each policy reads the resources.json of its
+    own previous run, for s3 the most recent one.
+    """
+
+    file_suffixes = ('.json', '.json.gz')
+
+    def __init__(self, session_factory, location):
+        self.session_factory = session_factory
+        self.location = location
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def get_resources(self, policy_name, resource_type):
+        if self.location.endswith(self.file_suffixes):
+            data = self.load(self.location)
+            # A mapping of resource type to resources.
+            if len(data) == 1 and all(
+                    isinstance(v, list) for v in data[0].values()):
+                data = data[0].get(resource_type, [])
+        else:
+            path = self.get_policy_path(policy_name)
+            if path is None:
+                log.warning(
+                    "no resources in snapshot %s for policy %s",
+                    self.location, policy_name)
+                return []
+            data = self.load(path)
+        # Filters annotate resources in place, give each caller its own.
+        return copy.deepcopy(data)
+
+    def get_policy_path(self, policy_name):
+        if self.location.startswith('s3://'):
+            _, bucket, key_prefix = parse_s3(self.location)
+            client = local_session(self.session_factory).client('s3')
+            paginator = client.get_paginator('list_objects_v2')
+            keys = [o['Key'] for page in paginator.paginate(
+                    Bucket=bucket,
+                    Prefix="%s/%s/" % (key_prefix.strip('/'), policy_name))
+                    for o in page.get('Contents', ())
+                    if o['Key'].endswith('/resources.json.gz')]
+            # keys are date partitioned, YYYY/mm/dd/HH
+            return keys and "s3://%s/%s" % (bucket, max(keys)) or None
+        for f in ('resources.json', 'resources.json.gz'):
+            path = os.path.join(
+                os.path.expanduser(self.location), policy_name, f)
+            if os.path.exists(path):
+                return path
+
+    def load(self, path):
+        with self.lock:
+            if path not in self.files:
+                self.files[path] = load_records(self.read(path))
+                log.debug("loaded resource snapshot %s", path)
+            return self.files[path]
+
+    def read(self, path):
+        if path.startswith('s3://'):
+            _, bucket, key = parse_s3(path)
+            client = local_session(self.session_factory).client('s3')
+            return client.get_object(
+                Bucket=bucket, Key=key.lstrip('/'))['Body'].read()
+        with open(os.path.expanduser(path), 'rb') as fh:
+            return fh.read()
+
+
+resource_snapshots = {}
+resource_snapshots_lock = threading.Lock()
+
+
+def get_resource_snapshot(session_factory, location):
+    with resource_snapshots_lock:
+        snapshot = resource_snapshots.get(location)
+        if snapshot is None:
+            snapshot = resource_snapshots[location] = ResourceSnapshot(
+                session_factory, location)
+    return snapshot
+
+
+@sources.register('snapshot')
+class SnapshotSource(Source):
+    """Resources from a snapshot of previous runs, see ResourceSnapshot.
+
+    The snapshot location is given by the snapshot option, ie.
+    `custodian run --snapshot`, which also makes this the default source
+    for all resource types. Resources are taken as recorded, without
+    augmentation or api calls.
+    """
+
+    manager_augment = False
+    cacheable = False
+
+    def get_permissions(self):
+        return []
+
+    def get_snapshot(self):
+        location = getattr(self.manager.config, 'snapshot', None)
+        if not location:
+            raise ValueError("snapshot source requires a snapshot location")
+        return get_resource_snapshot(self.manager.session_factory, location)
+
+    def resources(self, query=None):
+        policy = self.manager.ctx.policy
+        snapshot = self.get_snapshot()
+        # A run's output only records its policy's resource type, other
+        # types are only available from snapshot files.
+        if (not snapshot.location.endswith(snapshot.file_suffixes) and
+                policy.resource_type != self.manager.type):
+            self.manager.log.debug(
+                "no %s resources in snapshot", self.manager.type)
+            return []
+        return snapshot.get_resources(policy.name, self.manager.type)
+
+    def get_resources(self, ids, cache=True):
+        ids = set(ids)
+        m = self.manager.get_model()
+        return [r for r in self.resources() if r[m.id] in ids]
 
     def augment(self, resources):
         return resources
@@ -249,7 +647,15 @@ class QueryResourceManager(ResourceManager):
 
     @property
     def source_type(self):
-        return self.data.get('source', 'describe')
+        source = self.data.get('source')
+        if source is not None:
+            return source
+        if getattr(self.config, 'snapshot', None):
+            return 'snapshot'
+        if getattr(self.config, 'config_snapshot', None) and getattr(
+                self.get_model(), 'config_type', None):
+            return 'config-snapshot'
+        return 'describe'
 
     @classmethod
     def get_model(cls):
@@ -270,11 +676,32 @@ class QueryResourceManager(ResourceManager):
         return perms
 
     def resources(self, query=None):
-        key = {'region': self.config.region,
-               'resource': str(self.__class__.__name__),
-               'q': query}
+        if self.data.get('stream'):
+            return self.stream_resources(query)
+        fetch = self._fetch_resources
+        inventory = getattr(self.ctx, 'inventory', None)
+        if inventory is not None:
+            fetch = functools.partial(
+                inventory.resources, self, fetch=self._fetch_resources)
+        planner = getattr(self.ctx, 'planner', None)
+        if planner is not None:
+            resources = planner.resources(self, query, fetch)
+        else:
+            resources = fetch(query)
+        return self.filter_resources(resources)
 
-        if self._cache.load():
+    def get_cache_key(self, query):
+        return {'region': self.config.region,
+                'account_id': getattr(self.config, 'account_id', None),
+                'resource': str(self.__class__.__name__),
+                'source': self.source_type,
+                'q': query}
+
+    def _fetch_resources(self, query):
+        key = self.get_cache_key(query)
+        cacheable = self.source.cacheable
+
+        if cacheable and self._cache.load():
             resources = self._cache.get(key)
             if resources is not None:
                 self.log.debug("Using cached %s: %d" % (
@@ -282,20 +709,31 @@ class QueryResourceManager(ResourceManager):
                         self.__class__.__module__,
                         self.__class__.__name__),
                     len(resources)))
-                return self.filter_resources(resources)
+                return resources
 
         if query is None:
             query = {}
 
-        resources = self.augment(self.source.resources(query))
-        self._cache.save(key, resources)
-        return self.filter_resources(resources)
+        resources = self.augment_resources(self.source.resources(query))
+        if cacheable:
+            self._cache.save(key, resources)
+        return resources
+
+    def stream_resources(self, query=None):
+        """Fetch, augment and filter resources a page at a time.
+
+        Streaming bypasses the cache and query planner, as both retain
+        the full unfiltered set.
+        """
+        if query is None:
+            query = {}
+        pages = (self.augment_resources(page) for page in
+                 self.source.resource_pages(query))
+        return self.filter_stream(pages)
 
     def get_resources(self, ids, cache=True):
-        key = {'region': self.config.region,
-               'resource': str(self.__class__.__name__),
-               'q': None}
-        if cache and self._cache.load():
+        key = self.get_cache_key(None)
+        if cache and self.source.cacheable and self._cache.load():
             resources = self._cache.get(key)
             if resources is not None:
                 self.log.debug("Using cached results for get_resources")
@@ -303,12 +741,18 @@ class QueryResourceManager(ResourceManager):
                 id_set = set(ids)
                 return [r for r in resources if r[m.id] in id_set]
         try:
-            resources = self.augment(self.source.get_resources(ids))
+            resources = self.augment_resources(
+                self.source.get_resources(ids))
             return resources
         except ClientError as e:
             self.log.warning("event ids not resolved: %s error:%s" % (ids, e))
             return []
 
+    def augment_resources(self, resources):
+        if not self.source.manager_augment:
+            return resources
+        return self.augment(resources)
+
     def augment(self, resources):
         """subclasses may want to augment resources with additional information.
 
@@ -0,0 +1,268 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Adaptive api rate limiting.
+
+Api calls made through sessions from :py:func:`c7n.utils.local_session`
+draw from a token bucket shared by all threads of the process, one
+bucket per (service, region, account).
+
+Buckets start uncapped, calls only wait once the service has
+throttled. The first throttle caps the bucket at half the request rate
+observed over the last second, from there the refill rate is adjusted
+additive increase, multiplicative decrease style. Each successful call
+nudges the rate up, a throttling error cuts it, so the rate converges
+on what the service allows.
+
+Code making concurrent calls to a service sizes its worker pool with
+:py:func:`get_workers`, rather than with hardcoded worker counts, so
+concurrency follows the service's limiter.
+"""
+import logging
+import threading
+import time
+
+log = logging.getLogger('custodian.ratelimit')
+
+# Error codes services use to signal request rate limiting.
+THROTTLE_CODES = frozenset((
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'SlowDown'))
+
+
+class RateLimiter(object):
+    """Thread safe token bucket with an adaptive refill rate.
+
+    :param rate: initial requests per second, by default None for
+           uncapped until the first throttle.
+    :param min_rate: floor the rate is never cut below.
+    :param max_rate: ceiling the rate never grows above, if any.
+    :param increase: requests per second the rate grows by, per
+           second worth of successful calls.
+    :param decrease: factor the rate is multiplied by on throttling.
+    :param cooldown: seconds after a cut during which further
+           throttles, from calls already in flight, are not counted
+           again.
+    :param max_workers: most workers to make concurrent calls with,
+           see get_workers.
+    """
+
+    def __init__(self, name=None, rate=None, min_rate=0.5, max_rate=None,
+                 increase=1.0, decrease=0.5, cooldown=1.0, max_workers=8,
+                 clock=time.time, sleep=time.sleep):
+        self.name = name
+        self.rate = rate and float(rate) or None
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_workers = max_workers
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = self.capacity
+        self.updated = clock()
+        # Requests in the current and previous second, while uncapped.
+        self.window = int(self.updated)
+        self.window_requests = self.last_window_requests = 0
+        self.last_throttle = None
+        self.requests = self.throttles = 0
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        # Allow bursts of up to a second's worth of requests.
+        return max(1.0, self.rate or 0)
+
+    def _roll(self, now):
+        window = int(now)
+        if window != self.window:
+            self.last_window_requests = (
+                window == self.window + 1 and self.window_requests or 0)
+            self.window = window
+            self.window_requests = 0
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take a token, sleeping until one is available.
+
+        Tokens are reserved under the lock and waited for outside of it,
+        so concurrent callers queue up behind each other.
+
+        Returns the number of seconds waited.
+        """
+        with self.lock:
+            self.requests += 1
+            if self.rate is None:
+                self._roll(self.clock())
+                self.window_requests += 1
+                return 0
+            self._refill(self.clock())
+            self.tokens -= 1
+            wait = self.tokens < 0 and -self.tokens / self.rate or 0
+            self.delay += wait
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self.lock:
+            if self.rate is None:
+                return
+            self.rate += self.increase / self.rate
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttles += 1
+            now = self.clock()
+            if (self.last_throttle is not None and
+                    now - self.last_throttle < self.cooldown):
+                return
+            self.last_throttle = now
+            if self.rate is None:
+                self._roll(now)
+                self.rate = float(max(
+                    self.window_requests, self.last_window_requests, 1))
+                self.tokens, self.updated = 0, now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, self.capacity)
+        log.debug("throttled %s, rate now %0.2f/s", self.name, self.rate)
+
+    def get_workers(self):
+        """Workers to make concurrent calls through the limiter with.
+
+        max_workers while uncapped, once throttled one per request a
+        second the rate allows, so workers aren't left waiting on tokens.
+        """
+        with self.lock:
+            return self._workers()
+
+    def _workers(self):
+        if self.rate is None:
+            return self.max_workers
+        return max(1, min(self.max_workers, int(self.rate)))
+
+    def get_state(self):
+        with self.lock:
+            return {
+                'rate': self.rate and round(self.rate, 2),
+                'workers': self._workers(),
+                'requests': self.requests,
+                'throttles': self.throttles,
+                'delay': round(self.delay, 3)}
+
+
+class RateLimiterRegistry(object):
+    """Process wide rate limiters, keyed by (service, region, account)."""
+
+    def __init__(self, **limiter_options):
+        self.limiter_options = limiter_options
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get(self, service, region, account_id=None):
+        key = (service, region, account_id)
+        with self.lock:
+            limiter = self.limiters.get(key)
+            if limiter is None:
+                limiter = self.limiters[key] = RateLimiter(
+                    ':'.join(map(str, key)), **self.limiter_options)
+        return limiter
+
+    def get_state(self):
+        with self.lock:
+            limiters = dict(self.limiters)
+        return dict([(k, l.get_state()) for k, l in limiters.items()])
+
+    def clear(self):
+        with self.lock:
+            self.limiters.clear()
+
+
+limiters = RateLimiterRegistry()
+
+
+class SessionLimiter(object):
+    """Botocore event handlers routing a session's calls via limiters."""
+
+    def __init__(self, registry, account_id=None):
+        self.registry = registry
+        self.account_id = account_id
+
+    def get_limiter(self, operation_model, context):
+        return self.registry.get(
+            operation_model.service_model.endpoint_prefix,
+            context.get('client_region'), self.account_id)
+
+    def before_call(self, model, context, **kw):
+        self.get_limiter(model, context).acquire()
+
+    def after_call(self, http_response, model, context, **kw):
+        if http_response.status_code < 300:
+            self.get_limiter(model, context).on_success()
+
+    def needs_retry(self, response, operation, request_dict, **kw):
+        # Emitted for every attempt botocore makes, including its own
+        # retries, with no response on connection errors.
+        if response is None:
+            return
+        code = response[1].get('Error', {}).get('Code')
+        if code in THROTTLE_CODES:
+            self.get_limiter(operation, request_dict['context']).on_throttle()
+
+
+def get_workers(session_factory, service, registry=None):
+    """Workers to make concurrent calls to a service with.
+
+    Sized from the limiter of the session factory's region and account
+    for the service, named by its endpoint prefix as limiters are, see
+    :py:meth:`RateLimiter.get_workers`.
+    """
+    return (registry or limiters).get(
+        service, getattr(session_factory, 'region', None),
+        getattr(session_factory, 'account_id', None)).get_workers()
+
+
+def limit_session(session, account_id=None, registry=None):
+    """Register the rate limiting event handlers on a boto3 session."""
+    events = getattr(session, 'events', None)
+    if events is None:
+        return session
+    handler = SessionLimiter(registry or limiters, account_id)
+    events.register(
+        'before-call.*.*', handler.before_call,
+        unique_id='c7n-ratelimit-before-call')
+    events.register(
+        'after-call.*.*', handler.after_call,
+        unique_id='c7n-ratelimit-after-call')
+    events.register(
+        'needs-retry.*.*', handler.needs_retry,
+        unique_id='c7n-ratelimit-needs-retry')
+    return session
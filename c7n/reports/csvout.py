@@ -42,11 +42,8 @@ CLI Usage
 
 from concurrent.futures import as_completed
 
-from cStringIO import StringIO
 import csv
 from datetime import datetime
-import gzip
-import json
 import jmespath
 import logging
 import os
@@ -56,7 +53,7 @@ from botocore.compat import OrderedDict
 from dateutil.parser import parse as date_parse
 
 from c7n.executor import ThreadPoolExecutor
-from c7n.utils import local_session, dumps
+from c7n.utils import local_session, dumps, get_tag_map, load_records
 
 
 log = logging.getLogger('custodian.reports')
@@ -161,8 +158,7 @@ class Formatter(object):
         return self.fields.keys()
 
     def extract_csv(self, record):
-        tag_map = {t['Key']: t['Value'] for t in record.get('Tags', ())}
-        return _get_values(record, self.fields.values(), tag_map)
+        return _get_values(record, self.fields.values(), get_tag_map(record))
 
     def uniq_by_id(self, records):
         """Only the first record for each id"""
@@ -193,16 +189,18 @@ class Formatter(object):
 
 
 def fs_record_set(output_path, policy_name):
-    record_path = os.path.join(output_path, 'resources.json')
-
-    if not os.path.exists(record_path):
+    for f in ('resources.json', 'resources.json.gz'):
+        record_path = os.path.join(output_path, f)
+        if os.path.exists(record_path):
+            break
+    else:
         return []
 
     mdate = datetime.fromtimestamp(
         os.stat(record_path).st_ctime)
 
-    with open(record_path) as fh:
-        records = json.load(fh)
+    with open(record_path, 'rb') as fh:
+        records = load_records(fh.read())
         [r.__setitem__('CustodianDate', mdate) for r in records]
         return records
 
@@ -256,9 +254,7 @@ def get_records(bucket, key, session_factory):
     custodian_date = date_parse(date_str)
     s3 = local_session(session_factory).client('s3')
     result = s3.get_object(Bucket=bucket, Key=key['Key'])
-    blob = StringIO(result['Body'].read())
-
-    records = json.load(gzip.GzipFile(fileobj=blob))
+    records = load_records(result['Body'].read())
     log.debug("bucket: %s key: %s records: %d",
               bucket, key['Key'], len(records))
     for r in records:
@@ -14,9 +14,26 @@
 #
 # AWS resources to manage
 #
+import importlib
 
 
-def load_resources():
+def load_resources(resource_types=None):
+    """Import resource modules, registering their resource types.
+
+    Given resource types only the modules providing them, per the
+    generated :py:mod:`c7n.resources.resource_map`, are imported. Types
+    not in the map, ie. from external plugins, fall back to loading
+    everything.
+    """
+    if resource_types is not None:
+        from c7n.resources.resource_map import ResourceMap
+        resource_types = set(resource_types)
+        if resource_types.issubset(ResourceMap):
+            for type_name in resource_types:
+                for module in ResourceMap[type_name]:
+                    importlib.import_module(module)
+            return
+
     import c7n.resources.account
     import c7n.resources.acm
     import c7n.resources.ami
@@ -25,7 +25,7 @@ from botocore.exceptions import ClientError
 
 from c7n.actions import ActionRegistry
 from c7n.actions import BaseAction
-from c7n.filters import Filter, FilterRegistry, ValueFilter
+from c7n.filters import Filter, FilterRegistry, ValueFilter, REMOTE_COST
 from c7n.manager import ResourceManager, resources
 from c7n.utils import local_session, type_schema
 
@@ -121,6 +121,7 @@ class CloudTrailEnabled(Filter):
            'kms-key': {'type': 'string'}})
 
     permissions = ('cloudtrail:DescribeTrails', 'cloudtrail:GetTrailStatus')
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         session = local_session(self.manager.session_factory)
@@ -186,6 +187,7 @@ class ConfigEnabled(Filter):
     permissions = ('config:DescribeDeliveryChannels',
                    'config:DescribeConfigurationRecorders',
                    'config:DescribeConfigurationRecorderStatus')
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         client = local_session(
@@ -278,6 +280,7 @@ class IAMSummary(ValueFilter):
     schema = type_schema('iam-summary', rinherit=ValueFilter.schema)
 
     permissions = ('iam:GetAccountSummary',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         if not resources[0].get('c7n:iam_summary'):
@@ -316,6 +319,7 @@ class AccountPasswordPolicy(ValueFilter):
     """
     schema = type_schema('password-policy', rinherit=ValueFilter.schema)
     permissions = ('iam:GetAccountPasswordPolicy',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
       account = resources[0]
@@ -402,6 +406,7 @@ class ServiceLimit(Filter):
     permissions = ('support:DescribeTrustedAdvisorCheckResult',)
     check_id = 'eW7HH0l7J9'
     check_limit = ('region', 'service', 'check', 'limit', 'extant', 'color')
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         client = local_session(self.manager.session_factory).client('support')
@@ -15,7 +15,8 @@ import itertools
 import logging
 
 from c7n.actions import ActionRegistry, BaseAction
-from c7n.filters import FilterRegistry, AgeFilter, Filter, OPERATORS
+from c7n.filters import (
+    FilterRegistry, AgeFilter, Filter, OPERATORS, REMOTE_COST)
 
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
@@ -163,6 +164,7 @@ class ImageUnusedFilter(Filter):
     """
 
     schema = type_schema('unused', value={'type': 'boolean'})
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return list(itertools.chain([
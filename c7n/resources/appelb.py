@@ -18,7 +18,8 @@ import logging
 
 from collections import defaultdict
 from c7n.actions import ActionRegistry, BaseAction
-from c7n.filters import Filter, FilterRegistry, DefaultVpcBase, ValueFilter
+from c7n.filters import (
+    Filter, FilterRegistry, DefaultVpcBase, ValueFilter, REMOTE_COST)
 import c7n.filters.vpc as net_filters
 from c7n import tags
 from c7n.manager import resources
@@ -286,6 +287,7 @@ class AppELBListenerFilter(ValueFilter, AppELBListenerFilterBase):
 
     schema = type_schema('listener', rinherit=ValueFilter.schema)
     permissions = ("elasticloadbalancing:DescribeLoadBalancerAttributes",)
+    cost = REMOTE_COST
 
     def process(self, albs, event=None):
         self.initialize(albs)
@@ -317,6 +319,7 @@ class AppELBHealthCheckProtocolMismatchFilter(Filter,
 
     schema = type_schema('healthcheck-protocol-mismatch')
     permissions = ("elasticloadbalancing:DescribeTargetGroups",)
+    cost = REMOTE_COST
 
     def process(self, albs, event=None):
         def _healthcheck_protocol_mismatch(alb):
@@ -337,6 +340,7 @@ class AppELBTargetGroupFilter(ValueFilter, AppELBTargetGroupFilterBase):
 
     schema = type_schema('target-group', rinherit=ValueFilter.schema)
     permissions = ("elasticloadbalancing:DescribeTargetGroups",)
+    cost = REMOTE_COST
 
     def process(self, albs, event=None):
         self.initialize(albs)
@@ -27,7 +27,7 @@ import time
 from c7n.actions import Action, ActionRegistry, AutoTagUser
 from c7n.filters import (
     FilterRegistry, ValueFilter, AgeFilter, Filter, FilterValidationError,
-    OPERATORS)
+    OPERATORS, REMOTE_COST)
 from c7n.filters.offhours import OffHour, OnHour
 import c7n.filters.vpc as net_filters
 
@@ -162,6 +162,7 @@ class LaunchConfigFilter(ValueFilter, LaunchConfigFilterBase):
     schema = type_schema(
         'launch-config', rinherit=ValueFilter.schema)
     permissions = ("autoscaling:DescribeLaunchConfigurations",)
+    cost = REMOTE_COST
 
     def process(self, asgs, event=None):
         self.initialize(asgs)
@@ -174,6 +175,7 @@ class LaunchConfigFilter(ValueFilter, LaunchConfigFilterBase):
 
 
 class ConfigValidFilter(Filter, LaunchConfigFilterBase):
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return list(itertools.chain([
@@ -384,6 +386,7 @@ class NotEncryptedFilter(Filter, LaunchConfigFilterBase):
         'autoscaling:DescribeLaunchConfigurations')
 
     images = unencrypted_configs = unencrypted_images = None
+    cost = REMOTE_COST
 
     # TODO: resource-manager, notfound err mgr
 
@@ -527,6 +530,7 @@ class ImageAgeFilter(AgeFilter, LaunchConfigFilterBase):
         'image-age',
         op={'type': 'string', 'enum': OPERATORS.keys()},
         days={'type': 'number'})
+    cost = REMOTE_COST
 
     def process(self, asgs, event=None):
         self.initialize(asgs)
@@ -570,6 +574,7 @@ class VpcIdFilter(ValueFilter):
         'vpc-id', rinherit=ValueFilter.schema)
     schema['properties'].pop('key')
     permissions = ('ec2:DescribeSubnets',)
+    cost = REMOTE_COST
 
     # TODO: annotation
 
@@ -1377,6 +1382,7 @@ class UnusedLaunchConfig(Filter):
     """
 
     schema = type_schema('unused')
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.manager.get_resource_manager('asg').get_permissions()
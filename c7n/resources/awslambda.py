@@ -15,7 +15,8 @@ import json
 from botocore.exceptions import ClientError
 
 from c7n.actions import ActionRegistry, AutoTagUser, BaseAction
-from c7n.filters import CrossAccountAccessFilter, FilterRegistry, ValueFilter
+from c7n.filters import (
+    CrossAccountAccessFilter, FilterRegistry, ValueFilter, REMOTE_COST)
 import c7n.filters.vpc as net_filters
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
@@ -114,6 +115,7 @@ class LambdaEventSource(ValueFilter):
     annotation_key = "c7n.EventSources"
     schema = type_schema('event-source', rinherit=ValueFilter.schema)
     permissions = ('lambda:GetPolicy',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         def _augment(r):
@@ -177,6 +179,7 @@ class LambdaCrossAccountAccessFilter(CrossAccountAccessFilter):
 
     """
     permissions = ('lambda:GetPolicy',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
 
@@ -14,7 +14,7 @@
 from datetime import datetime, timedelta
 
 from c7n.actions import BaseAction
-from c7n.filters import Filter
+from c7n.filters import Filter, REMOTE_COST
 from c7n.query import QueryResourceManager
 from c7n.manager import resources
 from c7n.utils import type_schema, local_session, chunks, get_retry
@@ -175,6 +175,7 @@ class LastWriteDays(Filter):
     schema = type_schema(
         'last-write', days={'type': 'number'})
     permissions = ('logs:DescribeLogStreams',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         self.date_threshold = datetime.utcnow() - timedelta(
@@ -21,7 +21,7 @@ from concurrent.futures import as_completed
 from c7n.actions import ActionRegistry, BaseAction
 from c7n.filters import (
     CrossAccountAccessFilter, Filter, FilterRegistry, AgeFilter, ValueFilter,
-    ANNOTATION_KEY, FilterValidationError, OPERATORS)
+    ANNOTATION_KEY, FilterValidationError, OPERATORS, REMOTE_COST)
 from c7n.filters.health import HealthEventFilter
 
 from c7n.manager import resources
@@ -113,6 +113,7 @@ def _filter_ami_snapshots(self, snapshots):
 class SnapshotCrossAccountAccess(CrossAccountAccessFilter):
 
     permissions = ('ec2:DescribeSnapshotAttribute',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         self.accounts = self.get_accounts()
@@ -170,6 +171,7 @@ class SnapshotSkipAmiSnapshots(Filter):
     """
 
     schema = type_schema('skip-ami-snapshots', value={'type': 'boolean'})
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return AMI(self.manager.ctx, {}).get_permissions()
@@ -378,6 +380,7 @@ class AttachedInstanceFilter(ValueFilter):
     """
 
     schema = type_schema('instance', rinherit=ValueFilter.schema)
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ec2').get_permissions()
@@ -431,6 +434,7 @@ class FaultTolerantSnapshots(Filter):
     check_id = 'H7IgTzjTYb'
     permissions = ('support:RefreshTrustedAdvisorCheck',
                    'support:DescribeTrustedAdvisorCheckResult')
+    cost = REMOTE_COST
 
     def pull_check_results(self):
         result = set()
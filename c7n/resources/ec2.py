@@ -24,7 +24,8 @@ from c7n.actions import (
     ActionRegistry, BaseAction, AutoTagUser, ModifyVpcSecurityGroupsAction
 )
 from c7n.filters import (
-    FilterRegistry, AgeFilter, ValueFilter, Filter, OPERATORS, DefaultVpcBase
+    FilterRegistry, AgeFilter, ValueFilter, Filter, OPERATORS, DefaultVpcBase,
+    REMOTE_COST
 )
 from c7n.filters.offhours import OffHour, OnHour
 from c7n.filters.health import HealthEventFilter
@@ -247,6 +248,7 @@ class AttachedVolume(ValueFilter):
         'ebs', rinherit=ValueFilter.schema,
         **{'operator': {'enum': ['and', 'or']},
            'skip-devices': {'type': 'array', 'items': {'type': 'string'}}})
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ebs').get_permissions()
@@ -319,6 +321,7 @@ class ImageAge(AgeFilter, InstanceImageBase):
         'image-age',
         op={'type': 'string', 'enum': OPERATORS.keys()},
         days={'type': 'number'})
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ami').get_permissions()
@@ -339,6 +342,7 @@ class ImageAge(AgeFilter, InstanceImageBase):
 class InstanceImage(ValueFilter, InstanceImageBase):
 
     schema = type_schema('image', rinherit=ValueFilter.schema)
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ami').get_permissions()
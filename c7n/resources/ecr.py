@@ -13,7 +13,7 @@
 # limitations under the License.
 from botocore.exceptions import ClientError
 
-from c7n.filters import CrossAccountAccessFilter
+from c7n.filters import CrossAccountAccessFilter, REMOTE_COST
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.utils import local_session
@@ -48,6 +48,7 @@ class ECRCrossAccountAccessFilter(CrossAccountAccessFilter):
                       url: *accounts_url
     """
     permissions = ('ecr:GetRepositoryPolicy',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
 
@@ -22,9 +22,10 @@ from botocore.exceptions import ClientError
 from c7n.actions import (
     ActionRegistry, BaseAction, AutoTagUser, ModifyVpcSecurityGroupsAction)
 from c7n.filters import (
-    Filter, FilterRegistry, FilterValidationError, DefaultVpcBase, ValueFilter)
+    Filter, FilterRegistry, FilterValidationError, DefaultVpcBase, ValueFilter,
+    REMOTE_COST)
 import c7n.filters.vpc as net_filters
-from c7n import tags
+from c7n import ratelimit, tags
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.utils import local_session, chunks, type_schema, get_retry, worker
@@ -102,7 +103,8 @@ def _elb_tags(elbs, session_factory, executor_factory, retry):
         for tag_desc in results['TagDescriptions']:
             elb_map[tag_desc['LoadBalancerName']]['Tags'] = tag_desc['Tags']
 
-    with executor_factory(max_workers=2) as w:
+    with executor_factory(max_workers=ratelimit.get_workers(
+            session_factory, 'elasticloadbalancing')) as w:
         list(w.map(process_tags, chunks(elbs, 20)))
 
 
@@ -221,7 +223,8 @@ class Delete(BaseAction):
     permissions = ('elasticloadbalancing:DeleteLoadBalancer',)
 
     def process(self, load_balancers):
-        with self.executor_factory(max_workers=2) as w:
+        with self.executor_factory(max_workers=ratelimit.get_workers(
+                self.manager.session_factory, 'elasticloadbalancing')) as w:
             list(w.map(self.process_elb, load_balancers))
 
     def process_elb(self, elb):
@@ -367,6 +370,7 @@ class Instance(ValueFilter):
 
     schema = type_schema('instance', rinherit=ValueFilter.schema)
     annotate = False
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ec2').get_permissions()
@@ -453,6 +457,7 @@ class SSLPolicyFilter(Filter):
             }
         }
     permissions = ("elasticloadbalancing:DescribeLoadBalancerPolicies",)
+    cost = REMOTE_COST
 
     def validate(self):
         if 'whitelist' in self.data and 'blacklist' in self.data:
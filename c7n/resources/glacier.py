@@ -13,7 +13,7 @@
 # limitations under the License.
 from botocore.exceptions import ClientError
 
-from c7n.filters import CrossAccountAccessFilter
+from c7n.filters import CrossAccountAccessFilter, REMOTE_COST
 from c7n.query import QueryResourceManager
 from c7n.manager import resources
 from c7n.utils import local_session
@@ -52,6 +52,7 @@ class GlacierCrossAccountAccessFilter(CrossAccountAccessFilter):
                       - permitted-account-02
     """
     permissions = ('glacier:GetVaultAccessPolicy',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         def _augment(r):
@@ -22,7 +22,7 @@ import time
 from botocore.exceptions import ClientError
 
 from c7n.actions import BaseAction
-from c7n.filters import ValueFilter, Filter, OPERATORS
+from c7n.filters import ValueFilter, Filter, OPERATORS, REMOTE_COST
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.utils import local_session, type_schema, chunks
@@ -133,6 +133,7 @@ class ServerCertificate(QueryResourceManager):
 
 
 class IamRoleUsage(Filter):
+    cost = REMOTE_COST
 
     def get_permissions(self):
         perms = list(itertools.chain([
@@ -239,6 +240,7 @@ class IamRoleInlinePolicy(Filter):
 
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
     permissions = ('iam:ListRolePolicies',)
+    cost = REMOTE_COST
 
     def _inline_policies(self, client, resource):
         return len(client.list_role_policies(
@@ -319,6 +321,7 @@ class AllowAllIamPolicies(Filter):
     """
     schema = type_schema('has-allow-all')
     permissions = ('iam:ListPolicies', 'iam:ListPolicyVersions')
+    cost = REMOTE_COST
 
     def has_allow_all_policy(self, client, resource):
         statements = client.get_policy_version(
@@ -483,6 +486,7 @@ class CredentialReport(Filter):
 
     permissions = ('iam:GenerateCredentialReport',
                    'iam:GetCredentialReport')
+    cost = REMOTE_COST
 
     def get_value_or_schema_default(self, k):
         if k in self.data:
@@ -606,6 +610,7 @@ class UserPolicy(ValueFilter):
 
     schema = type_schema('policy', rinherit=ValueFilter.schema)
     permissions = ('iam:ListAttachedUserPolicies',)
+    cost = REMOTE_COST
 
     def user_policies(self, user_set):
         client = local_session(self.manager.session_factory).client('iam')
@@ -653,6 +658,7 @@ class UserAccessKey(ValueFilter):
 
     schema = type_schema('access-key', rinherit=ValueFilter.schema)
     permissions = ('iam:ListAccessKeys',)
+    cost = REMOTE_COST
 
     def user_keys(self, user_set):
         client = local_session(self.manager.session_factory).client('iam')
@@ -681,6 +687,7 @@ class UserMfaDevice(ValueFilter):
 
     schema = type_schema('mfa-device', rinherit=ValueFilter.schema)
     permissions = ('iam:ListMfaDevices',)
+    cost = REMOTE_COST
 
     def __init__(self, *args, **kw):
         super(UserMfaDevice, self).__init__(*args, **kw)
@@ -760,6 +767,7 @@ class IamGroupUsers(Filter):
     """
     schema = type_schema('has-users', value={'type': 'boolean'})
     permissions = ('iam:GetGroup',)
+    cost = REMOTE_COST
 
     def _user_count(self, client, resource):
         return len(client.get_group(GroupName=resource['GroupName'])['Users'])
@@ -782,6 +790,7 @@ class IamGroupInlinePolicy(Filter):
     """
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
     permissions = ('iam:ListGroupPolicies',)
+    cost = REMOTE_COST
 
     def _inline_policies(self, client, resource):
         return len(client.list_group_policies(
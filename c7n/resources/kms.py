@@ -13,7 +13,8 @@
 # limitations under the License.
 import logging
 
-from c7n.filters import Filter, CrossAccountAccessFilter, ValueFilter
+from c7n.filters import (
+    Filter, CrossAccountAccessFilter, ValueFilter, REMOTE_COST)
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.utils import local_session, type_schema
@@ -79,6 +80,7 @@ class KeyRotationStatus(ValueFilter):
 
     schema = type_schema('key-rotation-status', rinherit=ValueFilter.schema)
     permissions = ('kms:GetKeyRotationStatus',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
 
@@ -113,6 +115,7 @@ class KMSCrossAccountAccessFilter(CrossAccountAccessFilter):
                   - type: cross-account
     """
     permissions = ('kms:GetKeyPolicy',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         def _augment(r):
@@ -153,6 +156,7 @@ class GrantCount(Filter):
     schema = type_schema(
         'grant-count', min={'type': 'integer', 'minimum': 0})
     permissions = ('kms:ListGrants',)
+    cost = REMOTE_COST
 
     def process(self, keys, event=None):
         with self.executor_factory(max_workers=3) as w:
@@ -180,6 +184,7 @@ class GrantCount(Filter):
 class ResourceKmsKeyAlias(ValueFilter):
 
     schema = type_schema('kms-alias', rinherit=ValueFilter.schema)
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return KeyAlias(self.manager.ctx, {}).get_permissions()
@@ -57,13 +57,13 @@ from c7n.actions import (
     ActionRegistry, BaseAction, AutoTagUser, ModifyVpcSecurityGroupsAction)
 from c7n.filters import (
     CrossAccountAccessFilter, FilterRegistry, Filter, AgeFilter, OPERATORS,
-    FilterValidationError)
+    FilterValidationError, REMOTE_COST)
 
 from c7n.filters.health import HealthEventFilter
 import c7n.filters.vpc as net_filters
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
-from c7n import tags
+from c7n import ratelimit, tags
 from c7n.utils import (
     local_session, type_schema,
     get_retry, chunks, generate_arn, snapshot_identifier)
@@ -153,7 +153,8 @@ def _rds_tags(
         return db
 
     # Rds maintains a low api call limit, so this can take some time :-(
-    with executor_factory(max_workers=1) as w:
+    with executor_factory(
+            max_workers=ratelimit.get_workers(session_factory, 'rds')) as w:
         return list(w.map(process_tags, dbs))
 
 
@@ -398,6 +399,7 @@ class UpgradeAvailable(Filter):
                          major={'type': 'boolean'},
                          value={'type': 'boolean'})
     permissions = ('rds:DescribeDBEngineVersions',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         client = local_session(self.manager.session_factory).client('rds')
@@ -861,7 +863,8 @@ def _rds_snap_tags(
         snap['Tags'] = tag_list or []
         return snap
 
-    with executor_factory(max_workers=1) as w:
+    with executor_factory(
+            max_workers=ratelimit.get_workers(session_factory, 'rds')) as w:
         return filter(None, (w.map(process_tags, snaps)))
 
 
@@ -1012,6 +1015,7 @@ class RDSSnapshotRemoveTag(tags.RemoveTag):
 class CrossAccountAccess(CrossAccountAccessFilter):
 
     permissions = ('rds:DescribeDBSnapshotAttributes',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         self.accounts = self.get_accounts()
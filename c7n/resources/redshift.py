@@ -20,7 +20,8 @@ from concurrent.futures import as_completed
 
 from c7n.actions import ActionRegistry, BaseAction, ModifyVpcSecurityGroupsAction
 from c7n.filters import (
-    FilterRegistry, ValueFilter, DefaultVpcBase, AgeFilter, OPERATORS)
+    FilterRegistry, ValueFilter, DefaultVpcBase, AgeFilter, OPERATORS,
+    REMOTE_COST)
 import c7n.filters.vpc as net_filters
 
 from c7n.manager import resources
@@ -141,6 +142,7 @@ class Parameter(ValueFilter):
     group_params = ()
 
     permissions = ("redshift:DescribeClusterParameters",)
+    cost = REMOTE_COST
 
     def process(self, clusters, event=None):
         groups = {}
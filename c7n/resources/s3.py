@@ -53,7 +53,8 @@ from concurrent.futures import as_completed
 
 from c7n.actions import ActionRegistry, BaseAction, AutoTagUser
 from c7n.filters import (
-    FilterRegistry, Filter, CrossAccountAccessFilter, MetricsFilter)
+    FilterRegistry, Filter, CrossAccountAccessFilter, MetricsFilter,
+    REMOTE_COST)
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.tags import RemoveTag, Tag, TagActionFilter, TagDelayedAction
@@ -1278,6 +1279,7 @@ class LogTarget(Filter):
             's3', 'elb', 'cloudtrail']}},
         self={'type': 'boolean'},
         value={'type': 'boolean'})
+    cost = REMOTE_COST
 
     def get_permissions(self):
         perms = self.manager.get_resource_manager('elb').get_permissions()
@@ -21,7 +21,7 @@ import jmespath
 
 from c7n.actions import BaseAction, ModifyVpcSecurityGroupsAction
 from c7n.filters import (
-    DefaultVpcBase, Filter, FilterValidationError, ValueFilter)
+    DefaultVpcBase, Filter, FilterValidationError, ValueFilter, REMOTE_COST)
 import c7n.filters.vpc as net_filters
 from c7n.filters.revisions import Diff
 from c7n.query import QueryResourceManager
@@ -95,6 +95,7 @@ class FlowLogFilter(Filter):
            'log-group': {'type': 'string'}})
 
     permissions = ('ec2:DescribeFlowLogs',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         client = local_session(self.manager.session_factory).client('ec2')
@@ -377,6 +378,7 @@ class SecurityGroupPatch(object):
 
 
 class SGUsage(Filter):
+    cost = REMOTE_COST
 
     def get_permissions(self):
         return list(itertools.chain(
@@ -537,6 +539,7 @@ class Stale(Filter):
     """
     schema = type_schema('stale')
     permissions = ('ec2:DescribeStaleSecurityGroups',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         client = local_session(self.manager.session_factory).client('ec2')
@@ -1123,6 +1126,7 @@ class AclAwsS3Cidrs(Filter):
         present={'type': 'boolean', 'default': False})
 
     permissions = ('ec2:DescribePrefixLists',)
+    cost = REMOTE_COST
 
     def process(self, resources, event=None):
         ec2 = local_session(self.manager.session_factory).client('ec2')
@@ -0,0 +1,172 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Concurrent policy execution.
+
+Pull mode policies spend most of their time waiting on the network,
+the scheduler runs independent policies concurrently on a thread or
+process pool from :py:mod:`c7n.executor`, while capping the number of
+policies in flight against any one service. The cap is the worker
+count the service's api rate limiter allows, see
+:py:func:`c7n.ratelimit.get_workers`, unless one is given. Rate
+limiters are per process, with the process executor the parent sees
+no throttling, so the cap stays at the limiter's maximum there.
+
+Policies querying the same resources share them via the run's
+:py:class:`c7n.planner.QueryPlanner`, which lives in process. With the
+process executor such policies are submitted together as one unit of
+work, and run one after the other in a single worker, so they share a
+single fetch at the cost of running serially. Service caps count
+units rather than policies.
+"""
+from collections import Counter, OrderedDict
+import logging
+
+from botocore.exceptions import UnknownServiceError
+import botocore.session
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from c7n import ratelimit
+from c7n.executor import executors
+
+log = logging.getLogger('custodian.scheduler')
+
+
+class PolicyScheduler(object):
+
+    def __init__(self, workers=2, executor='thread', service_concurrency=None,
+                 debug=False):
+        self.workers = workers
+        self.executor = executor
+        self.service_concurrency = service_concurrency
+        self.debug = debug
+        self.endpoints = {}
+
+    def get_units(self, policies):
+        """Group the policies into units of work, run on one worker."""
+        if self.executor != 'process':
+            return [[p] for p in policies]
+        from c7n.planner import QueryPlanner
+        units = OrderedDict()
+        for p in policies:
+            units.setdefault(QueryPlanner.get_policy_key(p), []).append(p)
+        for unit in units.values():
+            if len(unit) > 1:
+                log.debug(
+                    "Running policies %s serially in one worker, "
+                    "sharing their resources",
+                    ", ".join([p.name for p in unit]))
+        return units.values()
+
+    def get_service(self, policy):
+        """Api endpoint prefix of the service a policy queries.
+
+        As named by rate limiters, ie. elasticloadbalancing for elb.
+        """
+        model = policy.resource_manager.get_model()
+        service = getattr(model, 'service', policy.resource_type)
+        if service not in self.endpoints:
+            try:
+                self.endpoints[service] = botocore.session.get_session(
+                ).get_service_model(service).endpoint_prefix
+            except UnknownServiceError:
+                self.endpoints[service] = service
+        return self.endpoints[service]
+
+    def get_service_limit(self, policy, service):
+        if self.service_concurrency:
+            return max(1, self.service_concurrency)
+        return ratelimit.get_workers(
+            getattr(policy, 'session_factory', None), service)
+
+    def submit(self, w, unit):
+        if self.executor == 'process':
+            return w.submit(
+                run_policies, [(p.data, p.options) for p in unit],
+                self.debug)
+        return w.submit(unit[0])
+
+    def run(self, policies):
+        """Run the policies, returning a list of (policy, error) failures.
+
+        With the process executor, errors are logged by the worker and
+        returned as their message.
+        """
+        pending = self.get_units(policies)
+        running = {}
+        in_flight = Counter()
+        failures = []
+        factory = executors.get(self.executor)
+
+        with factory(max_workers=self.workers) as w:
+            while pending or running:
+                for unit in list(pending):
+                    if len(running) >= self.workers:
+                        break
+                    service = self.get_service(unit[0])
+                    if in_flight[service] >= self.get_service_limit(
+                            unit[0], service):
+                        continue
+                    pending.remove(unit)
+                    in_flight[service] += 1
+                    running[self.submit(w, unit)] = (unit, service)
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for f in done:
+                    unit, service = running.pop(f)
+                    in_flight[service] -= 1
+                    failures.extend(self.get_failures(f, unit))
+        return failures
+
+    def get_failures(self, f, unit):
+        try:
+            result = f.result()
+        except Exception as e:
+            if self.debug:
+                raise
+            log.exception(
+                "Error while executing policy %s, continuing",
+                ", ".join([p.name for p in unit]))
+            return [(p, e) for p in unit]
+        if self.executor != 'process':
+            return []
+        policies = dict([(p.name, p) for p in unit])
+        return [(policies[name], error) for name, error in result]
+
+
+def run_policies(policies, debug=False):
+    """Process pool entry point, policies are rebuilt in the worker.
+
+    The policies of a unit query the same resources, and share them via
+    a query planner local to the worker. Returns (policy name, error
+    message) failures, as not all exceptions pickle.
+    """
+    from c7n.planner import QueryPlanner
+    from c7n.policy import Policy
+    policies = [Policy(data, options) for data, options in policies]
+    planner = QueryPlanner()
+    planner.plan(policies)
+    failures = []
+    try:
+        for p in policies:
+            try:
+                p()
+            except Exception as e:
+                if debug:
+                    raise
+                log.exception(
+                    "Error while executing policy %s, continuing", p.name)
+                failures.append((p.name, str(e)))
+    finally:
+        planner.clear()
+    return failures
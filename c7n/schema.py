@@ -155,7 +155,10 @@ def generate(resource_types=()):
                 'description': {'type': 'string'},
                 'tags': {'type': 'array', 'items': {'type': 'string'}},
                 'mode': {'$ref': '#/definitions/policy-mode'},
-                'source': {'enum': ['describe', 'config']},
+                'source': {'enum': [
+                    'describe', 'config', 'config-snapshot', 'snapshot']},
+                'stream': {'type': 'boolean'},
+                'columnar': {'type': 'boolean'},
                 'actions': {
                     'type': 'array',
                 },
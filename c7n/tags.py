@@ -179,6 +179,8 @@ class TagActionFilter(Filter):
         op={'type': 'string'})
 
     current_date = None
+    streamable = True
+    annotates = False
 
     def validate(self):
         op = self.data.get('op')
@@ -191,12 +193,7 @@ class TagActionFilter(Filter):
         op = self.data.get('op', 'stop')
         skew = self.data.get('skew', 0)
 
-        v = None
-        for n in i.get('Tags', ()):
-            if n['Key'] == tag:
-                v = n['Value']
-                break
-
+        v = utils.get_tag_map(i).get(tag)
         if v is None:
             return False
         if ':' not in v or '@' not in v:
@@ -242,6 +239,9 @@ class TagCountFilter(Filter):
         count={'type': 'integer', 'minimum': 0},
         op={'enum': OPERATORS.keys()})
 
+    streamable = True
+    annotates = False
+
     def __call__(self, i):
         count = self.data.get('count', 10)
         op_name = self.data.get('op', 'gte')
@@ -427,7 +427,7 @@ class RenameTag(Action):
         old_key = self.data.get('old_key', None)
         resource_set = {}
         for r in instances:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.get_tag_map(r)
             if tags[old_key] not in resource_set:
                 resource_set[tags[old_key]] = []
             resource_set[tags[old_key]].append(r)
@@ -437,7 +437,7 @@ class RenameTag(Action):
         old_key = self.data.get('old_key', None)
         res = 0
         for r in resources:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.get_tag_map(r)
             if old_key not in tags.keys():
                 resources.pop(res)
             res += 1
@@ -625,7 +625,7 @@ class NormalizeTag(Action):
         key = self.data.get('key', None)
         resource_set = {}
         for r in instances:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.get_tag_map(r)
             if tags[key] not in resource_set:
                 resource_set[tags[key]] = []
             resource_set[tags[key]].append(r)
@@ -635,7 +635,7 @@ class NormalizeTag(Action):
         key = self.data.get('key', None)
         res = 0
         for r in resources:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.get_tag_map(r)
             if key not in tags.keys():
                 resources.pop(res)
             res += 1
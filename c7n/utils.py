@@ -23,6 +23,9 @@ import random
 import threading
 import time
 import ipaddress
+import zlib
+
+from c7n import profiler, ratelimit
 
 # Try to place nice in lambda exec environment
 # where we don't require yaml
@@ -70,6 +73,36 @@ def dumps(data, fh=None, indent=0):
         return json.dumps(data, cls=DateTimeEncoder, indent=indent)
 
 
+def dump_records(records, fh):
+    """Write records to a file as newline delimited json.
+
+    Records are serialized one at a time, so the whole set is never
+    held in memory as a single string.
+    """
+    encode = DateTimeEncoder().encode
+    for r in records:
+        fh.write(encode(r))
+        fh.write('\n')
+
+
+def load_records(contents):
+    """Load records from a json list or newline delimited json.
+
+    Contents may be gzip compressed, as written to s3 outputs.
+    """
+    if contents[:2] == '\x1f\x8b':
+        contents = zlib.decompress(contents, 16 + zlib.MAX_WBITS)
+    try:
+        records = json.loads(contents)
+    except ValueError:
+        # Only the first record parses, before the next line's.
+        return [json.loads(l) for l in contents.splitlines() if l.strip()]
+    if isinstance(records, dict):
+        # Newline delimited, with a single record.
+        return [records]
+    return records
+
+
 def format_event(evt):
     io = StringIO()
     json.dump(evt, io, indent=2)
@@ -167,6 +200,69 @@ def camelResource(obj):
     return obj
 
 
+class TagList(list):
+    """A resource's tag list with lazily built key indexes.
+
+    Tag lookups by key are frequent (value filters, offhours, tag
+    actions, reports) and each previously scanned the tag list. The
+    indexes are built once on first lookup, in case sensitive and
+    lowercase key variants, and invalidated if the list is modified.
+    """
+
+    _maps = None
+
+    def __reduce__(self):
+        # Indexes are rebuilt on demand, don't serialize them
+        return (TagList, (list(self),))
+
+    def get_map(self, lower=False):
+        if self._maps is None:
+            tag_map, lower_map = {}, {}
+            for t in self:
+                k = t.get('Key')
+                if k is None:
+                    continue
+                # First match wins, as with a linear scan
+                if k not in tag_map:
+                    tag_map[k] = t.get('Value')
+                if k.lower() not in lower_map:
+                    lower_map[k.lower()] = t.get('Value')
+            self._maps = (tag_map, lower_map)
+        return self._maps[lower and 1 or 0]
+
+
+def _invalidating(name):
+    method = getattr(list, name)
+
+    def _invalidate(self, *args):
+        self._maps = None
+        return method(self, *args)
+    _invalidate.__name__ = name
+    return _invalidate
+
+
+for _name in ('append', 'extend', 'insert', 'remove', 'pop', 'sort',
+              'reverse', '__setitem__', '__delitem__', '__setslice__',
+              '__delslice__', '__iadd__'):
+    if hasattr(list, _name):
+        setattr(TagList, _name, _invalidating(_name))
+
+
+def get_tag_map(resource, lower=False):
+    """Return a mapping of tag key to value for a resource.
+
+    With lower, keys are lowercased. The resource's tag list is
+    converted in place to a :py:class:`TagList` so the mapping is built
+    once and shared by all consumers. Callers must not modify it.
+    """
+    tags = resource.get('Tags')
+    if not tags or not isinstance(tags, list):
+        return {}
+    if not isinstance(tags, TagList):
+        tags = resource['Tags'] = TagList(tags)
+    return tags.get_map(lower)
+
+
 def get_account_id_from_sts(session):
     response = session.client('sts').get_caller_identity()
     return response.get('Account')
@@ -186,14 +282,65 @@ def query_instances(session, client=None, **query):
 CONN_CACHE = threading.local()
 
 
+class ClientPoolSession(object):
+    """Session wrapper reusing the clients created through it.
+
+    Constructing a client resolves its endpoint and loads its service
+    model, which adds up when every resource set asks for a fresh one.
+    Clients are pooled by their creation parameters for the lifetime of
+    the session, they share its credentials so pick up any refresh.
+    Clients created with explicit credentials are not pooled.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, k):
+        return getattr(self.session, k)
+
+    def get_client_key(self, service_name, args, kw):
+        if [k for k in kw if k.startswith('aws_')]:
+            return None
+        kw = dict(kw)
+        config = kw.pop('config', None)
+        if config is not None:
+            kw['config'] = tuple(sorted(
+                config._user_provided_options.items()))
+        key = (service_name, args, tuple(sorted(kw.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def client(self, service_name, *args, **kw):
+        key = self.get_client_key(service_name, args, kw)
+        if key is None:
+            return self.session.client(service_name, *args, **kw)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = self.session.client(
+                    service_name, *args, **kw)
+        return client
+
+
 def local_session(factory):
-    """Cache a session thread local for up to 45m"""
+    """Cache a session thread local for up to 45m
+
+    Clients are pooled on the session, see :py:class:`ClientPoolSession`,
+    their api calls rate limited via :py:mod:`c7n.ratelimit` and recorded
+    to policy profiles via :py:mod:`c7n.profiler`.
+    """
     s = getattr(CONN_CACHE, 'session', None)
     t = getattr(CONN_CACHE, 'time', 0)
     n = time.time()
     if s is not None and t + (60 * 45) > n:
         return s
-    s = factory()
+    s = ClientPoolSession(profiler.profile_session(ratelimit.limit_session(
+        factory(), getattr(factory, 'account_id', None))))
     CONN_CACHE.session = s
     CONN_CACHE.time = n
     return s
@@ -17,7 +17,10 @@ from unittest import TestCase
 from c7n import cache
 from argparse import Namespace
 import cPickle
+import os
+import shutil
 import tempfile
+import threading
 import mock
 
 
@@ -32,10 +35,23 @@ class TestCache(TestCase):
             cache_period=60,
             cache='test-cloud-custodian.cache',
         )
+        c = cache.factory(test_config)
+        self.assertIsInstance(c, cache.TieredCache)
+        self.assertIsInstance(c.persistent, cache.SqlKvCache)
+        test_config.cache_backend = 'memory'
+        self.assertIsInstance(
+            cache.factory(test_config),
+            cache.MemoryCache,
+        )
+        test_config.cache_backend = 'file'
+        test_config.cache_memory_size = 0
         self.assertIsInstance(
             cache.factory(test_config),
             cache.FileCacheManager,
         )
+        test_config.cache_backend = 'xyz'
+        self.assertRaises(ValueError, cache.factory, test_config)
+        test_config.cache_backend = None
         test_config.cache = None
         self.assertIsInstance(
             cache.factory(test_config),
@@ -141,3 +157,148 @@ class FileCacheManagerTest(TestCase):
         self.assertEquals(mock_mkdir.call_count, 1)
         self.assertEquals(mock_dump.call_count, 1)
         self.assertEquals(mock_dumps.call_count, 1)
+
+
+class SqlKvCacheTest(TestCase):
+
+    def get_cache(self, period=60):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        return cache.SqlKvCache(Namespace(
+            cache_period=period,
+            cache=os.path.join(temp_dir, 'sub', 'c7n.cache')))
+
+    def test_get_set(self):
+        c = self.get_cache()
+        self.assertTrue(c.load())
+        k1 = {'region': 'us-west-2', 'resource': 'ec2'}
+        self.assertEqual(c.get(k1), None)
+        c.save(k1, range(5))
+        k2 = {'region': 'eu-west-1', 'resource': 'asg'}
+        c.save(k2, range(2))
+        self.assertEqual(c.get(k1), range(5))
+        self.assertEqual(c.get(k2), range(2))
+
+        c2 = cache.SqlKvCache(c.config)
+        self.assertTrue(c2.load())
+        self.assertEqual(c2.get(k1), range(5))
+        c2.save(k1, range(3))
+        self.assertEqual(c.get(k1), range(3))
+
+    def test_equal_keys(self):
+        c = self.get_cache()
+        k1 = dict([(1, 'ec2'), (9, 'us-east-1')])
+        k2 = dict([(9, 'us-east-1'), (1, 'ec2')])
+        self.assertNotEqual(list(k1), list(k2))
+        c.save(k1, [1])
+        self.assertEqual(c.get(k2), [1])
+
+    def test_expiry(self):
+        c = self.get_cache(period=1)
+        c.save('abc', [1])
+        c.save('def', [2])
+        self.assertEqual(c.get('abc'), [1])
+        future = cache.time.time() + 120
+        with mock.patch.object(cache.time, 'time') as mock_time:
+            mock_time.return_value = future
+            self.assertEqual(c.get('abc'), None)
+            c.expire()
+        self.assertEqual(c.get('abc'), None)
+
+        # Expired entries are removed on load
+        c.save('abc', [1])
+        c2 = cache.SqlKvCache(c.config)
+        with mock.patch.object(cache.time, 'time') as mock_time:
+            mock_time.return_value = future
+            self.assertTrue(c2.load())
+        with c2._connect() as conn:
+            self.assertEqual(
+                conn.execute('select count(*) from c7n_cache').fetchone(),
+                (0,))
+
+    def test_legacy_pickle_kept(self):
+        c = self.get_cache()
+        legacy_path = c.cache_path
+        os.makedirs(os.path.dirname(legacy_path))
+        with open(legacy_path, 'wb') as fh:
+            cPickle.dump({'a': 1}, fh, protocol=2)
+        self.assertTrue(c.load())
+        c.save('xyz', 1)
+        self.assertEqual(c.get('xyz'), 1)
+        self.assertEqual(c.cache_path, legacy_path + '.sqlite')
+        with open(legacy_path, 'rb') as fh:
+            self.assertEqual(cPickle.load(fh), {'a': 1})
+
+        c2 = cache.SqlKvCache(c.config)
+        self.assertEqual(c2.get('xyz'), 1)
+
+    def test_threads(self):
+        c = self.get_cache()
+        c.load()
+
+        def writer(idx):
+            for i in range(10):
+                c.save(('key', idx, i), [idx, i])
+
+        threads = [threading.Thread(target=writer, args=(i,))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(c.get(('key', 3, 9)), [3, 9])
+
+
+class MemoryCacheTest(TestCase):
+
+    def test_lru_eviction(self):
+        store = cache.LRUStore(100)
+        store.set('a', 'x' * 40, 0)
+        store.set('b', 'x' * 40, 0)
+        store.get('a')
+        store.set('c', 'x' * 40, 0)
+        self.assertEqual(store.get('b'), None)
+        self.assertTrue(store.get('a'))
+        self.assertEqual(store.size, 80)
+        self.assertFalse(store.set('d', 'x' * 101, 0))
+        self.assertEqual(
+            store.stats(),
+            {'entries': 2, 'size': 80, 'max_size': 100,
+             'hits': 2, 'misses': 1, 'evictions': 1})
+
+    def test_shared_store(self):
+        config = Namespace(
+            cache_period=60, cache='memory-test', cache_memory_size=1024)
+        c1 = cache.MemoryCache(config)
+        c1.save('key', {'a': 1})
+        value = cache.MemoryCache(config).get('key')
+        self.assertEqual(value, {'a': 1})
+        # values are copies
+        value['b'] = 2
+        self.assertEqual(c1.get('key'), {'a': 1})
+
+    def test_tiered(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        config = Namespace(
+            cache_period=60, cache=os.path.join(temp_dir, 'c7n.cache'))
+        c = cache.factory(config)
+        self.assertTrue(c.load())
+        c.save('key', range(3))
+        self.assertEqual(c.get('key'), range(3))
+        self.assertEqual(c.stats()['hits'], 1)
+
+        # populate memory tier from the persistent tier
+        c.memory.store.discard(cPickle.dumps('key', protocol=2))
+        self.assertEqual(c.get('key'), range(3))
+        self.assertEqual(c.memory.get('key'), range(3))
+
+        # promoted entries expire with the persisted entry's age
+        c.memory.store.discard(cPickle.dumps('key', protocol=2))
+        created = c.persistent.get_entry('key')[1]
+        with mock.patch.object(cache.time, 'time') as mock_time:
+            mock_time.return_value = created + 50 * 60
+            self.assertEqual(c.get('key'), range(3))
+            mock_time.return_value = created + 61 * 60
+            self.assertEqual(c.get('key'), None)
+            self.assertEqual(c.memory.get('key'), None)
@@ -0,0 +1,162 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import copy
+from datetime import datetime, timedelta
+import unittest
+
+from dateutil import tz
+
+from c7n.filters import columnar
+from c7n.resources.ec2 import filters
+
+from common import Bag
+
+
+def get_resources():
+    now = datetime.now(tz=tz.tzutc())
+    values = [
+        'a', 'b', u'c', '', 0, 1, 2.5, -3, True, False, None,
+        2 ** 60, ['a', 'b'], [], {'x': 1}, {},
+        now - timedelta(days=10), now - timedelta(days=1),
+        now + timedelta(days=5), datetime(2017, 1, 1), '2017-01-01']
+    dates = [v for v in values if isinstance(v, datetime) and v.tzinfo] + [
+        '2017-01-01T00:00:00Z']
+    resources = []
+    for i in range(len(values) * 2):
+        r = {'Id': i, 'Value': values[i % len(values)],
+             'Nested': {'Value': values[-(i % len(values)) - 1]},
+             'Date': dates[i % len(dates)]}
+        if i % 3 == 0:
+            r.pop('Value')
+        resources.append(r)
+    return resources
+
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        if columnar.numpy is None:
+            self.skipTest("numpy not installed")
+        self.patch(columnar.ColumnarFilters, 'min_resources', 0)
+
+    def patch(self, obj, attr, value):
+        original = getattr(obj, attr)
+        setattr(obj, attr, value)
+        self.addCleanup(setattr, obj, attr, original)
+
+    def assertColumnar(self, *data):
+        fs = [filters.factory(d, Bag(data={})) for d in data]
+        groups = columnar.plan(fs)
+        self.assertEqual(len(groups), 1)
+        self.assertTrue(isinstance(groups[0], columnar.ColumnarFilters))
+
+        resources = get_resources()
+        expected = copy.deepcopy(resources)
+        for f in fs:
+            expected = f.process(expected)
+        results = groups[0].process(resources)
+        self.assertEqual(results, expected)
+        return results
+
+    def test_plan(self):
+        fs = [filters.factory(d) for d in (
+            {'Value': 'a'},
+            {'type': 'value', 'key': 'Value', 'op': 'gt', 'value': 1},
+            {'type': 'value', 'key': 'Value', 'value': 'absent'},
+            {'type': 'value', 'key': 'Value', 'op': 'regex',
+             'value': 'a.*'},
+            {'type': 'value', 'key': 'Value', 'value_type': 'age',
+             'op': 'gt', 'value': 1},
+            {'type': 'value', 'key': 'Value', 'value_type': 'size',
+             'op': 'gt', 'value': 1},
+            {'type': 'instance-age', 'days': 1})]
+        groups = columnar.plan(fs)
+        self.assertEqual(
+            [isinstance(g, columnar.ColumnarFilters) and len(g.filters)
+             for g in groups],
+            [2, False, False, 1, False, False])
+
+    def test_strings(self):
+        self.assertColumnar({'Value': 'a'})
+        self.assertColumnar(
+            {'type': 'value', 'key': 'Value', 'value': 'b', 'op': 'ne'})
+        self.assertColumnar(
+            {'type': 'value', 'key': 'Nested.Value', 'value': 'c'})
+
+    def test_numbers(self):
+        for op in ('eq', 'ne', 'gt', 'ge', 'lt', 'le'):
+            self.assertColumnar(
+                {'type': 'value', 'key': 'Value', 'value': 1, 'op': op})
+        results = self.assertColumnar(
+            {'type': 'value', 'key': 'Value', 'value': 0, 'op': 'gt'},
+            {'type': 'value', 'key': 'Nested.Value', 'value': 2,
+             'op': 'lt'})
+        self.assertTrue(results)
+        self.assertEqual(
+            results[0]['MatchedFilters'], ['Value', 'Nested.Value'])
+
+    def test_sets(self):
+        for op in ('in', 'ni', 'not-in'):
+            self.assertColumnar(
+                {'type': 'value', 'key': 'Value', 'op': op,
+                 'value': ['a', 'c', 1, 2.5, None]})
+            self.assertColumnar(
+                {'type': 'value', 'key': 'Value', 'op': op,
+                 'value': [True, 0, u'b']})
+
+    def test_dates(self):
+        for vtype in ('age', 'expiration'):
+            for op in ('gt', 'lt'):
+                self.assertColumnar(
+                    {'type': 'value', 'key': 'Date', 'op': op,
+                     'value_type': vtype, 'value': 3})
+
+    def test_selected_only(self):
+        resources = get_resources()
+        fs = [filters.factory(d, Bag(data={})) for d in (
+            {'type': 'value', 'key': 'Id', 'op': 'lt', 'value': 4},
+            {'type': 'value', 'key': 'Value', 'value': 'b'},
+            {'type': 'value', 'key': 'Nested.Value', 'op': 'ne',
+             'value': 'c'})]
+        fs[1].annotate = False
+        evaluated = []
+        getter = columnar.value_getter
+
+        def value_getter(f):
+            get_value = getter(f)
+
+            def record(r):
+                evaluated.append((f.k, r['Id']))
+                return get_value(r)
+            return record
+
+        self.patch(columnar, 'value_getter', value_getter)
+        [group] = columnar.plan(fs)
+        self.assertEqual([r['Id'] for r in group.process(resources)], [1])
+        self.assertEqual(evaluated, [
+            ('Id', i) for i in range(len(resources))] + [
+            ('Value', i) for i in range(4)] + [('Nested.Value', 1)])
+        self.assertEqual(resources[0]['MatchedFilters'], ['Id'])
+        self.assertEqual(
+            resources[1]['MatchedFilters'], ['Id', 'Nested.Value'])
+        self.assertFalse('MatchedFilters' in resources[4])
+
+    def test_min_resources(self):
+        self.patch(columnar.ColumnarFilters, 'min_resources', 1000)
+        self.patch(columnar, 'Columns', None)
+        f = filters.factory({'Value': 'a'})
+        resources = get_resources()
+        self.assertEqual(
+            columnar.ColumnarFilters([f]).process(resources),
+            f.process(copy.deepcopy(resources)))
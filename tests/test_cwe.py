@@ -97,4 +97,50 @@ class CloudWatchEventsFacadeTest(TestCase):
             CloudWatchEvents.match(
                 event_data('event-cloud-trail-s3.json')),
             {'source': 's3.amazonaws.com',
+             'resource': 's3',
              'ids': jmespath.compile('detail.requestParameters.bucketName')})
+
+    def test_resource_events(self):
+        self.assertEqual(
+            CloudWatchEvents.get_resource_events('elb'),
+            ['CreateLoadBalancer', 'CreateLoadBalancerPolicy',
+             'SetLoadBalancerPoliciesOfListener'])
+        self.assertEqual(CloudWatchEvents.get_resource_events('sqs'), [])
+
+    def test_change_events(self):
+        self.assertEqual(
+            CloudWatchEvents.get_change_events('ebs'),
+            ['AttachVolume', 'CreateTags', 'CreateVolume', 'DeleteTags',
+             'DeleteVolume', 'DetachVolume'])
+
+        tags = {'detail': {
+            'eventName': 'CreateTags', 'eventSource': 'ec2.amazonaws.com',
+            'requestParameters': {'resourcesSet': {'items': [
+                {'resourceId': 'i-1'}, {'resourceId': 'vol-1'}]}}}}
+        self.assertEqual(
+            CloudWatchEvents.get_changes(tags, 'ebs'), (['vol-1'], False))
+        self.assertEqual(
+            CloudWatchEvents.get_changes(tags, 'ec2'), (['i-1'], False))
+        self.assertEqual(CloudWatchEvents.get_changes(tags, 's3'), None)
+
+        asg_tags = {'detail': {
+            'eventName': 'DeleteTags',
+            'eventSource': 'autoscaling.amazonaws.com',
+            'requestParameters': {'tags': [{'resourceId': 'web'}]}}}
+        self.assertEqual(
+            CloudWatchEvents.get_changes(asg_tags, 'asg'), (['web'], False))
+        self.assertEqual(CloudWatchEvents.get_changes(asg_tags, 'ec2'), None)
+
+        rds_tags = {'detail': {
+            'eventName': 'AddTagsToResource',
+            'eventSource': 'rds.amazonaws.com',
+            'requestParameters': {
+                'resourceName': 'arn:aws:rds:us-east-1:123:db:xyz'}}}
+        self.assertEqual(
+            CloudWatchEvents.get_changes(rds_tags, 'rds'), (['xyz'], False))
+
+        delete = {'detail': {
+            'eventName': 'DeleteBucket', 'eventSource': 's3.amazonaws.com',
+            'requestParameters': {'bucketName': 'xyz'}}}
+        self.assertEqual(
+            CloudWatchEvents.get_changes(delete, 's3'), (['xyz'], True))
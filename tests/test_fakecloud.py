@@ -0,0 +1,166 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+from botocore import endpoint
+from botocore.exceptions import ClientError
+
+from c7n import fakecloud
+from c7n.cache import NullCache
+from c7n.fakecloud import FakeCloud, FakeSessionFactory, TokenBucket
+from c7n.utils import Bag
+
+from common import BaseTest
+
+
+class Clock(object):
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCloudTest(BaseTest):
+
+    def setUp(self):
+        super(FakeCloudTest, self).setUp()
+        self.cleanUp()
+        self.addCleanup(self.cleanUp)
+        # Throttled calls are retried without botocore's backoff.
+        self.patch(endpoint, 'time', Bag(sleep=lambda s: None))
+
+    def get_session(self, **spec):
+        cloud = FakeCloud(spec, clock=Clock(1493596800))
+        return cloud, FakeSessionFactory(cloud)()
+
+    def test_describe_paginated(self):
+        cloud, session = self.get_session(
+            page_size=1000, fleet={'instances': 2500})
+        pages = session.client('ec2').get_paginator(
+            'describe_instances').paginate()
+        instances = [i for p in pages for r in p['Reservations']
+                     for i in r['Instances']]
+        self.assertEqual(len(instances), 2500)
+        self.assertEqual(
+            len(set([i['InstanceId'] for i in instances])), 2500)
+        self.assertEqual(cloud.calls[('ec2', 'DescribeInstances')], 3)
+
+    def test_resources_deterministic(self):
+        c1, s1 = self.get_session(seed=1, fleet={'volumes': 10})
+        c2, s2 = self.get_session(seed=1, fleet={'volumes': 10})
+        self.assertEqual(
+            s1.client('ec2').describe_volumes()['Volumes'],
+            s2.client('ec2').describe_volumes()['Volumes'])
+
+    def test_tags_and_filters(self):
+        cloud, session = self.get_session(fleet={'instances': 20})
+        client = session.client('ec2')
+        client.create_tags(
+            Resources=['i-%017x' % 3, 'i-%017x' % 5],
+            Tags=[{'Key': 'Team', 'Value': 'blue'}])
+        reservations = client.describe_instances(
+            Filters=[{'Name': 'tag:Team', 'Values': ['bl*']}])['Reservations']
+        self.assertEqual(
+            [r['Instances'][0]['InstanceId'] for r in reservations],
+            ['i-%017x' % 3, 'i-%017x' % 5])
+
+        client.delete_tags(
+            Resources=['i-%017x' % 3], Tags=[{'Key': 'Team'}])
+        reservations = client.describe_instances(
+            Filters=[{'Name': 'tag-key', 'Values': ['Team']}])['Reservations']
+        self.assertEqual(len(reservations), 1)
+
+        client.stop_instances(InstanceIds=['i-%017x' % 5])
+        self.assertEqual(
+            client.describe_instances(
+                InstanceIds=['i-%017x' % 5])['Reservations'][0][
+                    'Instances'][0]['State']['Name'],
+            'stopped')
+
+    def test_unanswered_operation(self):
+        cloud, session = self.get_session()
+        response = session.client('ec2').describe_tags()
+        self.assertEqual(response['Tags'], [])
+
+    def test_s3_listing(self):
+        cloud, session = self.get_session(
+            page_size=100, fleet={'buckets': 2, 'objects': 250})
+        client = session.client('s3')
+        self.assertEqual(
+            [b['Name'] for b in client.list_buckets()['Buckets']],
+            ['fake-bucket-00000', 'fake-bucket-00001'])
+        pages = list(client.get_paginator('list_objects_v2').paginate(
+            Bucket='fake-bucket-00001'))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sum([len(p['Contents']) for p in pages]), 250)
+        self.assertRaises(
+            ClientError, client.get_bucket_policy, Bucket='fake-bucket-00000')
+
+    def test_throttle(self):
+        cloud, session = self.get_session(
+            throttle=1.0, operations={'DescribeVpcs': {'throttle': 0}})
+        client = session.client('ec2')
+        self.assertEqual(len(client.describe_vpcs()['Vpcs']), 3)
+        with self.assertRaises(ClientError) as e:
+            client.describe_volumes()
+        self.assertEqual(
+            e.exception.response['Error']['Code'], 'RequestLimitExceeded')
+        # Retried by botocore
+        self.assertEqual(cloud.throttles[('ec2', 'DescribeVolumes')], 5)
+
+        cloud, session = self.get_session(throttle=1.0)
+        with self.assertRaises(ClientError) as e:
+            session.client('autoscaling').describe_auto_scaling_groups()
+        self.assertEqual(e.exception.response['Error']['Code'], 'Throttling')
+
+    def test_token_bucket(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+        self.assertEqual(
+            [bucket.take() for i in range(4)], [True, True, True, False])
+        clock.now += 1
+        self.assertEqual(
+            [bucket.take() for i in range(3)], [True, True, False])
+
+    def test_policy(self):
+        cloud = FakeCloud({'fleet': {'instances': 100}})
+        p = self.load_policy({
+            'name': 'ec2-owner',
+            'resource': 'ec2',
+            'filters': [{'tag:Owner': 'absent'}],
+            'actions': [{'type': 'tag', 'key': 'Owner', 'value': 'x'}]},
+            session_factory=FakeSessionFactory(cloud))
+        resources = p.run()
+        self.assertTrue(resources)
+        self.assertFalse(p.resource_manager.filter_resources(
+            p.resource_manager.resources()))
+        self.assertTrue(cloud.calls[('ec2', 'CreateTags')])
+
+    def test_policy_options(self):
+        spec = os.path.join(self.get_temp_dir(), 'fleet.yml')
+        with open(spec, 'w') as fh:
+            fh.write('account_id: "111111111111"\n')
+        self.addCleanup(fakecloud.clouds.clear)
+        p = self.load_policy(
+            {'name': 'ec2', 'resource': 'ec2'},
+            config={'fake_cloud': spec, 'account_id': None,
+                    'cache': os.path.join(self.get_temp_dir(), 'cache.db'),
+                    'cache_period': 10})
+        self.assertIsInstance(p.session_factory, FakeSessionFactory)
+        # Synthetic resources aren't cached for later real runs.
+        self.assertIsInstance(p.resource_manager._cache, NullCache)
+        self.assertEqual(p.session_factory.account_id, '111111111111')
+        self.assertEqual(len(p.resource_manager.resources()), 1000)
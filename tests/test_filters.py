@@ -16,7 +16,10 @@ from dateutil import tz
 from datetime import datetime, timedelta
 import unittest
 
+import mock
+
 from c7n import filters as base_filters
+from c7n.filters.offhours import OffHour
 from c7n.resources.ec2 import filters
 from c7n.utils import annotation
 from common import instance, event_data, Bag
@@ -128,6 +131,96 @@ class TestNotFilter(unittest.TestCase):
         self.assertEqual(len(f.process(results)), 0)
         """
 
+class RemoteFilter(base_filters.Filter):
+
+    permissions = ('ec2:DescribeInstanceAttribute',)
+    cost = base_filters.REMOTE_COST
+    annotates = False
+
+    def process(self, resources, event=None):
+        self.manager.seen.extend([r['InstanceId'] for r in resources])
+        return [r for r in resources if r.get('Remote')]
+
+
+class TestFilterPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = base_filters.FilterRegistry('test.filters')
+        self.registry.register('remote', RemoteFilter)
+        self.manager = Bag(
+            seen=[], get_model=lambda: Bag(id='InstanceId'))
+        self.resources = [
+            instance(InstanceId='i-1', Color='green', Remote=True),
+            instance(InstanceId='i-2', Color='blue', Remote=True),
+            instance(InstanceId='i-3', Color='blue')]
+
+    def parse(self, data):
+        return self.registry.parse(data, self.manager)
+
+    def test_cost(self):
+        remote, local, count = self.parse([
+            'remote', {'Color': 'green'},
+            {'type': 'value', 'value_type': 'resource_count',
+             'op': 'gt', 'value': 1}])
+        self.assertEqual(remote.get_cost(), base_filters.core.REMOTE_COST)
+        self.assertEqual(local.get_cost(), base_filters.core.LOCAL_COST)
+        self.assertFalse(remote.order_dependent)
+        self.assertTrue(count.order_dependent)
+        self.assertTrue(self.parse([
+            {'c7n:MatchedFilters': 'present'}])[0].order_dependent)
+
+        # Cost is declared, not inferred from permissions.
+        self.assertEqual(
+            base_filters.Filter({}).get_cost(), base_filters.LOCAL_COST)
+        self.assertEqual(
+            base_filters.MetricsFilter.cost, base_filters.REMOTE_COST)
+        self.assertEqual(OffHour.cost, base_filters.LOCAL_COST)
+
+    def test_plan_order(self):
+        fs = self.parse([
+            'remote', {'Color': 'green'},
+            {'type': 'value', 'value_type': 'resource_count',
+             'op': 'gt', 'value': 1},
+            'remote', {'Color': 'blue'}])
+        self.assertEqual(
+            base_filters.plan_filters(fs),
+            [fs[1], fs[0], fs[2], fs[4], fs[3]])
+
+    def test_and_local_first(self):
+        f = self.parse([{'and': ['remote', {'Color': 'green'}]}])[0]
+        self.assertEqual(
+            [r['InstanceId'] for r in f.process(self.resources)], ['i-1'])
+        self.assertEqual(self.manager.seen, ['i-1'])
+
+    def test_or_unmatched_only(self):
+        f = self.parse([{'or': ['remote', {'Color': 'green'}]}])[0]
+        self.assertEqual(
+            sorted([r['InstanceId'] for r in f.process(self.resources)]),
+            ['i-1', 'i-2'])
+        self.assertEqual(self.manager.seen, ['i-2', 'i-3'])
+
+    def test_or_keeps_annotations(self):
+        f = self.parse([{'or': [
+            {'Color': 'blue'}, {'InstanceId': 'i-2'}, 'remote']}])[0]
+        self.assertTrue(f.annotates)
+        self.assertEqual(
+            sorted([r['InstanceId'] for r in f.process(self.resources)]),
+            ['i-1', 'i-2', 'i-3'])
+        self.assertEqual(
+            annotation(self.resources[1], base_filters.ANNOTATION_KEY),
+            ['Color', 'InstanceId'])
+        # only the non annotating branch skips matched resources
+        self.assertEqual(self.manager.seen, ['i-1'])
+
+    def test_or_order_dependent(self):
+        f = self.parse([{'or': [
+            'remote',
+            {'type': 'value', 'value_type': 'resource_count',
+             'op': 'gt', 'value': 5}]}])[0]
+        self.assertEqual(len(f.process(self.resources)), 2)
+        self.assertEqual(self.manager.seen, ['i-1', 'i-2', 'i-3'])
+
+
 class TestValueFilter(unittest.TestCase):
 
     # TODO test_manager needs a valid session_factory object
@@ -168,6 +261,45 @@ class TestValueFilter(unittest.TestCase):
         self.assertEqual(res, (sentinel, 0))
 
 
+    def test_compile(self):
+        vf = filters.factory({
+            'type': 'value', 'key': 'LaunchTime',
+            'value_type': 'age', 'op': 'gt', 'value': 30})
+        matcher = vf.compile()
+        self.assertEqual(vf.k, 'LaunchTime')
+        self.assertTrue(matcher(instance(
+            LaunchTime=(datetime.now(tz.tzutc()) - timedelta(40)).isoformat())))
+        self.assertFalse(matcher(instance(
+            LaunchTime=(datetime.now(tz.tzutc()) - timedelta(20)).isoformat())))
+        self.assertFalse(matcher(None))
+
+        # compiled once per filter, process and match reuse it
+        vf.process([instance()])
+        self.assertEqual(vf._matcher, matcher)
+        vf.match(instance())
+        self.assertEqual(vf.get_matcher(), matcher)
+
+        with mock.patch.object(vf, 'compile') as compile:
+            vf.process([instance(), instance()])
+            vf.process([instance()])
+        self.assertFalse(compile.called)
+
+    def test_compile_tag_regex(self):
+        vf = filters.factory({
+            'type': 'value', 'key': 'tag:Name',
+            'value': '^web-.*', 'op': 'regex'})
+        matcher = vf.compile()
+        self.assertTrue(matcher(
+            instance(Tags=[{'Key': 'Name', 'Value': 'WEB-01'}])))
+        self.assertFalse(matcher(
+            instance(Tags=[{'Key': 'Name', 'Value': 'db-01'}])))
+        self.assertFalse(matcher(instance(Tags=[])))
+
+    def test_compile_literal_key(self):
+        vf = filters.factory({'c7n:matched-key': 'present'})
+        self.assertTrue(vf.match({'c7n:matched-key': 1}))
+
+
 class TestAgeFilter(unittest.TestCase):
 
     def test_age_filter(self):
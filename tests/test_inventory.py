@@ -0,0 +1,251 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import os
+
+from botocore.exceptions import ClientError
+
+from c7n.inventory import Inventory, load_events
+from c7n.utils import Bag
+
+from common import BaseTest
+
+
+class Clock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Source(object):
+
+    def __init__(self, resources):
+        self.resources = resources
+        self.calls = []
+
+    def get_resources(self, ids):
+        self.calls.append(ids)
+        if self.resources is None:
+            raise ClientError(
+                {'Error': {'Code': 'InvalidInstanceID.NotFound'}},
+                'DescribeInstances')
+        return [r for r in self.resources if r['InstanceId'] in ids]
+
+
+class Manager(object):
+
+    type = 'ec2'
+    source_type = 'describe'
+    log = logging.getLogger('custodian.test')
+
+    def __init__(self, resources):
+        self.config = Bag(account_id='123456789012', region='us-east-1')
+        self.source = Source(resources)
+
+    def get_model(self):
+        return Bag(id='InstanceId')
+
+    def augment_resources(self, resources):
+        return resources
+
+
+def run_event(instance_ids, time, region='us-east-1'):
+    return {
+        'time': time,
+        'region': region,
+        'account': '123456789012',
+        'detail': {
+            'eventName': 'RunInstances',
+            'eventSource': 'ec2.amazonaws.com',
+            'responseElements': {'instancesSet': {'items': [
+                {'instanceId': i} for i in instance_ids]}}}}
+
+
+def ec2_event(name, ids, time, path='requestParameters.instancesSet'):
+    key = path.endswith('resourcesSet') and 'resourceId' or 'instanceId'
+    event = {
+        'time': time,
+        'region': 'us-east-1',
+        'account': '123456789012',
+        'detail': {
+            'eventName': name,
+            'eventSource': 'ec2.amazonaws.com'}}
+    parent = event['detail']
+    for k in path.split('.'):
+        parent = parent.setdefault(k, {})
+    parent['items'] = [{key: i} for i in ids]
+    return event
+
+
+class InventoryTest(BaseTest):
+
+    # 2017-05-01T00:00:00Z
+    start = 1493596800
+
+    def get_inventory(self, events=(), **kw):
+        events_path = os.path.join(self.get_temp_dir(), 'events.json')
+        with open(events_path, 'w') as fh:
+            for e in events:
+                fh.write(json.dumps(e) + "\n")
+        inventory_dir = self.get_temp_dir()
+        return Inventory(
+            inventory_dir, events_path, clock=Clock(self.start), **kw)
+
+    def fetch(self, resources):
+        calls = []
+
+        def fetch(query):
+            calls.append(query)
+            return list(resources)
+        return calls, fetch
+
+    def test_incremental_update(self):
+        inventory = self.get_inventory([
+            run_event(['i-2'], '2017-05-01T00:30:00Z'),
+            run_event(['i-3'], '2017-05-01T00:40:00Z', region='us-west-2'),
+            run_event(['i-4'], '2017-05-01T02:00:00Z')])
+        calls, fetch = self.fetch([{'InstanceId': 'i-1'}])
+        manager = Manager(
+            [{'InstanceId': 'i-2', 'State': 'running'}])
+
+        self.assertEqual(
+            inventory.resources(manager, None, fetch),
+            [{'InstanceId': 'i-1'}])
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(os.path.exists(inventory.get_path(manager)))
+
+        inventory.clock.now += 3600
+        self.assertEqual(
+            inventory.resources(manager, None, fetch),
+            [{'InstanceId': 'i-1'}, {'InstanceId': 'i-2', 'State': 'running'}])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(manager.source.calls, [['i-2']])
+        self.assertEqual(
+            (inventory.refreshes, inventory.updates), (1, 1))
+
+        # persisted across runs
+        inventory = Inventory(
+            inventory.path, clock=Clock(self.start + 3600 * 25))
+        calls, fetch = self.fetch([])
+        self.assertEqual(inventory.resources(manager, None, fetch), [])
+        self.assertEqual(inventory.refreshes, 1)
+
+    def test_change_events(self):
+        inventory = self.get_inventory([
+            ec2_event('CreateTags', ['i-1', 'vol-1'], '2017-05-01T00:30:00Z',
+                      path='requestParameters.resourcesSet'),
+            ec2_event('StopInstances', ['i-2'], '2017-05-01T00:31:00Z'),
+            ec2_event('TerminateInstances', ['i-3'], '2017-05-01T00:32:00Z'),
+            {'time': '2017-05-01T00:33:00Z',
+             'detail': {
+                 'eventName': 'DeleteVolume',
+                 'eventSource': 'ec2.amazonaws.com',
+                 'requestParameters': {'volumeId': 'vol-1'}}}])
+        calls, fetch = self.fetch([
+            {'InstanceId': 'i-1'}, {'InstanceId': 'i-2'},
+            {'InstanceId': 'i-3'}, {'InstanceId': 'i-4'}])
+        manager = Manager([
+            {'InstanceId': 'i-1', 'Tags': [{'Key': 'App', 'Value': 'x'}]},
+            {'InstanceId': 'i-2', 'State': 'stopped'}])
+        inventory.resources(manager, None, fetch)
+        inventory.clock.now += 3600
+        self.assertEqual(
+            inventory.resources(manager, None, fetch),
+            [{'InstanceId': 'i-4'},
+             {'InstanceId': 'i-1', 'Tags': [{'Key': 'App', 'Value': 'x'}]},
+             {'InstanceId': 'i-2', 'State': 'stopped'}])
+        self.assertEqual(manager.source.calls, [['i-1', 'i-2', 'i-3']])
+
+        manager.type = 'ebs'
+        self.assertEqual(
+            inventory.get_changes(
+                manager, self.start, self.start + 3600),
+            (set(), set(['vol-1'])))
+
+    def test_deleted_resources_dropped(self):
+        inventory = self.get_inventory([
+            {'time': '2017-05-01T00:30:00Z',
+             'detail': {
+                 'eventName': 'DeleteVolume',
+                 'eventSource': 'ec2.amazonaws.com',
+                 'requestParameters': {'volumeId': 'vol-1'}}}])
+        calls, fetch = self.fetch([{'InstanceId': 'vol-1'},
+                                   {'InstanceId': 'vol-2'}])
+        manager = Manager(None)
+        manager.type = 'ebs'
+        inventory.resources(manager, None, fetch)
+        inventory.clock.now += 3600
+        # Deleted ids aren't described, which would fail.
+        self.assertEqual(
+            inventory.resources(manager, None, fetch),
+            [{'InstanceId': 'vol-2'}])
+        self.assertEqual(manager.source.calls, [])
+        self.assertEqual(inventory.updates, 1)
+
+    def test_update_failure_refreshes(self):
+        inventory = self.get_inventory([
+            run_event(['i-2'], '2017-05-01T00:30:00Z')])
+        calls, fetch = self.fetch([{'InstanceId': 'i-1'}])
+        manager = Manager(None)
+        inventory.resources(manager, None, fetch)
+        inventory.clock.now += 3600
+        inventory.resources(manager, None, fetch)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(inventory.refreshes, 2)
+
+    def test_qualified_queries_not_inventoried(self):
+        inventory = self.get_inventory()
+        calls, fetch = self.fetch([])
+        manager = Manager([])
+        inventory.resources(manager, {'Filters': [{'Name': 'x'}]}, fetch)
+        inventory.resources(manager, {'Filters': [{'Name': 'x'}]}, fetch)
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(os.path.exists(inventory.get_path(manager)))
+
+        manager.type = 'security-group'
+        inventory.resources(manager, None, fetch)
+        self.assertEqual(len(calls), 3)
+
+    def test_cloudtrail_events(self):
+        factory = self.replay_flight_data('test_inventory_cloudtrail')
+        inventory = Inventory(self.get_temp_dir(), clock=Clock(self.start))
+        manager = Manager([])
+        manager.session_factory = factory
+        self.assertEqual(
+            inventory.get_changes(manager, self.start - 60, self.start),
+            (set(['i-0f2bb8a5da2da8a12']), set()))
+
+    def test_load_events(self):
+        path = os.path.join(self.get_temp_dir(), 'events.json')
+        with open(path, 'w') as fh:
+            json.dump([run_event(['i-1'], '2017-05-01T00:00:00Z')], fh)
+        self.assertEqual(load_events(path)[0]['c7n:time'], self.start)
+
+    def test_query_manager_inventory(self):
+        p = self.load_policy({'name': 'ec2', 'resource': 'ec2'})
+        calls = []
+
+        class Recorder(object):
+            def resources(self, manager, query, fetch):
+                calls.append(manager)
+                return [{'InstanceId': 'i-1'}]
+
+        p.ctx.inventory = Recorder()
+        self.assertEqual(
+            p.resource_manager.resources(), [{'InstanceId': 'i-1'}])
+        self.assertEqual(calls, [p.resource_manager])
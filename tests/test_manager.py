@@ -53,6 +53,54 @@ class TestEC2Manager(BaseTest):
                 instance(Tags=[{"Key": "CMDBEnvironment", "Value": "xyz"}])])),
             0)
 
+    def test_filter_stream(self):
+        ec2 = self.get_manager({
+            'filters': [
+                {'tag:ASV': 'present'},
+                {'and': [{'State.Name': 'running'}]},
+                {'type': 'value', 'value_type': 'resource_count',
+                 'op': 'gte', 'value': 2},
+                {'tag:CMDBEnvironment': 'absent'}]})
+        self.assertEqual(
+            [f.streamable for f in ec2.filters], [True, True, False, True])
+
+        seen = []
+
+        def pages():
+            for tags in ([{"Key": "ASV", "Value": "xyz"}], [],
+                         [{"Key": "ASV", "Value": "abc"}]):
+                page = [instance(Tags=tags)]
+                seen.append(page)
+                yield page
+
+        results = ec2.filter_stream(pages())
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(len(results), 2)
+
+        results = ec2.filter_stream(iter([[instance(
+            Tags=[{"Key": "ASV", "Value": "xyz"}])]]))
+        self.assertEqual(results, [])
+
+    def test_filter_columnar(self):
+        applied = []
+
+        def apply_filter(f, resources, event=None):
+            applied.append(f.__class__.__name__)
+            return f.process(resources, event)
+
+        data = {'filters': [{'tag:ASV': 'xyz'}, {'State.Name': 'running'}]}
+        resources = [instance(Tags=[{"Key": "ASV", "Value": "xyz"}])]
+        ec2 = self.get_manager(data)
+        self.patch(ec2, 'apply_filter', apply_filter)
+        self.assertEqual(len(ec2.filter_resources(list(resources))), 1)
+        self.assertEqual(applied, ['ValueFilter', 'ValueFilter'])
+
+        applied[:] = []
+        ec2 = self.get_manager(dict(data, columnar=True))
+        self.patch(ec2, 'apply_filter', apply_filter)
+        self.assertEqual(len(ec2.filter_resources(list(resources))), 1)
+        self.assertEqual(applied, ['ColumnarFilters'])
+
     def test_actions(self):
         # a simple action by string
         ec2 = self.get_manager({'actions': ['mark']})
@@ -0,0 +1,208 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from datetime import datetime
+import os
+import threading
+
+import mock
+
+from c7n.filters.metrics import MetricsCache, metrics_cache
+
+from common import BaseTest, Bag
+
+
+class MetricDataStub(object):
+    """Stands in for a cloudwatch client supporting GetMetricData."""
+
+    def __init__(self, values, page_size=2):
+        self.values = values
+        self.page_size = page_size
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime,
+                        ScanBy, NextToken=None):
+        with self.lock:
+            self.calls.append(MetricDataQueries)
+        offset = int(NextToken or 0)
+        results = []
+        for q in MetricDataQueries[offset:offset + self.page_size]:
+            dimensions = q['MetricStat']['Metric']['Dimensions']
+            value = self.values.get(
+                (dimensions[0]['Value'], q['MetricStat']['Period']),
+                self.values.get(dimensions[0]['Value']))
+            results.append({
+                'Id': q['Id'],
+                'Timestamps': value is not None and [EndTime] or [],
+                'Values': value is not None and [value] or []})
+        response = {'MetricDataResults': results}
+        if offset + self.page_size < len(MetricDataQueries):
+            response['NextToken'] = str(offset + self.page_size)
+        return response
+
+
+class MetricsBatchTest(BaseTest):
+
+    def setUp(self):
+        super(MetricsBatchTest, self).setUp()
+        metrics_cache.clear()
+        self.addCleanup(metrics_cache.clear)
+        self.addCleanup(self.cleanUp)
+
+    def get_policy(self, client, config=None, **params):
+        data = {'type': 'metrics', 'name': 'CPUUtilization',
+                'days': 3, 'value': 10}
+        data.update(params)
+        return self.load_policy(
+            {'name': 'ec2-cpu', 'resource': 'ec2', 'filters': [data]},
+            config=config,
+            session_factory=lambda: Bag(client=lambda service: client))
+
+    def get_instances(self, *ids):
+        return [{'InstanceId': i, 'CpuCount': 2} for i in ids]
+
+    def test_batch_query(self):
+        client = MetricDataStub({'i-1': 5.0, 'i-2': 50.0, 'i-3': 2.0})
+        p = self.get_policy(client)
+        resources = p.resource_manager.filter_resources(
+            self.get_instances('i-1', 'i-2', 'i-3', 'i-4'))
+        self.assertEqual(
+            sorted([r['InstanceId'] for r in resources]), ['i-1', 'i-3'])
+        # four series fetched across two pages of one request
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(len(client.calls[0]), 4)
+        self.assertEqual(
+            client.calls[0][0]['MetricStat'],
+            {'Metric': {'Namespace': 'AWS/EC2',
+                        'MetricName': 'CPUUtilization',
+                        'Dimensions': [
+                            {'Name': 'InstanceId', 'Value': 'i-1'}]},
+             'Period': 259200,
+             'Stat': 'Average'})
+        datapoints = resources[0]['c7n.metrics'][
+            'AWS/EC2.CPUUtilization.Average']
+        self.assertEqual(len(datapoints), 1)
+        self.assertEqual(datapoints[0]['Average'], 5.0)
+        self.assertTrue(isinstance(datapoints[0]['Timestamp'], datetime))
+
+    def test_percent_attr(self):
+        client = MetricDataStub({'i-1': 1.0, 'i-2': 0.1})
+        p = self.get_policy(
+            client, **{'percent-attr': 'CpuCount', 'attr-multiplier': 0.5,
+                       'value': 50, 'op': 'greater-than'})
+        resources = p.resource_manager.filter_resources(
+            self.get_instances('i-1', 'i-2'))
+        self.assertEqual([r['InstanceId'] for r in resources], ['i-1'])
+
+    def test_shared_across_policies(self):
+        client = MetricDataStub({'i-1': 5.0, 'i-2': 50.0})
+        self.get_policy(client).resource_manager.filter_resources(
+            self.get_instances('i-1', 'i-2'))
+        self.assertEqual(len(client.calls), 1)
+
+        resources = self.get_policy(
+            client, op='greater-than').resource_manager.filter_resources(
+                self.get_instances('i-1', 'i-2', 'i-3'))
+        self.assertEqual([r['InstanceId'] for r in resources], ['i-2'])
+        # only the previously unseen series is queried
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(
+            [q['MetricStat']['Metric']['Dimensions'][0]['Value']
+             for q in client.calls[1]], ['i-3'])
+
+        # a different period is a different series
+        self.get_policy(client, period=3600).resource_manager.filter_resources(
+            self.get_instances('i-1'))
+        self.assertEqual(len(client.calls), 3)
+
+    def test_filters_on_distinct_periods(self):
+        client = MetricDataStub({'i-1': 5.0, ('i-1', 3600): 50.0})
+        p = self.load_policy({
+            'name': 'ec2-cpu', 'resource': 'ec2', 'filters': [
+                {'type': 'metrics', 'name': 'CPUUtilization', 'days': 3,
+                 'period': 3600, 'value': 10, 'op': 'greater-than'},
+                {'type': 'metrics', 'name': 'CPUUtilization', 'days': 3,
+                 'value': 10, 'op': 'less-than'}]},
+            session_factory=lambda: Bag(client=lambda service: client))
+        resources = p.resource_manager.filter_resources(
+            self.get_instances('i-1'))
+        self.assertEqual(len(resources), 1)
+        self.assertEqual(len(client.calls), 2)
+
+    def get_cache_config(self, **kw):
+        config = {
+            'cache': os.path.join(self.get_temp_dir(), 'c7n.cache'),
+            'cache_period': 10, 'cache_backend': 'sqlite',
+            'cache_memory_size': 0}
+        config.update(kw)
+        return config
+
+    def test_persisted_metrics(self):
+        config = self.get_cache_config(cache_metrics=True)
+        client = MetricDataStub(
+            {'i-1': 5.0, 'i-2': 6.0, 'i-3': 50.0}, page_size=5)
+        p = self.get_policy(client, config=dict(config))
+        store = p.resource_manager._cache
+        with mock.patch.object(
+                store, 'save', wraps=store.save) as save:
+            p.resource_manager.filter_resources(
+                self.get_instances('i-1', 'i-2', 'i-3'))
+        self.assertEqual(len(client.calls), 1)
+        # all the series persisted in a single write
+        self.assertEqual(save.call_count, 1)
+
+        # a later run only has the persisted series
+        metrics_cache.clear()
+        p = self.get_policy(client, config=dict(config))
+        store = p.resource_manager._cache
+        with mock.patch.object(store, 'get', wraps=store.get) as get:
+            resources = p.resource_manager.filter_resources(
+                self.get_instances('i-1', 'i-2', 'i-3'))
+        self.assertEqual(len(resources), 2)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(metrics_cache.hits, 3)
+        self.assertEqual(get.call_count, 1)
+
+    def test_persistence_opt_in(self):
+        config = self.get_cache_config()
+        client = MetricDataStub({'i-1': 5.0})
+        self.get_policy(
+            client, config=dict(config)).resource_manager.filter_resources(
+                self.get_instances('i-1'))
+        metrics_cache.clear()
+        self.get_policy(
+            client, config=dict(config)).resource_manager.filter_resources(
+                self.get_instances('i-1'))
+        self.assertEqual(len(client.calls), 2)
+
+
+class MetricsCacheTest(BaseTest):
+
+    def test_ttl(self):
+        self.assertEqual(MetricsCache.get_ttl(5), 60)
+        self.assertEqual(MetricsCache.get_ttl(300), 300)
+        self.assertEqual(MetricsCache.get_ttl(86400 * 14), 3600)
+
+    def test_expiry(self):
+        c = MetricsCache()
+        c.save(('us-east-1', 'AWS/EC2'), [{'Average': 1}])
+        self.assertEqual(
+            c.get(('us-east-1', 'AWS/EC2'), 300), [{'Average': 1}])
+        self.assertEqual(c.get(('us-west-2', 'AWS/EC2'), 300), None)
+
+        future = c.data[('us-east-1', 'AWS/EC2')][0] + 301
+        with mock.patch('c7n.filters.metrics.time.time') as now:
+            now.return_value = future
+            self.assertEqual(c.get(('us-east-1', 'AWS/EC2'), 300), None)
+        self.assertEqual((c.hits, c.misses), (1, 2))
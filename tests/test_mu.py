@@ -19,6 +19,7 @@ import os
 import platform
 import py_compile
 import shutil
+import subprocess
 import sys
 import tempfile
 import time
@@ -26,8 +27,9 @@ import unittest
 import zipfile
 
 from c7n.mu import (
-    custodian_archive, LambdaManager, PolicyLambda, PythonPackageArchive,
-    CloudWatchLogSubscription, SNSSubscription, RUNTIME)
+    custodian_archive, archive_report, policy_archive, LambdaManager,
+    PolicyLambda, PythonPackageArchive, CloudWatchLogSubscription,
+    SNSSubscription, RUNTIME)
 from c7n.policy import Policy
 from c7n.ufuncs import logsub
 from common import BaseTest, Config, event_data
@@ -472,6 +474,126 @@ class PythonArchiveTest(unittest.TestCase):
         self.assertRaises(AssertionError, self.check_readable, archive)
 
 
+# Runs a policy from an extracted archive, with only the archive's c7n
+# importable, against stubbed ec2 calls.
+ARCHIVE_RUNNER = """
+import json, os, tempfile
+import boto3
+from botocore.stub import ANY, Stubber
+import c7n
+from c7n.credentials import SessionFactory
+from c7n.handler import Config
+from c7n.policy import load
+
+session = boto3.Session(region_name='us-east-1')
+client = session.client('ec2')
+session.client = lambda *args, **kw: client
+SessionFactory.__call__ = lambda self, assume=True: session
+stubber = Stubber(client)
+stubber.add_response('describe_instances', {'Reservations': [{'Instances': [
+    {'InstanceId': 'i-1', 'State': {'Name': 'running'}, 'Tags': []},
+    {'InstanceId': 'i-2', 'State': {'Name': 'running'},
+     'Tags': [{'Key': 'Owner', 'Value': 'xyz'}]}]}]})
+stubber.add_response(
+    'create_tags', {}, {'DryRun': False, 'Resources': ['i-1'], 'Tags': ANY})
+options = Config(
+    region='us-east-1', cache='', profile=None, account_id=None,
+    assume_role=None, log_group=None, metrics_enabled=False,
+    output_dir=tempfile.mkdtemp(), cache_period=0, dryrun=False)
+with stubber:
+    for p in load(options, 'config.json', format='json'):
+        p.push({}, None)
+stubber.assert_no_pending_responses()
+print(json.dumps({'c7n': os.path.abspath(c7n.__file__)}))
+"""
+
+
+class PolicyArchiveTest(BaseTest):
+
+    def get_policy_lambda(self, resource, filters=(), actions=()):
+        p = Policy({
+            'resource': resource,
+            'name': 'archive-test',
+            'mode': {'type': 'periodic', 'schedule': 'rate(1 day)'},
+            'filters': list(filters),
+            'actions': list(actions),
+        }, Config.empty())
+        pl = PolicyLambda(p)
+        self.addCleanup(pl.archive.remove)
+        pl.get_archive()
+        return pl
+
+    def test_policy_archive_modules(self):
+        filenames = self.get_policy_lambda('sqs').archive.get_filenames()
+        self.assertTrue('c7n/handler.py' in filenames)
+        self.assertTrue('c7n/resources/sqs.py' in filenames)
+        self.assertTrue('c7n/resources/resource_map.py' in filenames)
+        # relative imports from a package's __init__
+        self.assertTrue('c7n/filters/core.py' in filenames)
+        self.assertTrue('c7n/filters/vpc.py' in filenames)
+        self.assertFalse('c7n/resources/ec2.py' in filenames)
+        self.assertTrue('ipaddress.py' in filenames)
+        self.assertEqual(
+            'c7n/resources/sqs.pyc' in filenames, RUNTIME == 'python2.7')
+
+    def test_policy_archive_references(self):
+        # resource types used via get_resource_manager are included
+        filenames = self.get_policy_lambda('ebs').archive.get_filenames()
+        self.assertTrue('c7n/resources/ec2.py' in filenames)
+        self.assertTrue('c7n/resources/ami.py' in filenames)
+        self.assertFalse('c7n/resources/sqs.py' in filenames)
+
+    def test_policy_archive_related_references(self):
+        filenames = self.get_policy_lambda('sqs').archive.get_filenames()
+        self.assertFalse('c7n/resources/vpc.py' in filenames)
+        # related resources named by a filter's base class
+        filenames = self.get_policy_lambda('ec2', [{'or': [
+            {'type': 'subnet', 'key': 'Tags', 'value': 'absent'}]}]
+        ).archive.get_filenames()
+        self.assertTrue('c7n/resources/vpc.py' in filenames)
+
+    def test_policy_archive_runs(self):
+        pl = self.get_policy_lambda('ec2', [
+            {'tag:Owner': 'absent'},
+            {'or': [
+                {'State.Name': 'running'},
+                {'type': 'marked-for-op', 'op': 'stop'}]}],
+            [{'type': 'mark-for-op', 'op': 'stop', 'days': 1}])
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        with pl.archive.get_reader() as reader:
+            reader.extractall(work_dir)
+
+        env = dict(
+            os.environ, AWS_DEFAULT_REGION='us-east-1',
+            AWS_ACCESS_KEY_ID='foo', AWS_SECRET_ACCESS_KEY='bar')
+        env.pop('PYTHONPATH', None)
+        output = subprocess.check_output(
+            [sys.executable, '-c', ARCHIVE_RUNNER], cwd=work_dir, env=env)
+        # the policy ran, tagging the matched instance, from the archive
+        self.assertEqual(
+            os.path.dirname(json.loads(
+                output.strip().splitlines()[-1])['c7n']),
+            os.path.join(os.path.realpath(work_dir), 'c7n'))
+
+    def test_plugin_resource_archive(self):
+        p = self.load_policy({'name': 'archive-test', 'resource': 'sqs'})
+        p.data['resource'] = 'custom-plugin'
+        archive = policy_archive(p)
+        self.addCleanup(archive.remove)
+        archive.close()
+        self.assertTrue(
+            'c7n/resources/ec2.py' in archive.get_filenames())
+
+    def test_archive_report(self):
+        archive = self.get_policy_lambda('sqs').archive
+        report = archive_report(archive)
+        self.assertEqual(report['size'], archive.size)
+        self.assertEqual(
+            report['files'], len(archive.get_filenames()))
+        self.assertTrue(report['import_time'] > 0)
+
+
 class PycCase(unittest.TestCase):
 
     def setUp(self):
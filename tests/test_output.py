@@ -18,13 +18,311 @@ import mock
 import unittest
 import shutil
 import os
+import threading
+import zlib
+from datetime import datetime
+
+from botocore.exceptions import ClientError
 
 from c7n.ctx import ExecutionContext
-from c7n.output import S3Output
+from c7n.executor import MainThreadExecutor
+from c7n import output
+from c7n.output import log as output_log
+from c7n.output import (
+    FSOutput, MetricsOutput, MetricsPublisher, S3Output, S3Uploader)
 
 from common import Config, Bag
 
 
+class S3Client(object):
+    """Records uploads, failing parts after fail_part."""
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.calls = []
+        self.objects = {}
+        self.parts = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, params):
+        with self.lock:
+            self.calls.append((name, params))
+
+    def put_object(self, **params):
+        self.record('put_object', params)
+        self.objects[params['Key']] = params['Body']
+
+    def create_multipart_upload(self, **params):
+        self.record('create_multipart_upload', params)
+        return {'UploadId': 'xyz'}
+
+    def upload_part(self, **params):
+        self.record('upload_part', params)
+        if self.fail_part and params['PartNumber'] >= self.fail_part:
+            raise ClientError(
+                {'Error': {'Code': 'AccessDenied'}}, 'UploadPart')
+        with self.lock:
+            self.parts[params['PartNumber']] = params['Body']
+        return {'ETag': 'etag-%d' % params['PartNumber']}
+
+    def complete_multipart_upload(self, **params):
+        self.record('complete_multipart_upload', params)
+        parts = params['MultipartUpload']['Parts']
+        self.objects[params['Key']] = "".join(
+            [self.parts[p['PartNumber']] for p in parts])
+
+    def abort_multipart_upload(self, **params):
+        self.record('abort_multipart_upload', params)
+
+
+class CloudWatchClient(object):
+
+    def __init__(self):
+        self.requests = []
+        self.published = threading.Event()
+
+    def put_metric_data(self, **params):
+        self.requests.append(params)
+        self.published.set()
+
+
+class SessionStub(object):
+
+    def __init__(self, session, account_id, region):
+        self.session = session
+        self.account_id = account_id
+        self.region = region
+
+    def __call__(self):
+        return self.session()
+
+
+class MetricsPublisherTest(unittest.TestCase):
+
+    def get_publisher(self):
+        client = CloudWatchClient()
+        publisher = MetricsPublisher()
+        # Not started, published on the test thread.
+        publisher.start = lambda: None
+        return publisher, client, lambda: Bag(client=lambda s: client)
+
+    def datum(self, name, value, minute=0, **dimensions):
+        return {'MetricName': name, 'Unit': 'Count', 'Value': value,
+                'Timestamp': datetime(2017, 5, 1, 10, minute, 30),
+                'Dimensions': [
+                    {'Name': k, 'Value': v} for k, v in dimensions.items()]}
+
+    def test_aggregate(self):
+        publisher, client, factory = self.get_publisher()
+        for v in (3, 1, 2):
+            publisher.put(factory, 'ns', self.datum(
+                'Unencrypted', v, Scope='Account', Policy='xyz'))
+        publisher.put(factory, 'ns', self.datum(
+            'Unencrypted', 5, minute=1, Scope='Account', Policy='xyz'))
+        publisher.put(factory, 'ns', self.datum(
+            'Unencrypted', 7, Scope='bucket-a', Policy='xyz'))
+        publisher.flush(wait=True)
+
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(client.requests[0]['Namespace'], 'ns')
+        data = client.requests[0]['MetricData']
+        self.assertEqual(
+            [(d['Timestamp'].minute, d['Dimensions'][1]['Value'],
+              d['StatisticValues']) for d in data],
+            [(0, 'Account', {'SampleCount': 3, 'Sum': 6,
+                             'Minimum': 1, 'Maximum': 3}),
+             (1, 'Account', {'SampleCount': 1, 'Sum': 5,
+                             'Minimum': 5, 'Maximum': 5}),
+             (0, 'bucket-a', {'SampleCount': 1, 'Sum': 7,
+                              'Minimum': 7, 'Maximum': 7})])
+        self.assertEqual(
+            data[0]['Dimensions'],
+            [{'Name': 'Policy', 'Value': 'xyz'},
+             {'Name': 'Scope', 'Value': 'Account'}])
+
+        publisher.flush(wait=True)
+        self.assertEqual(len(client.requests), 1)
+
+    def test_pack(self):
+        publisher, client, factory = self.get_publisher()
+        for i in range(45):
+            publisher.put(factory, 'ns', self.datum(
+                'Unencrypted', i, Scope='bucket-%02d' % i))
+        publisher.put(factory, 'other', self.datum('Total', 1))
+        publisher.flush(wait=True)
+        self.assertEqual(
+            sorted([(r['Namespace'], len(r['MetricData']))
+                    for r in client.requests]),
+            [('ns', 5), ('ns', 20), ('ns', 20), ('other', 1)])
+
+        # Large dimension values are packed by payload size.
+        for i in range(20):
+            dimensions = dict([('Dim%d' % n, 'x' * 250) for n in range(9)])
+            publisher.put(factory, 'ns', self.datum(
+                'Unencrypted', i, Bucket='%02d' % i, **dimensions))
+        client.requests = []
+        publisher.flush(wait=True)
+        self.assertEqual(
+            [len(r['MetricData']) for r in client.requests], [9, 9, 2])
+
+    def test_client_per_destination(self):
+        publisher, client, _ = self.get_publisher()
+        sessions = []
+
+        def session():
+            sessions.append(1)
+            return Bag(client=lambda s: client)
+
+        for i in range(3):
+            publisher.put(
+                SessionStub(session, '123', 'us-east-1'), 'ns',
+                self.datum('Total', 1))
+        publisher.flush(wait=True)
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(
+            client.requests[0]['MetricData'][0]['StatisticValues'][
+                'SampleCount'], 3)
+        self.assertEqual(len(sessions), 1)
+
+        publisher.put(
+            SessionStub(session, '123', 'us-east-1'), 'ns',
+            self.datum('Total', 1))
+        publisher.flush(wait=True)
+        self.assertEqual(len(sessions), 1)
+
+        # Expired clients are recreated, with fresh credentials.
+        publisher.client_ttl = -1
+        publisher.put(
+            SessionStub(session, '123', 'us-east-1'), 'ns',
+            self.datum('Total', 1))
+        publisher.flush(wait=True)
+        self.assertEqual(len(sessions), 2)
+        self.assertEqual(list(publisher.clients), [('123', 'us-east-1')])
+
+    def test_background_publish(self):
+        client = CloudWatchClient()
+        publisher = MetricsPublisher()
+        publisher.put(
+            lambda: Bag(client=lambda s: client), 'ns', self.datum('Total', 1))
+        self.assertTrue(publisher.thread.daemon)
+        publisher.flush()
+        self.assertTrue(client.published.wait(5))
+        self.assertEqual(len(client.requests), 1)
+
+        thread = publisher.thread
+        publisher.put(
+            lambda: Bag(client=lambda s: client), 'ns', self.datum('Total', 1))
+        publisher.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(client.requests), 2)
+
+    def test_metrics_output(self):
+        publisher, client, factory = self.get_publisher()
+        self.patch_publisher(publisher)
+        metrics = MetricsOutput(Bag(
+            session_factory=factory,
+            policy=Bag(name='xyz', resource_type='s3')))
+        metrics.put_metric('ResourceCount', 3, 'Count', Scope='Policy')
+        metrics.put_metric(
+            'ResourceCount', 5, 'Count', Scope='Policy', buffer=True)
+        self.assertEqual(client.requests, [])
+        publisher.flush(wait=True)
+        data = client.requests[0]['MetricData']
+        self.assertEqual(len(data), 1)
+        self.assertEqual(
+            data[0]['Dimensions'],
+            [{'Name': 'Policy', 'Value': 'xyz'},
+             {'Name': 'ResType', 'Value': 's3'},
+             {'Name': 'Scope', 'Value': 'Policy'}])
+        self.assertEqual(data[0]['StatisticValues']['Sum'], 8)
+
+    def patch_publisher(self, publisher):
+        p = mock.patch.object(output, 'metrics_publisher', publisher)
+        p.start()
+        self.addCleanup(p.stop)
+
+
+class S3UploaderTest(unittest.TestCase):
+
+    def get_uploader(self, client, part_size=32 * 1024):
+        uploader = S3Uploader(
+            lambda: client, 'cloud-custodian',
+            extra_args={'ServerSideEncryption': 'AES256'})
+        uploader.part_size = part_size
+        return uploader
+
+    def test_stream_small(self):
+        client = S3Client()
+        with mock.patch.object(
+                S3Uploader, 'executor_factory', MainThreadExecutor):
+            uploader = self.get_uploader(client)
+        with uploader.open('xyz/resources.json.gz') as fh:
+            fh.write('abc')
+            fh.write(u'def')
+        uploader.wait()
+        self.assertEqual(
+            [(name, p['Key'], p['ServerSideEncryption'])
+             for name, p in client.calls],
+            [('put_object', 'xyz/resources.json.gz', 'AES256')])
+        self.assertEqual(
+            zlib.decompress(
+                client.objects['xyz/resources.json.gz'], zlib.MAX_WBITS | 16),
+            'abcdef')
+
+    def test_stream_multipart(self):
+        client = S3Client()
+        uploader = self.get_uploader(client)
+        # Random data doesn't compress, so spans parts.
+        data = [os.urandom(16 * 1024) for i in range(20)]
+        with uploader.open('resources.json.gz') as fh:
+            for d in data:
+                fh.write(d)
+        uploader.wait()
+
+        names = [name for name, p in client.calls]
+        self.assertEqual(names[0], 'create_multipart_upload')
+        self.assertEqual(names[-1], 'complete_multipart_upload')
+        self.assertEqual(names.count('upload_part'), len(client.parts))
+        self.assertTrue(len(client.parts) > 5)
+        self.assertEqual(
+            client.calls[-1][1]['MultipartUpload']['Parts'][:2],
+            [{'PartNumber': 1, 'ETag': 'etag-1'},
+             {'PartNumber': 2, 'ETag': 'etag-2'}])
+        self.assertEqual(
+            zlib.decompress(
+                client.objects['resources.json.gz'], zlib.MAX_WBITS | 16),
+            "".join(data))
+
+    def test_stream_error(self):
+        client = S3Client(fail_part=2)
+        with mock.patch.object(
+                S3Uploader, 'executor_factory', MainThreadExecutor):
+            uploader = self.get_uploader(client)
+        with uploader.open('resources.json.gz') as fh:
+            for i in range(20):
+                fh.write(os.urandom(16 * 1024))
+        self.assertRaises(ClientError, uploader.wait)
+        names = [name for name, p in client.calls]
+        self.assertEqual(names[-1], 'abort_multipart_upload')
+        self.assertEqual(names.count('upload_part'), 2)
+        self.assertNotIn('complete_multipart_upload', names)
+
+    def test_stream_policy_error(self):
+        client = S3Client()
+        with mock.patch.object(
+                S3Uploader, 'executor_factory', MainThreadExecutor):
+            uploader = self.get_uploader(client)
+        with self.assertRaises(ValueError):
+            with uploader.open('resources.json.gz') as fh:
+                fh.write(os.urandom(128 * 1024))
+                raise ValueError()
+        uploader.wait()
+        self.assertEqual(
+            [name for name, p in client.calls],
+            ['create_multipart_upload', 'upload_part',
+             'abort_multipart_upload'])
+
+
 class S3OutputTest(unittest.TestCase):
 
     def test_path_join(self):
@@ -47,7 +345,7 @@ class S3OutputTest(unittest.TestCase):
                 None,
                 Bag(name="xyz"),
                 Config.empty(output_dir="s3://cloud-custodian/policies")))
-        self.addCleanup(shutil.rmtree, output.root_dir)
+        self.addCleanup(shutil.rmtree, output.root_dir, True)
 
         return output
 
@@ -98,6 +396,21 @@ class S3OutputTest(unittest.TestCase):
                 with gzip.open(os.path.join(root, f)) as fh:
                     self.assertEqual(fh.read(), 'abc')
 
+    def test_open_compressed(self):
+        output = self.get_s3_output()
+        with FSOutput.open(output, 'resources.json') as fh:
+            fh.write('abc')
+        with open(os.path.join(output.root_dir, 'foo.txt'), 'w') as fh:
+            fh.write('xyz')
+
+        output.compress()
+        self.assertEqual(
+            sorted(os.listdir(output.root_dir)),
+            ['foo.txt.gz', 'resources.json.gz'])
+        with gzip.open(
+                os.path.join(output.root_dir, 'resources.json.gz')) as fh:
+            self.assertEqual(fh.read(), 'abc')
+
     def test_upload(self):
         output = self.get_s3_output()
         self.assertEqual(output.key_prefix, "/policies/xyz")
@@ -116,6 +429,37 @@ class S3OutputTest(unittest.TestCase):
             extra_args={
                 'ServerSideEncryption': 'AES256'})
 
+    def test_exit_upload_error(self):
+        output = self.get_s3_output()
+        output.ctx.session_factory = lambda assume: Bag(client=lambda s: None)
+        output.join_log()
+        with open(os.path.join(output.root_dir, 'foo.txt'), 'w') as fh:
+            fh.write('abc')
+
+        with mock.patch('c7n.output.S3Transfer') as transfer:
+            transfer.return_value.upload_file.side_effect = ClientError(
+                {'Error': {'Code': 'AccessDenied'}}, 'PutObject')
+            with mock.patch.object(output_log, 'error') as error:
+                self.assertRaises(ClientError, output.__exit__)
+
+        self.assertFalse(os.path.exists(output.root_dir))
+        self.assertEqual(
+            sorted([c[0][2] for c in error.call_args_list]),
+            ['policies/xyz/%s/custodian-run.log.gz' % output.date_path,
+             'policies/xyz/%s/foo.txt.gz' % output.date_path])
+
+    def test_open_streamed(self):
+        output = self.get_s3_output()
+        output.uploader.client = client = S3Client()
+        with output.open('resources.json') as fh:
+            fh.write('abc')
+        output.transfer = mock.MagicMock()
+        output.upload()
+        self.assertEqual(os.listdir(output.root_dir), [])
+        self.assertEqual(
+            client.objects.keys(),
+            ['policies/xyz/%s/resources.json.gz' % output.date_path])
+
     def test_sans_prefix(self):
         output = self.get_s3_output()
 
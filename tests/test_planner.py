@@ -0,0 +1,62 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from c7n.planner import QueryPlanner
+from c7n.filters import ANNOTATION_KEY
+
+from common import BaseTest
+
+
+class QueryPlannerTest(BaseTest):
+
+    def test_plan_groups(self):
+        policies = [
+            self.load_policy({'name': 'ec2-a', 'resource': 'ec2'}),
+            self.load_policy({'name': 'ec2-b', 'resource': 'ec2'}),
+            self.load_policy({
+                'name': 'ec2-c', 'resource': 'ec2',
+                'query': [{'instance-state-name': 'running'}]}),
+            self.load_policy({'name': 'ebs-a', 'resource': 'ebs'})]
+        planner = QueryPlanner()
+        groups = planner.plan(policies)
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(
+            sorted(map(len, groups.values())), [1, 1, 2])
+        for p in policies:
+            self.assertEqual(p.ctx.planner, planner)
+
+    def test_shared_snapshot(self):
+        session_factory = self.replay_flight_data('test_query_manager')
+        policies = [
+            self.load_policy({
+                'name': 'igw-%d' % i,
+                'resource': 'internet-gateway',
+                'filters': [{'InternetGatewayId': 'igw-5bce113e'}]},
+                session_factory=session_factory)
+            for i in range(3)]
+
+        planner = QueryPlanner()
+        planner.plan(policies)
+
+        results = [p.run() for p in policies]
+        self.assertEqual(planner.fetches, 1)
+        self.assertEqual(planner.hits, 2)
+        for resources in results:
+            self.assertEqual(len(resources), 1)
+
+        # annotations made by one policy are not visible to others
+        self.assertNotIn(ANNOTATION_KEY, planner.snapshots.values()[0][0])
+        self.assertFalse(results[0][0] is results[1][0])
+
+        planner.clear()
+        self.assertEqual(planner.snapshots, {})
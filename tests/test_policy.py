@@ -13,11 +13,15 @@
 # limitations under the License.
 from datetime import datetime, timedelta
 import json
+import os
 import shutil
+import subprocess
+import sys
 import tempfile
 
 from c7n import policy, manager
 from c7n.resources.ec2 import EC2
+from c7n.resources.resource_map import ResourceMap
 from c7n.utils import dumps
 
 from common import BaseTest, Config, Bag
@@ -54,6 +58,28 @@ class DummyResource(manager.ResourceManager):
         return [_a(p1), _a(p2)]
 
 
+class ResourceMapTest(BaseTest):
+
+    def test_resource_map(self):
+        # Regenerate with tools/dev/resourcemap.py
+        self.assertEqual(set(ResourceMap), set(manager.resources.keys()))
+        for type_name, klass in manager.resources.items():
+            self.assertEqual(ResourceMap[type_name][0], klass.__module__)
+
+    def test_load_resource_types(self):
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; '
+            'from c7n.manager import resources; '
+            'resources.get("sqs"); '
+            'print(sorted(m for m in sys.modules '
+            'if m.startswith("c7n.resources.") and sys.modules[m]))'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(
+            output.strip(),
+            "['c7n.resources.resource_map', 'c7n.resources.sqs']")
+
+
 class PolicyPermissions(BaseTest):
 
     def test_policy_detail_spec_permissions(self):
@@ -83,7 +109,8 @@ class PolicyPermissions(BaseTest):
             perms,
             set(('ec2:DescribeInstances',
                  'ec2:DescribeTags',
-                 'cloudwatch:GetMetricStatistics')))
+                 'cloudwatch:GetMetricStatistics',
+                 'cloudwatch:GetMetricData')))
 
     def test_resource_permissions(self):
         self.capture_logging('c7n.cache')
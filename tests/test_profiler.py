@@ -0,0 +1,103 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+
+from c7n.profiler import CONTEXT_KEY, PolicyProfile, SessionProfiler
+from c7n.utils import Bag
+
+from common import BaseTest
+
+
+class PolicyProfileTest(BaseTest):
+
+    def test_policy_profile(self):
+        self.cleanUp()
+        self.addCleanup(self.cleanUp)
+        factory = self.replay_flight_data('test_ebs_snapshot_delete')
+        p = self.load_policy({
+            'name': 'snapshot-trim',
+            'resource': 'ebs-snapshot',
+            'filters': [
+                {'tag:InstanceId': 'not-null'}],
+            'actions': ['delete']},
+            config={'profile_policies': True},
+            session_factory=factory)
+        resources = p.run()
+        self.assertEqual(len(resources), 1)
+
+        with open(os.path.join(p.ctx.log_dir, 'profile.json')) as fh:
+            profile = json.load(fh)
+        self.assertEqual(profile['policy'], 'snapshot-trim')
+        self.assertEqual(profile['resources']['count'], 1)
+        self.assertEqual(
+            [(f['filter'], f['resources_in'], f['resources_out'])
+             for f in profile['filters']],
+            [('value', 2, 1)])
+        self.assertEqual(
+            [(a['action'], a['resources']) for a in profile['actions']],
+            [('delete', 1)])
+        self.assertEqual(
+            [(c['service'], c['operation'], c['calls'])
+             for c in profile['api_calls']],
+            [('ec2', 'DeleteSnapshot', 1),
+             ('ec2', 'DescribeImages', 1),
+             ('ec2', 'DescribeSnapshots', 1)])
+        self.assertEqual(profile['api_services']['ec2']['calls'], 3)
+
+        metrics = dict([
+            (m['MetricName'], m['Value'])
+            for d in p.ctx.metrics.data for m in d['MetricData']
+            if [dim for dim in m['Dimensions'] if dim['Name'] == 'Service']])
+        self.assertEqual(
+            metrics, {'ApiCalls': 3, 'ApiThrottles': 0, 'ApiRetries': 0})
+        self.assertEqual(PolicyProfile.get_current(), None)
+
+    def test_not_profiled(self):
+        p = self.load_policy({'name': 'ebs', 'resource': 'ebs'})
+        self.assertEqual(p.ctx.profile, None)
+
+
+class SessionProfilerTest(BaseTest):
+
+    def test_api_calls(self):
+        model = Bag(name='DescribeInstances',
+                    service_model=Bag(endpoint_prefix='ec2'))
+        profile = PolicyProfile(Bag(name='test', resource_type='ec2'))
+        handler = SessionProfiler()
+
+        context = {}
+        handler.before_parameter_build(model, context)
+        self.assertFalse(CONTEXT_KEY in context)
+
+        with profile:
+            handler.before_parameter_build(model, context)
+        handler.needs_retry(
+            (None, {'Error': {'Code': 'RequestLimitExceeded'}}),
+            model, {'context': context})
+        handler.needs_retry(None, model, {'context': context})
+        handler.after_call(
+            Bag(status_code=200),
+            {'ResponseMetadata': {'RetryAttempts': 1}}, model, context)
+
+        context = {CONTEXT_KEY: (profile, 0)}
+        handler.after_call(
+            Bag(status_code=400), {'Error': {'Code': 'Invalid'}},
+            model, context)
+
+        stats = profile.get_report()['api_calls'][0]
+        self.assertEqual(
+            (stats['calls'], stats['errors'], stats['throttles'],
+             stats['retries']),
+            (2, 1, 1, 1))
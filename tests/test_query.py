@@ -11,13 +11,25 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import gzip
+import json
 import logging
+import os
+from StringIO import StringIO
 
-from c7n.query import ResourceQuery
+import boto3
+import mock
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from c7n import query
+from c7n.query import (
+    ConfigSource, ConfigSnapshotSource, ResourceQuery, SnapshotSource)
 from c7n.resources.ec2 import EC2
 from c7n.resources.vpc import InternetGateway
+from c7n.utils import dump_records
 
-from common import BaseTest
+from common import BaseTest, Bag
 
 
 class ResourceQueryTest(BaseTest):
@@ -44,6 +56,40 @@ class ResourceQueryTest(BaseTest):
         resources = q.get(InternetGateway.resource_type, ['igw-3d9e3d56'])
         self.assertEqual(len(resources), 1)
 
+    def test_query_filter_pages_retry(self):
+        session = boto3.Session(region_name='us-east-1')
+        client = session.client('ec2')
+        session.client = lambda *args, **kw: client
+        stubber = Stubber(client)
+        stubber.add_response(
+            'describe_instances', {
+                'Reservations': [{'Instances': [{'InstanceId': 'i-1'}]}],
+                'NextToken': 'xyz'}, {})
+        stubber.add_client_error(
+            'describe_instances', 'RequestLimitExceeded',
+            expected_params={'NextToken': 'xyz'})
+        stubber.add_response(
+            'describe_instances', {
+                'Reservations': [{'Instances': [{'InstanceId': 'i-2'}]}]},
+            {'NextToken': 'xyz'})
+        retried = []
+
+        def retry(func, **params):
+            try:
+                return func(**params)
+            except ClientError:
+                retried.append(params)
+                return func(**params)
+
+        q = ResourceQuery(lambda: session)
+        with stubber, mock.patch.object(
+                query, 'local_session', lambda f: session):
+            pages = list(q.filter_pages(EC2.resource_type, retry))
+        self.assertEqual(
+            [[r['InstanceId'] for r in p] for p in pages], [['i-1'], ['i-2']])
+        # only the failed page is fetched again
+        self.assertEqual(retried, [{'NextToken': 'xyz'}])
+        stubber.assert_no_pending_responses()
 
 class QueryResourceManagerTest(BaseTest):
 
@@ -67,6 +113,19 @@ class QueryResourceManagerTest(BaseTest):
         p.run()
         self.assertTrue("Using cached internet-gateway: 3", output.getvalue())
         
+    def test_stream_resources(self):
+        session_factory = self.replay_flight_data('test_query_manager')
+        p = self.load_policy(
+            {'name': 'igw-check',
+             'resource': 'internet-gateway',
+             'stream': True,
+             'filters': [{
+                 'InternetGatewayId': 'igw-5bce113e'}]},
+            session_factory=session_factory)
+        resources = p.run()
+        self.assertEqual(len(resources), 1)
+        self.assertEqual(resources[0]['InternetGatewayId'], 'igw-5bce113e')
+
     def test_get_resources(self):
         session_factory = self.replay_flight_data('test_query_manager_get')
         p = self.load_policy(
@@ -77,6 +136,343 @@ class QueryResourceManagerTest(BaseTest):
         self.assertEqual(len(resources), 1)
         resources = p.resource_manager.get_resources(['igw-5bce113f'])
         self.assertEqual(resources, [])
-    
-             
-            
+
+
+class ConfigStub(object):
+    """A config client serving security groups from a local inventory."""
+
+    def __init__(self, count, page_size=100, batch=True):
+        self.ids = ['sg-%08d' % i for i in range(count)]
+        self.page_size = page_size
+        self.calls = []
+        operations = ['ListDiscoveredResources', 'GetResourceConfigHistory']
+        if batch:
+            operations.append('BatchGetResourceConfig')
+        self.meta = Bag(service_model=Bag(operation_names=operations))
+
+    def client(self, service_name, **kw):
+        return self
+
+    def get_item(self, resource_id):
+        return {'resourceId': resource_id,
+                'configuration': json.dumps({'groupId': resource_id})}
+
+    def get_paginator(self, operation_name):
+        return Bag(paginate=self.paginate)
+
+    def paginate(self, resourceType):
+        for idx in range(0, len(self.ids), self.page_size):
+            self.calls.append('ListDiscoveredResources')
+            yield {'resourceIdentifiers': [
+                {'resourceId': i, 'resourceType': resourceType}
+                for i in self.ids[idx:idx + self.page_size]]}
+
+    def batch_get_resource_config(self, resourceKeys):
+        self.calls.append('BatchGetResourceConfig')
+        # like the api, serve only part of a large request
+        served = resourceKeys[:60]
+        return {
+            'baseConfigurationItems': [
+                self.get_item(k['resourceId']) for k in served],
+            'unprocessedResourceKeys': resourceKeys[60:]}
+
+    def get_resource_config_history(self, resourceId, resourceType, limit):
+        self.calls.append('GetResourceConfigHistory')
+        return {'configurationItems': [self.get_item(resourceId)]}
+
+
+class ConfigSourceTest(BaseTest):
+
+    def get_source(self, stub):
+        self.cleanUp()
+        self.addCleanup(self.cleanUp)
+        p = self.load_policy(
+            {'name': 'sg-config', 'resource': 'security-group',
+             'source': 'config'},
+            session_factory=lambda: stub)
+        self.assertTrue(isinstance(p.resource_manager.source, ConfigSource))
+        return p.resource_manager.source
+
+    def test_batch_resources(self):
+        stub = ConfigStub(250, page_size=70)
+        resources = self.get_source(stub).resources()
+        self.assertEqual(
+            sorted([r['GroupId'] for r in resources]), stub.ids)
+        self.assertEqual(stub.calls.count('ListDiscoveredResources'), 4)
+        # sets of 100, 100 and 50 ids, the stub serving 60 keys a call
+        self.assertEqual(stub.calls.count('BatchGetResourceConfig'), 5)
+        self.assertFalse('GetResourceConfigHistory' in stub.calls)
+
+    def test_history_resources(self):
+        stub = ConfigStub(45, batch=False)
+        source = self.get_source(stub)
+        self.assertEqual(
+            len(list(source.resource_pages())), 3)
+        self.assertEqual(stub.calls.count('GetResourceConfigHistory'), 45)
+
+    def test_get_resources(self):
+        stub = ConfigStub(5)
+        resources = self.get_source(stub).get_resources(stub.ids[:2])
+        self.assertEqual(
+            [r['GroupId'] for r in resources], stub.ids[:2])
+
+    def test_chunk_error(self):
+        stub = ConfigStub(250)
+
+        def batch_get_resource_config(resourceKeys):
+            raise ValueError("throttled")
+        stub.batch_get_resource_config = batch_get_resource_config
+        source = self.get_source(stub)
+        self.assertRaises(ValueError, source.resources)
+
+    def test_permissions(self):
+        source = self.get_source(ConfigStub(5))
+        self.assertEqual(source.get_permissions(), [
+            'config:BatchGetResourceConfig',
+            'config:GetResourceConfigHistory',
+            'config:ListDiscoveredResources'])
+
+
+class ConfigSnapshotTest(BaseTest):
+
+    def get_item(self, resource_id, region='us-east-1', **kw):
+        item = {
+            'resourceType': 'AWS::EC2::SecurityGroup',
+            'resourceId': resource_id,
+            'awsRegion': region,
+            'awsAccountId': '123456789012',
+            'configurationItemStatus': 'OK',
+            'configuration': {'groupId': resource_id, 'groupName': 'web'}}
+        item.update(kw)
+        return item
+
+    def write_snapshot(self):
+        snapshot_dir = self.get_temp_dir()
+        with gzip.open(os.path.join(
+                snapshot_dir, 'ConfigSnapshot.json.gz'), 'wb') as fh:
+            fh.write(json.dumps({
+                'fileVersion': '1.0',
+                'configurationItems': [
+                    self.get_item('sg-1'),
+                    self.get_item('sg-2', configurationItemStatus=(
+                        'ResourceDeleted')),
+                    self.get_item('sg-3', region='us-west-2')]}))
+        with open(os.path.join(snapshot_dir, 'inventory.json'), 'w') as fh:
+            json.dump([
+                self.get_item('sg-4', configuration=json.dumps(
+                    {'groupId': 'sg-4', 'groupName': 'db'})),
+                {'resourceType': 'AWS::EC2::Instance',
+                 'resourceId': 'i-1', 'awsRegion': 'us-east-1',
+                 'tags': {'App': 'web'},
+                 'configuration': {'instanceId': 'i-1'}}], fh)
+        return snapshot_dir
+
+    def load_snapshot_policy(self, data):
+        self.addCleanup(query.config_snapshots.clear)
+        return self.load_policy(data, config={
+            'config_snapshot': self.write_snapshot(),
+            'region': 'us-east-1', 'account_id': '123456789012'})
+
+    def test_snapshot_source(self):
+        p = self.load_snapshot_policy(
+            {'name': 'sg-snapshot', 'resource': 'security-group',
+             'filters': [{'GroupName': 'db'}]})
+        self.assertTrue(
+            isinstance(p.resource_manager.source, ConfigSnapshotSource))
+        self.assertEqual(
+            [r['GroupId'] for r in p.run()], ['sg-4'])
+        self.assertEqual(
+            [r['GroupId'] for r in p.resource_manager.get_resources(
+                ['sg-1', 'sg-2', 'sg-3'])], ['sg-1'])
+
+        # types share the snapshot's index
+        m = p.resource_manager.get_resource_manager('ec2')
+        self.assertEqual(m.resources(), [
+            {'InstanceId': 'i-1', 'Tags': [{'Key': 'App', 'Value': 'web'}]}])
+        self.assertEqual(len(query.config_snapshots), 1)
+
+    def test_snapshot_not_cached(self):
+        self.addCleanup(query.config_snapshots.clear)
+        config = {
+            'config_snapshot': self.write_snapshot(),
+            'region': 'us-east-1', 'account_id': '123456789012',
+            'cache': os.path.join(self.get_temp_dir(), 'cache.db'),
+            'cache_period': 10}
+        p = self.load_policy(
+            {'name': 'sg-snapshot', 'resource': 'security-group'},
+            config=config)
+        self.assertEqual(len(p.run()), 2)
+
+        config.pop('config_snapshot')
+        live = self.load_policy(
+            {'name': 'sg-live', 'resource': 'security-group'}, config=config)
+        manager = live.resource_manager
+        self.assertEqual(manager.source_type, 'describe')
+        self.assertTrue(manager._cache.load())
+        for key in (manager.get_cache_key(None),
+                    p.resource_manager.get_cache_key(None)):
+            self.assertEqual(manager._cache.get(key), None)
+
+    def test_snapshot_describe_source(self):
+        p = self.load_snapshot_policy(
+            {'name': 'sg-describe', 'resource': 'security-group',
+             'source': 'describe'})
+        self.assertFalse(
+            isinstance(p.resource_manager.source, ConfigSnapshotSource))
+
+    def test_snapshot_location_required(self):
+        p = self.load_policy(
+            {'name': 'sg-snapshot', 'resource': 'security-group',
+             'source': 'config-snapshot'})
+        self.assertRaises(ValueError, p.resource_manager.resources)
+
+
+class S3Stub(object):
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def client(self, service_name, **kw):
+        return self
+
+    def get_paginator(self, operation_name):
+        return Bag(paginate=self.paginate)
+
+    def paginate(self, Bucket, Prefix):
+        yield {'Contents': [
+            {'Key': k} for k in sorted(self.objects) if k.startswith(Prefix)]}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': Bag(read=lambda: self.objects[Key])}
+
+
+class SnapshotSourceTest(BaseTest):
+
+    def load_snapshot_policy(self, data, location):
+        self.addCleanup(query.resource_snapshots.clear)
+        return self.load_policy(data, config={'snapshot': location})
+
+    def test_output_dir_snapshot(self):
+        output_dir = self.get_temp_dir()
+        policy = {'name': 'sg-all', 'resource': 'security-group'}
+        os.mkdir(os.path.join(output_dir, 'sg-all'))
+        with open(os.path.join(
+                output_dir, 'sg-all', 'resources.json'), 'w') as fh:
+            json.dump([{'GroupId': 'sg-1', 'GroupName': 'web'},
+                       {'GroupId': 'sg-2', 'GroupName': 'db'}], fh)
+
+        p = self.load_snapshot_policy(
+            dict(policy, filters=[{'GroupName': 'db'}]), output_dir)
+        self.assertTrue(isinstance(p.resource_manager.source, SnapshotSource))
+        self.assertEqual([r['GroupId'] for r in p.run()], ['sg-2'])
+        self.assertEqual(
+            [r['GroupId'] for r in p.resource_manager.get_resources(
+                ['sg-1'])], ['sg-1'])
+        # only the policy's own resource type is recorded
+        self.assertEqual(
+            p.resource_manager.get_resource_manager('ec2').resources(), [])
+
+        p = self.load_snapshot_policy(
+            {'name': 'sg-missing', 'resource': 'security-group'},
+            output_dir)
+        self.assertEqual(p.run(), [])
+
+    def test_run_output_snapshot(self):
+        snapshot_dir = self.get_temp_dir()
+        snapshot = os.path.join(snapshot_dir, 'sg.json')
+        with open(snapshot, 'w') as fh:
+            json.dump([{'GroupId': 'sg-1', 'GroupName': 'web'},
+                       {'GroupId': 'sg-2', 'GroupName': 'db'}], fh)
+        output_dir = self.get_temp_dir()
+        self.addCleanup(query.resource_snapshots.clear)
+        p = self.load_policy(
+            {'name': 'sg-web', 'resource': 'security-group',
+             'filters': [{'GroupName': 'web'}]},
+            config={'snapshot': snapshot, 'output_dir': output_dir},
+            output_dir=output_dir)
+        self.assertEqual(len(p.run()), 1)
+
+        # newline delimited resources.json, read back as a snapshot
+        with open(os.path.join(output_dir, 'sg-web', 'resources.json')) as fh:
+            self.assertEqual(len(fh.readlines()), 1)
+        p = self.load_snapshot_policy(
+            {'name': 'sg-web', 'resource': 'security-group'}, output_dir)
+        self.assertEqual(
+            [r['GroupId'] for r in p.run()], ['sg-1'])
+
+    def test_s3_output_snapshot(self):
+        def record(resources):
+            blob = StringIO()
+            with gzip.GzipFile(fileobj=blob, mode='wb') as fh:
+                fh.write(json.dumps(resources))
+            return blob.getvalue()
+
+        def records(resources):
+            blob = StringIO()
+            with gzip.GzipFile(fileobj=blob, mode='wb') as fh:
+                dump_records(resources, fh)
+            return blob.getvalue()
+
+        stub = S3Stub({
+            'logs/sg-all/2017/05/01/09/resources.json.gz': record(
+                [{'GroupId': 'sg-1'}]),
+            'logs/sg-all/2017/05/02/10/resources.json.gz': records(
+                [{'GroupId': 'sg-2'}, {'GroupId': 'sg-3'}]),
+            'logs/sg-all/2017/05/02/10/custodian-run.log.gz': ''})
+        self.cleanUp()
+        self.addCleanup(self.cleanUp)
+        self.addCleanup(query.resource_snapshots.clear)
+        p = self.load_policy(
+            {'name': 'sg-all', 'resource': 'security-group'},
+            config={'snapshot': 's3://bucket/logs'},
+            session_factory=lambda: stub)
+        self.assertEqual(
+            p.resource_manager.resources(),
+            [{'GroupId': 'sg-2'}, {'GroupId': 'sg-3'}])
+
+    def test_file_snapshot(self):
+        snapshot_dir = self.get_temp_dir()
+        snapshot = os.path.join(snapshot_dir, 'fleet.json.gz')
+        with gzip.open(snapshot, 'wb') as fh:
+            fh.write(json.dumps({
+                'security-group': [{'GroupId': 'sg-1', 'GroupName': 'web'}],
+                'ec2': [{'InstanceId': 'i-1'}]}))
+
+        p = self.load_snapshot_policy(
+            {'name': 'sg-web', 'resource': 'security-group',
+             'filters': [{'GroupName': 'web'}]}, snapshot)
+        resources = p.run()
+        self.assertEqual([r['GroupId'] for r in resources], ['sg-1'])
+        self.assertEqual(
+            p.resource_manager.get_resource_manager('ec2').resources(),
+            [{'InstanceId': 'i-1'}])
+
+        # annotations don't leak between runs
+        resources[0]['c7n:annotation'] = True
+        self.assertFalse(
+            'c7n:annotation' in p.resource_manager.resources()[0])
+
+    def test_snapshot_not_cached(self):
+        snapshot = os.path.join(self.get_temp_dir(), 'fleet.json')
+        with open(snapshot, 'w') as fh:
+            json.dump({'sqs': [{'QueueUrl': 'queue-from-snapshot'}]}, fh)
+        cache_config = {
+            'cache': os.path.join(self.get_temp_dir(), 'cache.db'),
+            'cache_period': 10}
+        self.addCleanup(query.resource_snapshots.clear)
+
+        p = self.load_policy(
+            {'name': 'sqs-snapshot', 'resource': 'sqs'},
+            config=dict(cache_config, snapshot=snapshot))
+        self.assertEqual(len(p.run()), 1)
+
+        live = self.load_policy(
+            {'name': 'sqs-live', 'resource': 'sqs'}, config=cache_config)
+        manager = live.resource_manager
+        self.assertNotEqual(
+            manager.get_cache_key(None),
+            p.resource_manager.get_cache_key(None))
+        self.assertTrue(manager._cache.load())
+        self.assertEqual(manager._cache.get(manager.get_cache_key(None)), None)
+        self.assertEqual(
+            manager._cache.get(p.resource_manager.get_cache_key(None)), None)
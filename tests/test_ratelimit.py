@@ -0,0 +1,186 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest import TestCase
+
+import boto3
+
+from c7n import ratelimit
+from c7n.utils import Bag
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.slept.append(duration)
+        self.now += duration
+
+
+class RateLimiterTest(TestCase):
+
+    def get_limiter(self, **kw):
+        clock = Clock()
+        return clock, ratelimit.RateLimiter(
+            clock=clock, sleep=clock.sleep, **kw)
+
+    def test_burst_then_wait(self):
+        clock, limiter = self.get_limiter(rate=2)
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.acquire(), 0.5)
+        self.assertEqual(clock.slept, [0.5])
+
+        clock.now += 10
+        # refill is capped at the bucket capacity
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.tokens, 1)
+
+    def test_adapts_to_throttling(self):
+        clock, limiter = self.get_limiter(rate=8, cooldown=1)
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4)
+        # throttles from calls already in flight are only counted
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4)
+
+        clock.now += 2
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 2)
+
+        for i in range(10):
+            limiter.on_success()
+        self.assertTrue(4 < limiter.rate < 5)
+        self.assertEqual(limiter.get_state()['throttles'], 3)
+
+    def test_uncapped_until_throttled(self):
+        clock, limiter = self.get_limiter()
+        for i in range(40):
+            self.assertEqual(limiter.acquire(), 0)
+            clock.now += 0.125
+        limiter.on_success()
+        self.assertEqual(limiter.rate, None)
+        self.assertEqual(clock.slept, [])
+
+        # Capped at half the rate seen over the last second.
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4)
+        self.assertEqual(limiter.acquire(), 0.25)
+        self.assertEqual(limiter.get_state()['requests'], 41)
+
+    def test_workers(self):
+        clock, limiter = self.get_limiter(max_workers=4)
+        self.assertEqual(limiter.get_workers(), 4)
+        for i in range(6):
+            limiter.acquire()
+        limiter.on_throttle()
+        self.assertEqual(limiter.get_workers(), 3)
+        clock.now += 2
+        limiter.on_throttle()
+        clock.now += 2
+        limiter.on_throttle()
+        self.assertEqual(limiter.get_workers(), 1)
+        for i in range(40):
+            limiter.on_success()
+        self.assertEqual(limiter.get_workers(), 4)
+        self.assertEqual(limiter.get_state()['workers'], 4)
+
+    def test_rate_bounds(self):
+        clock, limiter = self.get_limiter(rate=1, min_rate=1, max_rate=2)
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 1)
+        for i in range(10):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 2)
+
+
+class SessionLimiterTest(TestCase):
+
+    def test_registry(self):
+        registry = ratelimit.RateLimiterRegistry(rate=5)
+        limiter = registry.get('ec2', 'us-east-1', '123')
+        self.assertTrue(limiter is registry.get('ec2', 'us-east-1', '123'))
+        self.assertFalse(limiter is registry.get('ec2', 'us-west-2', '123'))
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(
+            sorted(registry.get_state()),
+            [('ec2', 'us-east-1', '123'), ('ec2', 'us-west-2', '123')])
+
+    def test_event_handlers(self):
+        registry = ratelimit.RateLimiterRegistry()
+        handler = ratelimit.SessionLimiter(registry, '123')
+        model = Bag(service_model=Bag(endpoint_prefix='ec2'))
+        context = {'client_region': 'us-east-1'}
+        limiter = registry.get('ec2', 'us-east-1', '123')
+
+        handler.before_call(model=model, context=context)
+        self.assertEqual(limiter.requests, 1)
+
+        handler.after_call(
+            http_response=Bag(status_code=200), model=model,
+            context=context)
+        self.assertEqual(limiter.rate, None)
+
+        handler.needs_retry(
+            response=(Bag(status_code=503), {
+                'Error': {'Code': 'RequestLimitExceeded'}}),
+            operation=model, request_dict={'context': context})
+        self.assertEqual(limiter.throttles, 1)
+        self.assertEqual(limiter.rate, limiter.min_rate)
+
+        handler.after_call(
+            http_response=Bag(status_code=200), model=model,
+            context=context)
+        self.assertTrue(limiter.rate > limiter.min_rate)
+
+        handler.needs_retry(
+            response=None, operation=model, request_dict={'context': context})
+        self.assertEqual(limiter.throttles, 1)
+
+    def test_limit_session(self):
+        registry = ratelimit.RateLimiterRegistry()
+        session = ratelimit.limit_session(
+            boto3.Session(region_name='us-east-1'), '123', registry)
+        client = session.client('ec2')
+        client.meta.events.register(
+            'before-call.ec2.DescribeRegions',
+            lambda **kw: (Bag(status_code=200), {'Regions': []}))
+        client.describe_regions()
+        self.assertEqual(
+            registry.get_state()[('ec2', 'us-east-1', '123')]['requests'], 1)
+
+    def test_get_workers(self):
+        registry = ratelimit.RateLimiterRegistry(max_workers=5)
+        factory = Bag(region='us-west-2', account_id='123')
+        self.assertEqual(
+            ratelimit.get_workers(factory, 'elasticloadbalancing', registry),
+            5)
+        limiter = registry.get('elasticloadbalancing', 'us-west-2', '123')
+        limiter.acquire()
+        limiter.acquire()
+        limiter.on_throttle()
+        self.assertEqual(
+            ratelimit.get_workers(factory, 'elasticloadbalancing', registry),
+            1)
+        self.assertEqual(
+            ratelimit.get_workers(lambda: None, 'rds', registry), 5)
+
+    def test_limit_session_non_boto(self):
+        session = Bag()
+        self.assertTrue(ratelimit.limit_session(session) is session)
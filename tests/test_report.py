@@ -11,12 +11,17 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
 
 from dateutil.parser import parse as date_parse
 
 from c7n.policy import Policy
-from c7n.reports.csvout import Formatter
+from c7n.reports.csvout import Formatter, fs_record_set
+from c7n.utils import dump_records, dumps
 from common import Config, load_data
 
 
@@ -91,6 +96,32 @@ class TestEC2Report(unittest.TestCase):
         self.assertEqual(formatter.to_csv(recs), rows)
 
 
+class TestRecordSet(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.records = load_data('report.json')['ec2']['records'].values()
+
+    def test_fs_record_set(self):
+        with open(os.path.join(self.output_dir, 'resources.json'), 'w') as fh:
+            fh.write(dumps(self.records, indent=2))
+        records = fs_record_set(self.output_dir, 'report-test-ec2')
+        self.assertEqual(
+            [r['InstanceId'] for r in records],
+            [r['InstanceId'] for r in self.records])
+
+    def test_fs_record_set_compressed(self):
+        with gzip.open(os.path.join(
+                self.output_dir, 'resources.json.gz'), 'wb') as fh:
+            dump_records(self.records, fh)
+        records = fs_record_set(self.output_dir, 'report-test-ec2')
+        self.assertEqual(
+            [r['InstanceId'] for r in records],
+            [r['InstanceId'] for r in self.records])
+        self.assertTrue(all(['CustodianDate' in r for r in records]))
+
+
 class TestASGReport(unittest.TestCase):
     def setUp(self):
         data = load_data('report.json')
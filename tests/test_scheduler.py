@@ -0,0 +1,173 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import Counter
+import logging
+import threading
+import time
+import unittest
+
+import mock
+
+from c7n import ratelimit
+from c7n.output import PolicyLogFilter
+from c7n.scheduler import PolicyScheduler, run_policies
+
+from common import Bag
+
+
+class FakePolicy(object):
+
+    lock = threading.Lock()
+
+    def __init__(self, name, service, tracker, error=False):
+        self.name = name
+        self.data = {'name': name, 'resource': service}
+        self.options = Bag(region='us-east-1')
+        self.region = None
+        self.resource_type = service
+        self.resource_manager = Bag(
+            get_model=lambda: Bag(service=service))
+        self.tracker = tracker
+        self.error = error
+
+    def __call__(self):
+        with self.lock:
+            self.tracker['active'][self.resource_type] += 1
+            self.tracker['peak'][self.resource_type] = max(
+                self.tracker['peak'][self.resource_type],
+                self.tracker['active'][self.resource_type])
+        time.sleep(0.05)
+        with self.lock:
+            self.tracker['active'][self.resource_type] -= 1
+        if self.error:
+            raise ValueError(self.name)
+        return []
+
+
+class PolicySchedulerTest(unittest.TestCase):
+
+    def get_policies(self):
+        tracker = {'active': Counter(), 'peak': Counter()}
+        policies = [FakePolicy('ec2-%d' % i, 'ec2', tracker)
+                    for i in range(4)]
+        policies.extend([FakePolicy('s3-%d' % i, 's3', tracker)
+                         for i in range(4)])
+        return tracker, policies
+
+    def test_service_concurrency(self):
+        tracker, policies = self.get_policies()
+        scheduler = PolicyScheduler(workers=6, service_concurrency=3)
+        self.assertEqual(scheduler.run(policies), [])
+        self.assertEqual(tracker['peak']['ec2'], 3)
+        self.assertEqual(tracker['peak']['s3'], 3)
+
+    def test_service_concurrency_from_limiter(self):
+        registry = ratelimit.RateLimiterRegistry(max_workers=3)
+        self.addCleanup(setattr, ratelimit, 'limiters', ratelimit.limiters)
+        ratelimit.limiters = registry
+        limiter = registry.get('ec2', None, None)
+        limiter.acquire()
+        limiter.on_throttle()
+
+        tracker, policies = self.get_policies()
+        scheduler = PolicyScheduler(workers=6)
+        self.assertEqual(scheduler.run(policies), [])
+        self.assertEqual(tracker['peak']['ec2'], 1)
+        self.assertEqual(tracker['peak']['s3'], 3)
+        self.assertEqual(
+            scheduler.get_service(FakePolicy('elb', 'elb', tracker)),
+            'elasticloadbalancing')
+
+    def test_failures(self):
+        tracker, policies = self.get_policies()
+        policies.append(FakePolicy('bad', 'sqs', tracker, error=True))
+        scheduler = PolicyScheduler(workers=4)
+        failures = scheduler.run(policies)
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0].name, 'bad')
+
+    def test_debug(self):
+        tracker, policies = self.get_policies()
+        policies.append(FakePolicy('bad', 'sqs', tracker, error=True))
+        scheduler = PolicyScheduler(workers=4, debug=True)
+        self.assertRaises(ValueError, scheduler.run, policies)
+
+    def test_process_units(self):
+        tracker, policies = self.get_policies()
+        policies[1].data['query'] = [{'instance-state-name': 'running'}]
+        scheduler = PolicyScheduler(workers=4, executor='process')
+        self.assertEqual(
+            [[p.name for p in unit] for unit in scheduler.get_units(policies)],
+            [['ec2-0', 'ec2-2', 'ec2-3'], ['ec2-1'],
+             ['s3-0', 's3-1', 's3-2', 's3-3']])
+        self.assertEqual(
+            len(PolicyScheduler(workers=4).get_units(policies)), 8)
+
+    def test_run_policies(self):
+        tracker, policies = self.get_policies()
+        policies[2].error = True
+        by_name = dict([(p.name, p) for p in policies[:3]])
+        planners = set()
+
+        def build(data, options):
+            p = by_name[data['name']]
+            p.ctx = Bag()
+            return p
+
+        with mock.patch('c7n.policy.Policy', side_effect=build):
+            failures = run_policies(
+                [(p.data, p.options) for p in policies[:3]])
+        for p in policies[:3]:
+            planners.add(id(p.ctx.planner))
+        self.assertEqual(len(planners), 1)
+        self.assertEqual(failures, [('ec2-2', 'ec2-2')])
+
+    def test_main_executor(self):
+        tracker, policies = self.get_policies()
+        scheduler = PolicyScheduler(workers=2, executor='main')
+        self.assertEqual(scheduler.run(policies), [])
+        self.assertEqual(tracker['peak']['ec2'], 1)
+
+
+class PolicyLogFilterTest(unittest.TestCase):
+
+    def test_isolation(self):
+        filters = []
+
+        def join():
+            f = PolicyLogFilter()
+            f.join()
+            filters.append(f)
+
+        t = threading.Thread(target=join)
+        t.start()
+        t.join()
+        other = filters.pop()
+        self.addCleanup(other.leave)
+
+        f = PolicyLogFilter()
+        f.join()
+        self.addCleanup(f.leave)
+
+        def record(thread_id):
+            r = logging.LogRecord(
+                'custodian.policy', logging.INFO, __file__, 1,
+                'msg', (), None)
+            r.thread = thread_id
+            return r
+
+        self.assertTrue(f.filter(record(f.thread_id)))
+        self.assertFalse(f.filter(record(other.thread_id)))
+        # unattributed pool worker threads
+        self.assertTrue(f.filter(record(-1)))
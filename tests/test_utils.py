@@ -11,11 +11,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from cStringIO import StringIO
+from datetime import datetime
+import gzip
 import json
 import unittest
 import tempfile
 import time
 
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import ipaddress
 
@@ -208,6 +212,33 @@ class UtilTest(unittest.TestCase):
             json.loads(utils.format_event(event)),
             json.loads(event_json))
 
+    def test_records(self):
+        records = [{'InstanceId': 'i-1', 'LaunchTime': datetime(2017, 5, 1)},
+                   {'InstanceId': 'i-2', 'Tags': [{'Key': 'a', 'Value': 'b'}]}]
+        output = StringIO()
+        utils.dump_records(records, output)
+        contents = output.getvalue()
+        self.assertEqual(len(contents.splitlines()), 2)
+        expected = json.loads(utils.dumps(records))
+        self.assertEqual(utils.load_records(contents), expected)
+
+        # gzipped
+        blob = StringIO()
+        with gzip.GzipFile(fileobj=blob, mode='wb') as fh:
+            utils.dump_records(records, fh)
+        self.assertEqual(utils.load_records(blob.getvalue()), expected)
+
+        # json lists, as written by earlier versions
+        self.assertEqual(
+            utils.load_records(utils.dumps(records, indent=2)), expected)
+        self.assertEqual(
+            utils.load_records(utils.dumps(records[:1])), expected[:1])
+
+        output = StringIO()
+        utils.dump_records(records[:1], output)
+        self.assertEqual(utils.load_records(output.getvalue()), expected[:1])
+        self.assertEqual(utils.load_records(''), [])
+
     def test_date_time_decoder(self):
         dtdec = utils.DateTimeEncoder()
         self.assertRaises(TypeError, dtdec.default, 'test')
@@ -264,3 +295,70 @@ class UtilTest(unittest.TestCase):
         delattr(FakeResource, 'schema')
         ret = utils.reformat_schema(FakeResource)
         self.assertIsInstance(ret, str)
+
+
+class TagMapTest(unittest.TestCase):
+
+    def test_tag_map(self):
+        r = {'Tags': [
+            {'Key': 'Name', 'Value': 'web'},
+            {'Key': 'OffHours', 'Value': 'off=(M-F,18)'}]}
+        self.assertEqual(utils.get_tag_map({}), {})
+        self.assertEqual(
+            utils.get_tag_map(r), {'Name': 'web', 'OffHours': 'off=(M-F,18)'})
+        self.assertTrue(isinstance(r['Tags'], utils.TagList))
+        self.assertEqual(
+            utils.get_tag_map(r, lower=True),
+            {'name': 'web', 'offhours': 'off=(M-F,18)'})
+        # the map is built once and shared
+        self.assertTrue(utils.get_tag_map(r) is utils.get_tag_map(r))
+
+    def test_tag_map_invalidate(self):
+        r = {'Tags': [{'Key': 'Name', 'Value': 'web'}]}
+        self.assertEqual(utils.get_tag_map(r), {'Name': 'web'})
+        r['Tags'].append({'Key': 'Env', 'Value': 'dev'})
+        self.assertEqual(utils.get_tag_map(r), {'Name': 'web', 'Env': 'dev'})
+        del r['Tags'][0]
+        self.assertEqual(utils.get_tag_map(r), {'Env': 'dev'})
+
+    def test_tag_list_serialization(self):
+        r = {'Tags': [{'Key': 'Name', 'Value': 'web'}]}
+        utils.get_tag_map(r)
+        self.assertEqual(
+            json.loads(utils.dumps(r)),
+            {'Tags': [{'Key': 'Name', 'Value': 'web'}]})
+
+
+class ClientPoolTest(BaseTest):
+
+    def test_client_pool(self):
+        self.addCleanup(self.cleanUp)
+        created = []
+
+        class Session(object):
+            region_name = 'us-east-1'
+
+            def client(self, service_name, **kw):
+                created.append((service_name, kw))
+                return object()
+
+        session = utils.local_session(Session)
+        self.assertEqual(session.region_name, 'us-east-1')
+        self.assertTrue(session.client('ec2') is session.client('ec2'))
+        self.assertFalse(session.client('ec2') is session.client('ebs'))
+        self.assertTrue(
+            session.client('s3', region_name='us-west-2', config=Config(
+                read_timeout=200)) is
+            session.client('s3', region_name='us-west-2', config=Config(
+                read_timeout=200)))
+        self.assertEqual(len(created), 3)
+
+        # explicit credentials are never shared
+        session.client('ec2', aws_access_key_id='xyz')
+        session.client('ec2', aws_access_key_id='xyz')
+        self.assertEqual(len(created), 5)
+
+        # a new session gets new clients
+        self.cleanUp()
+        utils.local_session(Session).client('ec2')
+        self.assertEqual(len(created), 6)
@@ -25,6 +25,8 @@ import zipfile
 
 import boto3
 
+from c7n import ratelimit
+
 
 class ZippedPill(pill.Pill):
 
@@ -156,6 +158,12 @@ class PillTest(unittest.TestCase):
     def cleanUp(self):
         pass
 
+    def serialize_calls(self):
+        # Flight data is recorded and replayed in call order, so api
+        # calls are made one at a time.
+        self.addCleanup(setattr, ratelimit, 'limiters', ratelimit.limiters)
+        ratelimit.limiters = ratelimit.RateLimiterRegistry(max_workers=1)
+
     def record_flight_data(self, test_case, zdata=False):
         if not zdata:
             test_dir = os.path.join(self.placebo_dir, test_case)
@@ -173,6 +181,7 @@ class PillTest(unittest.TestCase):
         pill.record()
         self.addCleanup(pill.stop)
         self.addCleanup(self.cleanUp)
+        self.serialize_calls()
 
         def factory(region=None, assume=None):
             if region and region != default_region:
@@ -202,4 +211,5 @@ class PillTest(unittest.TestCase):
         pill.playback()
         self.addCleanup(pill.stop)
         self.addCleanup(self.cleanUp)
+        self.serialize_calls()
         return lambda region=None, assume=None: session
@@ -0,0 +1,75 @@
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Generate c7n/resources/resource_map.py
+
+Maps each resource type to the modules that need importing to fully
+register it, its own module first, followed by any other resource
+modules registering filters or actions on it. Rerun after adding or
+moving resource types.
+"""
+import os
+
+import c7n
+from c7n.manager import resources
+from c7n.resources import load_resources
+
+header = '''\
+# Copyright 2016 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Generated by tools/dev/resourcemap.py, do not edit.
+#
+'''
+
+
+def get_resource_modules(resource_type):
+    modules = []
+    for registry in (
+            resource_type.filter_registry, resource_type.action_registry):
+        for _, klass in registry.items():
+            if (klass.__module__.startswith('c7n.resources.') and
+                    klass.__module__ != resource_type.__module__):
+                modules.append(klass.__module__)
+    return [resource_type.__module__] + sorted(set(modules))
+
+
+def main():
+    load_resources()
+    lines = [header, 'ResourceMap = {']
+    for type_name, resource_type in sorted(resources.items()):
+        if not resource_type.__module__.startswith('c7n.resources.'):
+            continue
+        lines.append('    "%s": (%s),' % (type_name, ''.join(
+            ['"%s",' % m for m in get_resource_modules(resource_type)])))
+    lines.append('}\n')
+
+    path = os.path.join(
+        os.path.dirname(c7n.__file__), 'resources', 'resource_map.py')
+    with open(path, 'w') as fh:
+        fh.write('\n'.join(lines))
+
+
+if __name__ == '__main__':
+    main()